@@ -21,23 +21,33 @@ logger = logging.getLogger(name=__name__)
 # only show errors or warnings until userdefine log level is set up
 logger.setLevel(logging.INFO)
 
-# enable ipython QtGui support if needed
-try:
-    from IPython import get_ipython
-    IPYTHON = get_ipython()
-    IPYTHON.magic("gui qt")
-except BaseException as e:
-    logger.debug('Could not enable IPython gui support: %s.' % e)
+# headless mode for scripts without display (environment variable
+# PYRPL_HEADLESS=1): no QApplication and no IPython gui integration, the
+# widget modules are only imported when a widget is created, and the
+# asynchronous tasks run in a plain asyncio event loop
+import os
+headless = os.environ.get('PYRPL_HEADLESS', '').lower() in ['1', 'true',
+                                                           'yes']
 
-# get QApplication instance
-from qtpy import QtCore, QtWidgets
-APP = QtWidgets.QApplication.instance()
-if APP is None:
-    logger.debug('Creating new QApplication instance "pyrpl"')
-    APP = QtWidgets.QApplication(['pyrpl'])
+if headless:
+    APP = None
+else:
+    # enable ipython QtGui support if needed
+    try:
+        from IPython import get_ipython
+        IPYTHON = get_ipython()
+        IPYTHON.magic("gui qt")
+    except BaseException as e:
+        logger.debug('Could not enable IPython gui support: %s.' % e)
+
+    # get QApplication instance
+    from qtpy import QtCore, QtWidgets
+    APP = QtWidgets.QApplication.instance()
+    if APP is None:
+        logger.debug('Creating new QApplication instance "pyrpl"')
+        APP = QtWidgets.QApplication(['pyrpl'])
 
 # get user directories
-import os
 try:  # first try from environment variable
     user_dir = os.environ["PYRPL_USER_DIR"]
 except KeyError:  # otherwise, try ~/pyrpl_user_dir (where ~ is the user's home dir)
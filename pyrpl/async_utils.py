@@ -32,50 +32,261 @@ the background loop
 # Finally this file provide a sleep() function that waits for the execution of
 # sleep_async and that should be used in place of time.sleep.
 
+The event loop is provided by a pluggable backend, selected with the
+environment variable PYRPL_LOOP_BACKEND or set_backend():
+ * 'qt': quamash loop integrated into the Qt event loop (default),
+ * 'asyncio': plain asyncio loop that runs while wait() blocks (default in
+              headless mode),
+ * 'thread': plain asyncio loop running in a dedicated thread, such that
+             tasks continue in the background and ensure_future, wait, sleep
+             and Event.set can be called from any other thread,
+ * 'uvloop': same as 'thread', with a uvloop event loop if uvloop is
+             installed.
 """
 import logging
-from qtpy import QtCore, QtWidgets
 import asyncio
 from asyncio import Future, iscoroutine
-import quamash
+import concurrent.futures
+import functools
+import os
 import sys
+import threading
+from . import headless
 
 
 logger = logging.getLogger(name=__name__)
 
-# enable ipython QtGui support if needed
-try:
-    from IPython import get_ipython
-    IPYTHON = get_ipython()
-    IPYTHON.magic("gui qt")
-except BaseException as e:
-    logger.debug('Could not enable IPython gui support: %s.' % e)
 
-APP = QtWidgets.QApplication.instance()
-if APP is None:
-    # logger.debug('Creating new QApplication instance "pyrpl"')
-    APP = QtWidgets.QApplication(['pyrpl'])
+def _loop_kwargs(loop):
+    """ the loop argument of asyncio functions, removed in python 3.10 """
+    if sys.version_info < (3, 10):
+        return dict(loop=loop)
+    return dict()
 
 
-LOOP = quamash.QEventLoop() # Since tasks scheduled in this loop seem to
-# fall in the standard QEventLoop, and we never explicitly ask to run this
-# loop, it might seem useless to send all tasks to LOOP, however, a task
-# scheduled in the default loop seem to never get executed with IPython
-# kernel integration.
+class QtLoopBackend(object):
+    """
+    Tasks run in a quamash loop integrated into the Qt event loop, wait()
+    executes a nested QEventLoop.
+    """
+    threaded = False
+
+    def __init__(self):
+        from qtpy import QtCore, QtWidgets
+        import quamash
+        self._QtCore = QtCore
+
+        # enable ipython QtGui support if needed
+        try:
+            from IPython import get_ipython
+            IPYTHON = get_ipython()
+            IPYTHON.magic("gui qt")
+        except BaseException as e:
+            logger.debug('Could not enable IPython gui support: %s.' % e)
+
+        self.app = QtWidgets.QApplication.instance()
+        if self.app is None:
+            # logger.debug('Creating new QApplication instance "pyrpl"')
+            self.app = QtWidgets.QApplication(['pyrpl'])
+
+        self.loop = quamash.QEventLoop() # Since tasks scheduled in this loop
+        # seem to fall in the standard QEventLoop, and we never explicitly ask
+        # to run this loop, it might seem useless to send all tasks to LOOP,
+        # however, a task scheduled in the default loop seem to never get
+        # executed with IPython kernel integration.
+
+    def ensure_future(self, coroutine):
+        return asyncio.ensure_future(coroutine, loop=self.loop)
+
+    def wait(self, future, timeout=None):
+        """ returns the sets (done, pending) of asyncio.wait """
+        new_future = self.ensure_future(
+            asyncio.wait({future}, timeout=timeout,
+                         **_loop_kwargs(self.loop)))
+        #if sys.version>='3.7': # this way, it was not possible to execute
+                                # wait behind a qt slot !!!
+        #    LOOP.run_until_complete(new_future)
+        #    done, pending = new_future.result()
+        #else:
+        loop = self._QtCore.QEventLoop()
+        def quit(*args):
+            loop.quit()
+        new_future.add_done_callback(quit)
+        loop.exec_()
+        return new_future.result()
+
+    def call_threadsafe(self, function, *args):
+        function(*args)
+
+
+class AsyncioLoopBackend(object):
+    """
+    Tasks run in a plain asyncio loop that is only executed while wait()
+    blocks, i.e. without Qt and without any additional thread.
+    """
+    threaded = False
+
+    def __init__(self, loop_factory=asyncio.new_event_loop):
+        self.app = None
+        self.loop = loop_factory()
+        asyncio.set_event_loop(self.loop)
+
+    def ensure_future(self, coroutine):
+        return asyncio.ensure_future(coroutine, loop=self.loop)
+
+    def wait(self, future, timeout=None):
+        """ returns the sets (done, pending) of asyncio.wait """
+        future = self.ensure_future(future)
+        return self.loop.run_until_complete(
+            asyncio.wait({future}, timeout=timeout,
+                         **_loop_kwargs(self.loop)))
+
+    def call_threadsafe(self, function, *args):
+        function(*args)
+
+
+class ThreadsafeTask(asyncio.Task):
+    """
+    Task of the ThreadLoopBackend that can be cancelled from another thread
+    """
+    def cancel(self, *args):
+        loop = self.get_loop()
+        if _loop_thread.get(loop) is threading.current_thread():
+            return super(ThreadsafeTask, self).cancel(*args)
+        if self.done():
+            return False
+        loop.call_soon_threadsafe(functools.partial(
+            super(ThreadsafeTask, self).cancel, *args))
+        return True
+
+
+_loop_thread = dict()  # loop -> thread that runs the loop
+
+
+class ThreadLoopBackend(object):
+    """
+    Tasks run in a plain asyncio loop running forever in a dedicated daemon
+    thread. ensure_future, wait, sleep and Event.set may be called from any
+    other thread, but wait and sleep must not be called from the loop
+    thread, i.e. within a coroutine or a signal emitted by a coroutine.
+
+    If a QApplication exists, wait processes its events while waiting, and
+    signals emitted by the tasks are delivered to the widgets through the
+    Qt event queue.
+    """
+    threaded = True
+
+    def __init__(self, loop_factory=asyncio.new_event_loop):
+        self.app = None
+        if not headless:
+            from qtpy import QtWidgets
+            self.app = QtWidgets.QApplication.instance()
+        self.loop = loop_factory()
+        self.loop.set_task_factory(
+            lambda loop, coro: ThreadsafeTask(coro, loop=loop))
+        self._thread = threading.Thread(target=self._run,
+                                        name="pyrpl event loop")
+        self._thread.daemon = True
+        _loop_thread[self.loop] = self._thread
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self._thread
+
+    def ensure_future(self, coroutine):
+        if self.in_loop_thread():
+            return asyncio.ensure_future(coroutine, loop=self.loop)
+        if isinstance(coroutine, Future):
+            return coroutine
+        async def create_task():
+            return asyncio.ensure_future(coroutine, loop=self.loop)
+        # the task is created in the loop thread and returned immediately
+        return asyncio.run_coroutine_threadsafe(create_task(),
+                                                self.loop).result()
+
+    def wait(self, future, timeout=None):
+        """ returns the sets (done, pending) of asyncio.wait """
+        if self.in_loop_thread():
+            raise RuntimeError("wait() and sleep() cannot be called from the "
+                               "event loop thread, use await instead.")
+        future = self.ensure_future(future)
+        waiter = asyncio.run_coroutine_threadsafe(
+            asyncio.wait({future}, timeout=timeout,
+                         **_loop_kwargs(self.loop)), self.loop)
+        if self.app is not None:
+            # keep the gui responsive
+            while not waiter.done():
+                self.app.processEvents()
+                concurrent.futures.wait([waiter], timeout=0.005)
+        return waiter.result()
+
+    def call_threadsafe(self, function, *args):
+        if self.in_loop_thread():
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def stop(self):
+        """ stops the loop thread """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def _uvloop_backend():
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop is not installed, using a standard asyncio "
+                       "event loop instead.")
+        return ThreadLoopBackend()
+    return ThreadLoopBackend(loop_factory=uvloop.new_event_loop)
+
+
+# constructors of the available backends, by name
+BACKENDS = dict(qt=QtLoopBackend,
+                asyncio=AsyncioLoopBackend,
+                thread=ThreadLoopBackend,
+                uvloop=_uvloop_backend)
+
+
+def set_backend(backend):
+    """
+    Selects the backend that provides the event loop. backend is either
+    the name of a backend in BACKENDS or a backend object. Tasks scheduled
+    in the loop of the previous backend are not transferred.
+    """
+    global BACKEND, APP, LOOP
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+    BACKEND = backend
+    APP = backend.app
+    LOOP = backend.loop
+    return backend
+
+
+BACKEND = APP = LOOP = None
+set_backend(os.environ.get('PYRPL_LOOP_BACKEND',
+                           'asyncio' if headless else 'qt'))
+
 
 async def sleep_async(time_s):
     """
     Replaces asyncio.sleep(time_s) inside coroutines. Deals properly with
     IPython kernel integration.
     """
-    await asyncio.sleep(time_s, loop=LOOP)
+    await asyncio.sleep(time_s, **_loop_kwargs(LOOP))
 
 def ensure_future(coroutine):
     """
     Schedules the task described by the coroutine. Deals properly with
     IPython kernel integration.
     """
-    return asyncio.ensure_future(coroutine, loop=LOOP)
+    return BACKEND.ensure_future(coroutine)
 
 def wait(future, timeout=None):
     """
@@ -90,20 +301,8 @@ def wait(future, timeout=None):
     BEWARE: never use wait in a coroutine (use builtin await instead)
     """
     assert isinstance(future, Future) or iscoroutine(future)
-    new_future = ensure_future(asyncio.wait({future},
-                                            timeout=timeout,
-                                            loop=LOOP))
-    #if sys.version>='3.7': # this way, it was not possible to execute wait
-                            # behind a qt slot !!!
-    #    LOOP.run_until_complete(new_future)
-    #    done, pending = new_future.result()
-    #else:
-    loop = QtCore.QEventLoop()
-    def quit(*args):
-        loop.quit()
-    new_future.add_done_callback(quit)
-    loop.exec_()
-    done, pending = new_future.result()
+    future = ensure_future(future)
+    done, pending = BACKEND.wait(future, timeout=timeout)
     if future in done:
         return future.result()
     else:
@@ -138,4 +337,7 @@ class Event(asyncio.Event):
     """
 
     def __init__(self):
-        super(Event, self).__init__(loop=LOOP)
\ No newline at end of file
+        super(Event, self).__init__(**_loop_kwargs(LOOP))
+
+    def set(self):
+        BACKEND.call_threadsafe(super(Event, self).set)
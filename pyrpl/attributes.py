@@ -17,21 +17,31 @@ behind the scene, and they are coded in this file.
 from __future__ import division
 from functools import partial
 from .pyrpl_utils import recursive_getattr, recursive_setattr
-from .widgets.attribute_widgets import BoolAttributeWidget, \
-                                       FloatAttributeWidget, \
-                                       FilterAttributeWidget, \
-                                       IntAttributeWidget, \
-                                       SelectAttributeWidget, \
-                                       StringAttributeWidget, \
-                                       BoolIgnoreAttributeWidget, \
-                                       TextAttributeWidget, \
-                                       CurveAttributeWidget, \
-                                       DataAttributeWidget, \
-                                       CurveSelectAttributeWidget, \
-                                       LedAttributeWidget, \
-                                       PlotAttributeWidget, \
-                                       BasePropertyListPropertyWidget, \
-                                       ComplexAttributeWidget
+from .widgets import widget_class
+BoolAttributeWidget = widget_class('attribute_widgets', 'BoolAttributeWidget')
+FloatAttributeWidget = widget_class('attribute_widgets',
+                                    'FloatAttributeWidget')
+FilterAttributeWidget = widget_class('attribute_widgets',
+                                     'FilterAttributeWidget')
+IntAttributeWidget = widget_class('attribute_widgets', 'IntAttributeWidget')
+SelectAttributeWidget = widget_class('attribute_widgets',
+                                     'SelectAttributeWidget')
+StringAttributeWidget = widget_class('attribute_widgets',
+                                     'StringAttributeWidget')
+BoolIgnoreAttributeWidget = widget_class('attribute_widgets',
+                                         'BoolIgnoreAttributeWidget')
+TextAttributeWidget = widget_class('attribute_widgets', 'TextAttributeWidget')
+CurveAttributeWidget = widget_class('attribute_widgets',
+                                    'CurveAttributeWidget')
+DataAttributeWidget = widget_class('attribute_widgets', 'DataAttributeWidget')
+CurveSelectAttributeWidget = widget_class('attribute_widgets',
+                                          'CurveSelectAttributeWidget')
+LedAttributeWidget = widget_class('attribute_widgets', 'LedAttributeWidget')
+PlotAttributeWidget = widget_class('attribute_widgets', 'PlotAttributeWidget')
+BasePropertyListPropertyWidget = widget_class('attribute_widgets',
+                                              'BasePropertyListPropertyWidget')
+ComplexAttributeWidget = widget_class('attribute_widgets',
+                                      'ComplexAttributeWidget')
 
 from .curvedb import CurveDB
 from collections import OrderedDict
@@ -77,17 +87,31 @@ class BaseProperty(BaseAttribute):
     _widget_class = None
     widget = None
     default = None
+    volatile = False
+    strobe = False
 
     def __init__(self,
                  default=None,
                  doc="",
                  ignore_errors=False,
-                 call_setup=False):
+                 call_setup=False,
+                 volatile=None,
+                 strobe=None):
         """
         default: if provided, the value is initialized to it
+        volatile: if True, the value may change without being set from
+        python (e.g. status registers), such that it is never served from a
+        cache of previously written values
+        strobe: if True, writing the register acts on the FPGA at the time
+        of the write (e.g. resets or arming), such that the write is never
+        merged with other writes of a transaction
         """
         if default is not None:
             self.default = default
+        if volatile is not None:
+            self.volatile = volatile
+        if strobe is not None:
+            self.strobe = strobe
         self.call_setup = call_setup
         self.ignore_errors = ignore_errors
         self.__doc__ = doc
@@ -214,10 +238,11 @@ class BaseRegister(BaseProperty):
         Retrieves the value that is physically on the redpitaya device.
         """
         # self.parent = obj  # store obj in memory
+        value = obj._read(self.address, volatile=self.volatile)
         if self.bitmask is None:
-            return self.to_python(obj, obj._read(self.address))
+            return self.to_python(obj, value)
         else:
-            return self.to_python(obj, obj._read(self.address) & self.bitmask)
+            return self.to_python(obj, value & self.bitmask)
 
     def set_value(self, obj, val):
         """
@@ -226,9 +251,9 @@ class BaseRegister(BaseProperty):
         if self.bitmask is None:
             obj._write(self.address, self.from_python(obj, val))
         else:
-            act = obj._read(self.address)
-            new = act & (~self.bitmask) | (int(self.from_python(obj, val)) & self.bitmask)
-            obj._write(self.address, new)
+            obj._write_masked(self.address,
+                              int(self.from_python(obj, val)),
+                              self.bitmask)
 
     def __set__(self, obj, value):
         """
@@ -238,7 +263,14 @@ class BaseRegister(BaseProperty):
         order to save one read operation.
         """
         value = self.validate_and_normalize(obj, value)
-        self.set_value(obj, value)
+        if self.strobe:
+            # send the pending writes of a transaction before and the strobe
+            # right away, such that the FPGA sees them in program order
+            obj._rp._transaction.flush()
+            self.set_value(obj, value)
+            obj._rp._transaction.flush()
+        else:
+            self.set_value(obj, value)
         # save new value in config, lauch signal and possibly call setup()
         self.value_updated(obj, value)
 
@@ -310,6 +342,20 @@ class BoolRegister(BaseRegister, BoolProperty):
             towrite = obj._read(self.address) & (~(1 << self.bit))
         return towrite
 
+    def _bit(self, obj):
+        """ the bit number in the register that holds the value """
+        return self.bit
+
+    def set_value(self, obj, val):
+        """
+        Sets the bit on the redpitaya device without modifying the other
+        bits of the register.
+        """
+        if self.invert:
+            val = not val
+        bit = self._bit(obj)
+        obj._write_masked(self.address, int(bool(val)) << bit, 1 << bit)
+
 
 class BoolIgnoreProperty(BoolProperty):
     """
@@ -336,6 +382,7 @@ class BoolIgnoreProperty(BoolProperty):
 class IORegister(BoolRegister):
     """Interface for digital outputs
     if argument outputmode is True, output mode is set, else input mode"""
+    volatile = True  # the pin state may change in input mode
     def __init__(self, read_address, write_address, direction_address,
                  outputmode=True, **kwargs):
         self.write_address = write_address
@@ -356,11 +403,9 @@ class IORegister(BoolRegister):
         else:
             self.outputmode = v
         self.address = self.write_address if v else self.read_address
-        if v:
-            v = obj._read(self.direction_address) | (1 << self.bit)
-        else:
-            v = obj._read(self.direction_address) & (~(1 << self.bit))
-        obj._write(self.direction_address, v)
+        obj._write_masked(self.direction_address,
+                          int(bool(v)) << self.bit,
+                          1 << self.bit)
 
     def get_value(self, obj):
         self.direction(obj)
@@ -465,7 +510,7 @@ class ConstantIntRegister(IntRegister):
 class LongRegister(IntRegister):
     """Interface for register of python type int/long with arbitrary length 'bits' (effectively unsigned)"""
     def get_value(self, obj):
-        values = obj._reads(self.address, self.size)
+        values = obj._reads(self.address, self.size, volatile=self.volatile)
         value = int(0)
         for i in range(self.size):
             value += int(values[i]) << (32 * i)
@@ -477,16 +522,14 @@ class LongRegister(IntRegister):
     def set_value(self, obj, val):
         val = self.from_python(obj, val)
         values = np.zeros(self.size, dtype=np.uint32)
+        for i in range(self.size):
+            values[i] = (val >> (32 * i)) & 0xFFFFFFFF
         if self.bitmask is None:
-            for i in range(self.size):
-                values[i] = (val >> (32 * i)) & 0xFFFFFFFF
+            obj._writes(self.address, values)
         else:
-            act = obj._reads(self.address, self.size)
-            for i in range(self.size):
-                localbitmask = (self.bitmask >> 32 * i) & 0xFFFFFFFF
-                values[i] = ((val >> (32 * i)) & localbitmask) | \
-                            (int(act[i]) & (~localbitmask))
-        obj._writes(self.address, values)
+            masks = [(self.bitmask >> (32 * i)) & 0xFFFFFFFF
+                     for i in range(self.size)]
+            obj._writes_masked(self.address, values, masks)
 
 
 class FloatProperty(NumberProperty):
@@ -28,7 +28,6 @@
 # otherwise you can custimize here what is to be done to your data
 #
 import numpy as np
-import pandas as pd
 import os
 import logging
 import pickle as file_backend
@@ -79,6 +78,7 @@ except:
             Series(y, index=x) or x, y.
             kwds will be passed to self.params
             """
+            import pandas as pd  # slow import, only when needed
             if len(args) == 0:
                 ser = (np.array([], dtype=np.float), np.array([], dtype=np.float))
             if len(args) == 1:
@@ -108,6 +108,7 @@ except:
             return obj
 
         def plot(self):
+            import pandas as pd  # slow import, only when needed
             x, y = self.data
             pd.Series(y, index=x).plot()
 
@@ -127,7 +128,7 @@ except:
                     curve = CurveDB()
                     curve._pk, curve.params, data = file_backend.load(f)
                     curve.data = tuple([np.asarray(a) for a in data])
-                if isinstance(curve.data, pd.Series):  # for backwards compatibility
+                if type(curve.data).__name__ == 'Series':  # for backwards compatibility
                     x, y = curve.data.index.values, curve.data.values
                     curve.data = (x, y)
                 return curve
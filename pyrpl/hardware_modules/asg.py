@@ -24,7 +24,8 @@ from collections import OrderedDict
 from ..attributes import BoolRegister, FloatRegister, SelectRegister, SelectProperty, \
                              IntRegister, LongRegister, PhaseRegister, FrequencyRegister, FloatProperty
 from ..modules import HardwareModule, SignalModule
-from ..widgets.module_widgets import AsgWidget
+from ..widgets import widget_class
+AsgWidget = widget_class('module_widgets', 'AsgWidget')
 from . import all_output_directs, dsp_addr_base
 
 
@@ -171,7 +172,8 @@ def make_asg(channel=0):
         on = BoolRegister(0x0, 7 + _BIT_OFFSET, doc='turns the output on or off', invert=True)
 
         # register set_a_rst
-        sm_reset = BoolRegister(0x0, 6 + _BIT_OFFSET, doc='resets the state machine')
+        sm_reset = BoolRegister(0x0, 6 + _BIT_OFFSET, strobe=True,
+                                doc='resets the state machine')
 
         # register set_a/b_once
         # deprecated since redpitaya v0.94
@@ -333,10 +335,11 @@ def make_asg(channel=0):
 
         # advanced trigger - alpha version functionality
         scopetriggerphase = PhaseRegister(0x114 + _VALUE_OFFSET, bits=14,
+                                          volatile=True,
                                           doc="phase of ASG ch1 at the moment when the last scope "
                                               "trigger occured [degrees]")
 
-        advanced_trigger_reset = BoolRegister(0x0, 9 + _BIT_OFFSET,
+        advanced_trigger_reset = BoolRegister(0x0, 9 + _BIT_OFFSET, strobe=True,
                                               doc='resets the fgen advanced trigger')
         advanced_trigger_autorearm = BoolRegister(0x0, 11 + _BIT_OFFSET,
                                                   doc='autorearm the fgen advanced trigger after a trigger event? If False, trigger needs to be reset with a sequence advanced_trigger_reset=True...advanced_trigger_reset=False after each trigger event.')
@@ -163,6 +163,9 @@ class PauseRegister(BoolRegister):
             towrite = obj._read(self.address) & (~(1 << bit))
         return towrite
 
+    def _bit(self, obj):
+        return obj._number
+
 
 class DspModule(HardwareModule, SignalModule):
     """
@@ -225,11 +228,13 @@ class DspModule(HardwareModule, SignalModule):
                                    doc="selects to which analog output the "
                                        "module signal is sent directly")
 
-    out1_saturated = BoolRegister(0x8, 0, doc="True if out1 is saturated")
+    out1_saturated = BoolRegister(0x8, 0, volatile=True,
+                                  doc="True if out1 is saturated")
 
-    out2_saturated = BoolRegister(0x8, 1, doc="True if out2 is saturated")
+    out2_saturated = BoolRegister(0x8, 1, volatile=True,
+                                  doc="True if out2 is saturated")
 
-    _sync = IntRegister(0xC,
+    _sync = IntRegister(0xC, strobe=True,
                         doc="Allows to synchronize different dsp modules. "
                             "Each DSP module is represented by the bit at "
                             "the index module._number. Setting the bits of the "
@@ -278,6 +283,7 @@ class DspModule(HardwareModule, SignalModule):
     current_output_signal = FloatRegister(0x10,
                                           bits=14,
                                           norm=2 ** 13 - 1,
+                                          volatile=True,
                                           doc="current value of output_signal "
                                               "as returned by the sampler "
                                               "module")
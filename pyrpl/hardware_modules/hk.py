@@ -1,6 +1,7 @@
 from ..attributes import IntRegister, SelectRegister, IORegister, BoolProperty
 from ..modules import HardwareModule
-from ..widgets.module_widgets.hk_widget import HkWidget
+from ..widgets import widget_class
+HkWidget = widget_class('module_widgets.hk_widget', 'HkWidget')
 import numpy as np
 
 
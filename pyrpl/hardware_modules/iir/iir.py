@@ -4,12 +4,12 @@ from ...attributes import IntRegister, BoolRegister, ComplexProperty, \
     FloatProperty, StringProperty, CurveSelectProperty, \
     GainRegister, ConstantIntRegister, FloatAttributeListProperty, \
     ComplexAttributeListProperty, BoolProperty, SelectProperty
-from ...widgets.module_widgets import IirWidget
+from ...widgets import widget_class
+IirWidget = widget_class('module_widgets', 'IirWidget')
 from ...modules import SignalLauncher
 
 import numpy as np
 from qtpy import QtCore
-from scipy.signal import freqz
 
 
 class SignalLauncherIir(SignalLauncher):
@@ -282,7 +282,7 @@ class IIR(FilterModule):
                          call_setup=True
                          )
 
-    overflow_bitfield = IntRegister(0x108,
+    overflow_bitfield = IntRegister(0x108, volatile=True,
                                     doc="Bitmask for various overflow conditions")
 
     overflow = OverflowProperty(doc="a string indicating the overflow status "
@@ -811,6 +811,7 @@ class IIR(FilterModule):
         plot_experiment is True, superimpose the measured transfer functions
         (using the networkanalyzer)"""
         freqs = np.logspace(1, 7, 1001)
+        from scipy.signal import freqz  # slow import, only when needed
         z_all = np.zeros(len(freqs), dtype=complex)
         axes = None
         tfs = []
@@ -17,7 +17,6 @@
 ###############################################################################
 
 
-import scipy.signal as sig
 import numpy as np
 import logging
 from ...errors import ExpectedPyrplError
@@ -56,6 +55,7 @@ def sos2zpk(sos):
     -----
     .. versionadded:: 0.16.0
     """
+    import scipy.signal as sig  # slow import, only when needed
     sos = np.asarray(sos)
     n_sections = sos.shape[0]
     z = np.empty(n_sections*2, np.complex128)
@@ -137,6 +137,7 @@ def freqz_(sys, w, dt=8e-9):
     -------
     np.array(..., dtype=np.complex) with the response
     """
+    import scipy.signal as sig  # slow import, only when needed
     z, p, k = sys
     b, a = sig.zpk2tf(z, p, k)
     _, h = sig.freqz(b, a, worN=w*dt)
@@ -1025,6 +1026,7 @@ class IirFilter(object):
         -------
         np.array(..., dtype=np.complex)
         """
+        import scipy.signal as sig  # slow import, only when needed
         if frequencies is None:
             frequencies = self.frequencies
         frequencies = np.asarray(frequencies, dtype=np.float64)
@@ -197,7 +197,8 @@ import numpy as np
 from ..attributes import BoolRegister, FloatRegister, SelectRegister, \
     IntRegister, PhaseRegister, FrequencyRegister, FloatProperty, \
     FilterRegister, FilterProperty, GainRegister
-from ..widgets.module_widgets import IqWidget
+from ..widgets import widget_class
+IqWidget = widget_class('module_widgets', 'IqWidget')
 from ..pyrpl_utils import sorted_dict
 
 from . import FilterModule
@@ -282,11 +283,11 @@ class Iq(FilterModule):
     def bandwidths(self):
         return self._valid_bandwidths(self)
 
-    on = BoolRegister(0x100, 0,
+    on = BoolRegister(0x100, 0, strobe=True,
                       doc="If set to False, turns off the module, e.g. to \
                       re-synchronize the phases")
 
-    pfd_on = BoolRegister(0x100, 1,
+    pfd_on = BoolRegister(0x100, 1, strobe=True,
                           doc="If True: Turns on the PFD module,\
                         if False: turns it off and resets integral")
 
@@ -331,6 +332,7 @@ class Iq(FilterModule):
     _SHIFTBITS = 8  # Register(0x218)
 
     pfd_integral = FloatRegister(0x150, bits=_SIGNALBITS, norm=_SIGNALBITS,
+                                 volatile=True,
                                  doc="value of the pfd integral [volts]")
 
     # for the phase to have the right sign, it must be inverted
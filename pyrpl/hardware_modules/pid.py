@@ -140,11 +140,13 @@ do what they are supposed to.
 
 import numpy as np
 from qtpy import QtCore
+from .. import headless
 from ..attributes import FloatProperty, BoolRegister, FloatRegister, GainRegister, SelectRegister
 from .dsp import PauseRegister
 from ..modules import SignalLauncher
 from . import FilterModule
-from ..widgets.module_widgets import PidWidget
+from ..widgets import widget_class
+PidWidget = widget_class('module_widgets', 'PidWidget')
 from ..pyrpl_utils import sorted_dict
 
 class IValAttribute(FloatProperty):
@@ -174,7 +176,8 @@ class SignalLauncherPid(SignalLauncher):
         self.timer_ival.setInterval(1000)  # max. refresh rate: 1 Hz
         self.timer_ival.timeout.connect(self.update_ival)
         self.timer_ival.setSingleShot(False)
-        self.timer_ival.start()
+        if not headless:  # the timer only refreshes the widget
+            self.timer_ival.start()
 
     def _clear(self):
         """
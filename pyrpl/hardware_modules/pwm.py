@@ -1,5 +1,6 @@
 from . import DspModule
-from ..widgets.module_widgets import PwmWidget
+from ..widgets import widget_class
+PwmWidget = widget_class('module_widgets', 'PwmWidget')
 
 
 class Pwm(DspModule):
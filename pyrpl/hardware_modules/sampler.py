@@ -4,6 +4,13 @@ from ..attributes import FloatRegister
 from ..modules import HardwareModule
 from . import DSP_INPUTS
 
+# one record of the result of Sampler.stats_many()
+STATS_RESULT_DTYPE = np.dtype([('mean', np.float64),
+                               ('stddev', np.float64),
+                               ('max', np.float64),
+                               ('min', np.float64),
+                               ('count', np.uint32)])
+
 
 class Sampler(HardwareModule):
     """ this module provides a sample of each signal.
@@ -28,34 +35,88 @@ class Sampler(HardwareModule):
         mean, stddev, max, min: mean and standard deviation of all samples
 
         """
-        try:  # signal can be a string, or a module (whose name is the name of the signal we'll use)
-            signal = signal.name
-        except AttributeError:
-            pass
+        record = self.stats_many([signal], t=t)[0]
+        return float(record['mean']), float(record['stddev']), \
+            float(record['max']), float(record['min'])
+
+    def stats_many(self, signals, t=1e-2):
+        """
+        computes the mean, standard deviation, min and max of several
+        signals simultaneously over the same duration t
+
+        Parameters
+        ----------
+        signals: list of input signals (strings or modules)
+        t: duration over which to average
+
+        Returns
+        -------
+        numpy structured array of dtype STATS_RESULT_DTYPE with one record
+        (fields 'mean', 'stddev', 'max', 'min', 'count') per signal, in the
+        order of signals
+        """
+        names = []
+        for signal in signals:
+            try:  # signal can be a string, or a module (whose name is the name of the signal we'll use)
+                signal = signal.name
+            except AttributeError:
+                pass
+            names.append(signal)
+        registers = [getattr(Sampler, name) for name in names]
+        result = np.zeros(len(registers), dtype=STATS_RESULT_DTYPE)
+        if not registers:
+            return result
+        if self._client.server_version < 2:
+            # servers before version 2 do not know the statistics request
+            for i, record in enumerate(self._sample_on_host(names, t)):
+                result[i] = self._stats_from_record(record, 1.0) \
+                            + (record['count'],)
+            return result
+        # the sampling of all signals is done by the server on the board
+        # within a single sampling window
+        records = self._client.reads_stats(
+            [self._addr_base + register.address for register in registers],
+            duration=t)
+        for i, (record, register) in enumerate(zip(records, registers)):
+            result[i] = self._stats_from_record(record, register.norm) \
+                        + (record['count'],)
+        return result
+
+    def _sample_on_host(self, signals, t):
+        """
+        reads the signals repeatedly over duration t and returns one
+        statistics record (a dict with the keys of a raw record) per signal
+        """
         nn = 0
-        cum = 0
-        cumsq = 0
-        max = -np.inf
-        min = np.inf
+        cum = np.zeros(len(signals))
+        cumsq = np.zeros(len(signals))
+        max = np.full(len(signals), -np.inf)
+        min = np.full(len(signals), np.inf)
         t0 = time()  # get start time
         while nn == 0 or time() < t0 + t:  # do at least one sample
             nn += 1
-            value = self.__getattribute__(signal)
-            cum += value
-            cumsq += (value ** 2.0)
-            if value > max:
-                max = value
-            if value < min:
-                min = value
-        nn = float(nn)
-        mean = cum / nn
-        variance = (cumsq / nn - mean**2.0)
+            values = np.array([self.__getattribute__(signal)
+                               for signal in signals])
+            cum += values
+            cumsq += values ** 2.0
+            max = np.maximum(max, values)
+            min = np.minimum(min, values)
+        return [dict(count=nn, sum=cum[i], sumsq=cumsq[i], max=max[i],
+                     min=min[i]) for i in range(len(signals))]
+
+    @staticmethod
+    def _stats_from_record(record, norm):
+        """ converts a raw statistics record into mean, stddev, max, min """
+        nn = float(max(record['count'], 1))
+        mean = record['sum'] / nn
+        variance = (record['sumsq'] / nn - mean**2.0)
         # while mathematically nonsense, this can happen numerically
         if variance < 0:
             # this means the variance is tiny and can be assumed zero
             variance = 0
         stddev = variance ** 0.5
-        return mean, stddev, max, min
+        return float(mean / norm), float(stddev / norm), \
+            float(record['max'] / norm), float(record['min'] / norm)
 
     def mean_stddev(self, signal="in1", t=1e-2):
         """
@@ -87,4 +148,5 @@ for inp, num in DSP_INPUTS.items():
                 0x10 + num * 0x10000,
                 bits=14,
                 norm=2 ** 13 - 1,
+                volatile=True,
                 doc="current value of " + inp))
@@ -128,7 +128,8 @@ from ..pyrpl_utils import sorted_dict
 from ..attributes import *
 from ..modules import HardwareModule
 from ..pyrpl_utils import time
-from ..widgets.module_widgets import ScopeWidget
+from ..widgets import widget_class
+ScopeWidget = widget_class('module_widgets', 'ScopeWidget')
 
 logger = logging.getLogger(name=__name__)
 
@@ -254,13 +255,15 @@ class Scope(HardwareModule, AcquisitionModule):
                                  ignore_errors=True,
                                  doc="selects the input signal of the module")
 
-    _reset_writestate_machine = BoolRegister(0x0, 1,
+    _reset_writestate_machine = BoolRegister(0x0, 1, volatile=True,
+                                             strobe=True,
                                              doc="Set to True to reset "
                                                  "writestate machine. "
                                                  "Automatically goes back "
                                                  "to false.")
 
-    _trigger_armed = BoolRegister(0x0, 0, doc="Set to True to arm trigger")
+    _trigger_armed = BoolRegister(0x0, 0, volatile=True, strobe=True,
+                                  doc="Set to True to arm trigger")
 
     _trigger_sources = sorted_dict({"off": 0,
                                     "immediately": 1,
@@ -277,7 +280,9 @@ class Scope(HardwareModule, AcquisitionModule):
 
     trigger_sources = _trigger_sources.keys()  # help for the user
 
+    # the FPGA sets the trigger source back to 'off' once it has triggered
     _trigger_source_register = SelectRegister(0x4, doc="Trigger source",
+                                              volatile=True, strobe=True,
                                               options=_trigger_sources)
 
     trigger_source = SelectProperty(default='immediately',
@@ -364,24 +369,27 @@ class Scope(HardwareModule, AcquisitionModule):
                                       "trigger_delay is ignored.",
                                   call_setup=True)
 
-    _trigger_delay_running = BoolRegister(0x0, 2,
+    _trigger_delay_running = BoolRegister(0x0, 2, volatile=True,
                                           doc="trigger delay running ("
                                               "register adc_dly_do)")
 
-    _adc_we_keep = BoolRegister(0x0, 3,
+    _adc_we_keep = BoolRegister(0x0, 3, strobe=True,
                                 doc="Scope resets trigger automatically ("
                                     "adc_we_keep)")
 
-    _adc_we_cnt = IntRegister(0x2C, doc="Number of samles that have passed "
+    _adc_we_cnt = IntRegister(0x2C, volatile=True,
+                              doc="Number of samles that have passed "
                                         "since trigger was armed (adc_we_cnt)")
 
     current_timestamp = LongRegister(0x15C,
                                      bits=64,
+                                     volatile=True,
                                      doc="An absolute counter "
                                          + "for the time [cycles]")
 
     trigger_timestamp = LongRegister(0x164,
                                      bits=64,
+                                     volatile=True,
                                      doc="An absolute counter "
                                          + "for the trigger time [cycles]")
 
@@ -408,11 +416,11 @@ class Scope(HardwareModule, AcquisitionModule):
 
     duration = DurationProperty(options=durations)
 
-    _write_pointer_current = IntRegister(0x18,
+    _write_pointer_current = IntRegister(0x18, volatile=True,
                                          doc="current write pointer "
                                              "position [samples]")
 
-    _write_pointer_trigger = IntRegister(0x1C,
+    _write_pointer_trigger = IntRegister(0x1C, volatile=True,
                                          doc="write pointer when trigger "
                                              "arrived [samples]")
 
@@ -422,25 +430,25 @@ class Scope(HardwareModule, AcquisitionModule):
 
     # equalization filter not implemented here
 
-    voltage_in1 = FloatRegister(0x154, bits=14, norm=2 ** 13,
+    voltage_in1 = FloatRegister(0x154, bits=14, norm=2 ** 13, volatile=True,
                                 doc="in1 current value [volts]")
 
-    voltage_in2 = FloatRegister(0x158, bits=14, norm=2 ** 13,
+    voltage_in2 = FloatRegister(0x158, bits=14, norm=2 ** 13, volatile=True,
                                 doc="in2 current value [volts]")
 
-    voltage_out1 = FloatRegister(0x164, bits=14, norm=2 ** 13,
+    voltage_out1 = FloatRegister(0x164, bits=14, norm=2 ** 13, volatile=True,
                                  doc="out1 current value [volts]")
 
-    voltage_out2 = FloatRegister(0x168, bits=14, norm=2 ** 13,
+    voltage_out2 = FloatRegister(0x168, bits=14, norm=2 ** 13, volatile=True,
                                  doc="out2 current value [volts]")
 
-    ch1_firstpoint = FloatRegister(0x10000, bits=14, norm=2 ** 13,
+    ch1_firstpoint = FloatRegister(0x10000, bits=14, norm=2 ** 13, volatile=True,
                                    doc="1 sample of ch1 data [volts]")
 
-    ch2_firstpoint = FloatRegister(0x20000, bits=14, norm=2 ** 13,
+    ch2_firstpoint = FloatRegister(0x20000, bits=14, norm=2 ** 13, volatile=True,
                                    doc="1 sample of ch2 data [volts]")
 
-    pretrig_ok = BoolRegister(0x16c, 0,
+    pretrig_ok = BoolRegister(0x16c, 0, volatile=True,
                               doc="True if enough data have been acquired "
                                   "to fill the pretrig buffer")
 
@@ -474,20 +482,12 @@ class Scope(HardwareModule, AcquisitionModule):
     @property
     def _rawdata_ch1(self):
         """raw data from ch1"""
-        # return np.array([self.to_pyint(v) for v in self._reads(0x10000,
-        # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x10000, self.data_length), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._reads_int16(0x10000, self.data_length)
 
     @property
     def _rawdata_ch2(self):
         """raw data from ch2"""
-        # return np.array([self.to_pyint(v) for v in self._reads(0x20000,
-        # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x20000, self.data_length), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._reads_int16(0x20000, self.data_length)
 
     @property
     def _data_ch1(self):
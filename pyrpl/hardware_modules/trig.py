@@ -28,7 +28,8 @@ class Trig(FilterModule):
                          #"trigger_armed"]
     _gui_attributes = _setup_attributes
 
-    armed = BoolRegister(0x100, 0, doc="Set to True to arm trigger")
+    armed = BoolRegister(0x100, 0, volatile=True, strobe=True,
+                         doc="Set to True to arm trigger")
 
     auto_rearm = BoolRegister(0x104, 0, doc="Automatically re-arm trigger?")
 
@@ -59,11 +60,13 @@ class Trig(FilterModule):
 
     current_timestamp = LongRegister(0x15C,
                                      bits=64,
+                                     volatile=True,
                                      doc="An absolute counter "
                                          + "for the time [cycles]")
 
     trigger_timestamp = LongRegister(0x164,
                                      bits=64,
+                                     volatile=True,
                                      doc="An absolute counter "
                                          + "for the trigger time [cycles]")
 
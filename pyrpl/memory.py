@@ -16,14 +16,16 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###############################################################################
 
+import copy
 import os
+import threading
 from collections import OrderedDict
 from shutil import copyfile
 import numpy as np
 import time
 from qtpy import QtCore
-from . import default_config_dir, user_config_dir
-from .pyrpl_utils import time
+from . import default_config_dir, user_config_dir, headless
+from .pyrpl_utils import time, ThreadTimer
 
 import logging
 logger = logging.getLogger(name=__name__)
@@ -242,7 +244,8 @@ class MemoryBranch(object):
     def _data(self, value):
         logger.warning("You are directly modifying the data of MemoryBranch"
                        " %s to %s.", self._fullbranchname, str(value))
-        self._parent._data[self._branch] = value
+        with self._root._lock:
+            self._parent._data[self._branch] = value
 
     def _keys(self):
         if isinstance(self._data, list):
@@ -253,7 +256,8 @@ class MemoryBranch(object):
     def _update(self, new_dict):
         if isinstance(self._data, list):
             raise NotImplementedError
-        self._data.update(new_dict)
+        with self._root._lock:
+            self._data.update(new_dict)
         self._save()
         # keep auto_completion up to date
         for k in new_dict:
@@ -331,18 +335,20 @@ class MemoryBranch(object):
         """
         helper function to manage setting list entries that do not exist
         """
-        if isinstance(self._data, list) and item == len(self._data):
-            self._data.append(value)
-        else:
-            # trivial case: _data is dict or item within list length
-            # and we can simply set the entry
-            self._data[item] = value
+        with self._root._lock:
+            if isinstance(self._data, list) and item == len(self._data):
+                self._data.append(value)
+            else:
+                # trivial case: _data is dict or item within list length
+                # and we can simply set the entry
+                self._data[item] = value
 
     def _pop(self, name):
         """
         remove an item from the branch
         """
-        value = self._data.pop(name)
+        with self._root._lock:
+            value = self._data.pop(name)
         if name in self.__dict__.keys():
             self.__dict__.pop(name)
         self._save()
@@ -362,7 +368,8 @@ class MemoryBranch(object):
         if isinstance(name, int):
             if name == 0 and len(self) == 0:
                 # instantiate a new list - odd way because we must
-                self._parent._data[self._branch] = []
+                with self._root._lock:
+                    self._parent._data[self._branch] = []
             # if index <= len, creation is done automatically if needed
             # otherwise an error is raised
             if name >= len(self):
@@ -425,7 +432,8 @@ class MemoryBranch(object):
         :return: None
         """
         branch = load(yml_content)
-        self._parent._data[self._branch] = branch
+        with self._root._lock:
+            self._parent._data[self._branch] = branch
         self._save()
 
     def __len__(self):
@@ -495,6 +503,10 @@ class MemoryTree(MemoryBranch):
         # this is the principal cause of slowing down the code (typ. 30-200 ms)
         # for immediate saving, call _save_now, for immediate loading _load_now
         self._loadsavedeadtime = _loadsavedeadtime
+        # the data is written to file in a background thread in headless
+        # mode, while the writers modify it in the main thread
+        self._lock = threading.RLock()
+        self._file_lock = threading.Lock()
         # first, make sure filename exists
         self._filename = get_config_file(filename, source)
         if filename is None:
@@ -503,10 +515,14 @@ class MemoryTree(MemoryBranch):
             self._data = OrderedDict()
         self._lastsave = time()
         # create a timer to postpone to frequent savings
-        self._savetimer = QtCore.QTimer()
-        self._savetimer.setInterval(self._loadsavedeadtime*1000)
-        self._savetimer.setSingleShot(True)
-        self._savetimer.timeout.connect(self._write_to_file)
+        if headless:  # no Qt event loop
+            self._savetimer = ThreadTimer(self._loadsavedeadtime,
+                                          self._write_to_file)
+        else:
+            self._savetimer = QtCore.QTimer()
+            self._savetimer.setInterval(self._loadsavedeadtime*1000)
+            self._savetimer.setSingleShot(True)
+            self._savetimer.timeout.connect(self._write_to_file)
         self._load()
 
         self._save_counter = 0 # cntr for unittest and debug purposes
@@ -529,14 +545,14 @@ class MemoryTree(MemoryBranch):
         logger.debug("Loading config file %s", self._filename)
         # read file from disc
         with open(self._filename) as f:
-            self._data = load(f)
+            data = load(f)
+        # empty file gives data=None
+        with self._lock:
+            self._data = OrderedDict() if data is None else data
         # store the modification time of this file version
         self._mtime = os.path.getmtime(self._filename)
         # make sure that reload timeout starts from this moment
         self._lastreload = time()
-        # empty file gives _data=None
-        if self._data is None:
-            self._data = OrderedDict()
         # update dict of the MemoryTree object
         to_remove = []
         # remove all obsolete entries
@@ -580,7 +596,12 @@ class MemoryTree(MemoryBranch):
         if self._filename is None:
             # skip writing to file if no filename was selected
             return
-        else:
+        # serialize a snapshot of the data, such that the writers can
+        # modify the tree meanwhile
+        with self._lock:
+            data = copy.deepcopy(self._data)
+        # the timer thread and the main thread may both write the file
+        with self._file_lock:
             if self._mtime != os.path.getmtime(self._filename):
                 logger.warning("Config file has recently been changed on your " +
                                "harddisk. These changes might have been " +
@@ -593,7 +614,7 @@ class MemoryTree(MemoryBranch):
             # http://stackoverflow.com/questions/2333872/atomic-writing-to-file-with-python:
             try:
                 f = open(self._buffer_filename, mode='w')
-                save(self._data, stream=f)
+                save(data, stream=f)
                 f.flush()
                 os.fsync(f.fileno())
                 f.close()
@@ -628,7 +649,12 @@ class MemoryTree(MemoryBranch):
         else:
             # make sure saving will eventually occur by launching a timer
             if not self._savetimer.isActive():
-                self._savetimer.start()
+                if headless or self._savetimer.thread() == \
+                        QtCore.QThread.currentThread():
+                    self._savetimer.start()
+                else:  # Qt timers can only be started in their own thread
+                    QtCore.QMetaObject.invokeMethod(
+                        self._savetimer, "start", QtCore.Qt.QueuedConnection)
 
     @property
     def _filename_stripped(self):
@@ -15,15 +15,19 @@ their attributes in the GUI having their state load and saved in the config
 file.
 """
 
-from .attributes import BaseAttribute, ModuleAttribute
-from .widgets.module_widgets import ModuleWidget
+from .attributes import BaseAttribute, BaseRegister, ModuleAttribute
+from .widgets import widget_class
+ModuleWidget = widget_class('module_widgets', 'ModuleWidget')
 from .curvedb import CurveDB
-from .pyrpl_utils import unique_list, DuplicateFilter
+from .pyrpl_utils import unique_list, DuplicateFilter, time
 
 from .errors import ExpectedPyrplError
 
+import bisect
 import logging
 import string
+import sys
+import threading
 import numpy as np
 from six import with_metaclass
 from collections import OrderedDict
@@ -712,6 +716,14 @@ class Module(with_metaclass(ModuleMetaClass, object)):
         """
         self.owner = None
 
+    def transaction(self):
+        """
+        Returns a context manager that coalesces all register writes to the
+        Red Pitaya into as few requests as possible (see
+        :obj:`RegisterTransaction`).
+        """
+        return self.pyrpl.rp.transaction()
+
     def _clear(self):
         """
         Kill timers and free resources for this module and all submodules.
@@ -721,6 +733,417 @@ class Module(with_metaclass(ModuleMetaClass, object)):
             getattr(self, sub)._clear()
 
 
+class RegisterPrefetch(object):
+    """
+    A context manager that reads all registers of a list of attributes of a
+    :obj:`HardwareModule` with a single request to the Red Pitaya.
+
+    Inside the context, reads of prefetched registers are served from the
+    prefetched values, and writes update them. Usage example::
+
+        with module._prefetch(['setpoint', 'p', 'i']):
+            values = [module.setpoint, module.p, module.i]
+    """
+    def __init__(self, parent, names):
+        self.parent = parent
+        self.names = names
+
+    def __enter__(self):
+        parent = self.parent
+        if parent._prefetched is not None:
+            return  # nested prefetch: keep the outer prefetched values
+        prefetched = {}
+        ranges = parent._register_ranges(self.names)
+        if ranges:
+            start = time()
+            values = parent._client.reads_many(
+                [(parent._addr_base + addr, length)
+                 for addr, length in ranges])
+            if values is None:
+                return  # no answer: the registers are read one by one
+            parent._rp.profiler.record(
+                parent, 'read', ranges[0][0],
+                4 * sum(length for addr, length in ranges), start,
+                name='%s.prefetch' % parent.name)
+            for (addr, length), data in zip(ranges, values):
+                for i in range(length):
+                    prefetched[addr + 4 * i] = int(data[i])
+        # only activated once the registers have been read successfully
+        self._active = True
+        parent._prefetched = prefetched
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if getattr(self, '_active', False):
+            self._active = False
+            self.parent._prefetched = None
+
+
+class RegisterTransaction(object):
+    """
+    A context manager that coalesces the register writes of all
+    HardwareModules of a RedPitaya into as few requests as possible.
+
+    Inside the context, writes are recorded in the order in which they are
+    issued. Consecutive writes to the same register or to the register
+    right after the previous one are merged into a run, such that
+    bitmasked registers require a single masked write for all fields and
+    contiguous registers a single request. When the outermost context is
+    left, the runs are written in program order. Usage example::
+
+        with redpitaya.transaction():
+            redpitaya.pid0.p = 1.0
+            redpitaya.pid0.i = 10.0
+            redpitaya.asg0.on = True
+
+    Writes that conflict with the pending bits of the same register start a
+    new run, such that sequences like a reset pulse (sm_reset=True, ...,
+    sm_reset=False) reach the FPGA as programmed. Registers with side
+    effects at the time of writing (strobe registers, such as the resets
+    or the trigger arming of the scope) flush the transaction before and
+    after their write. Reads inside the context see the pending values.
+    """
+    FULL_MASK = 0xFFFFFFFF
+
+    def __init__(self, rp):
+        self.rp = rp
+        self._depth = 0
+        self._runs = []  # [start address, values, masks] in program order
+        self._values = dict()  # address -> latest pending value
+        self._masks = dict()  # address -> bits of the pending value to write
+
+    @property
+    def active(self):
+        return self._depth > 0
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth == 0:
+            # writes issued before an exception are applied all the same,
+            # just like they would have been without the transaction
+            self.flush()
+
+    def write(self, addr, values, mask=FULL_MASK):
+        """ records the write of values to the registers starting at addr """
+        for i, value in enumerate(values):
+            a = addr + 4 * i
+            value = int(value) & mask
+            self._append(a, value, mask)
+            if a in self._values:
+                self._values[a] = (self._values[a] & ~mask) | value
+                self._masks[a] |= mask
+            else:
+                self._values[a] = value
+                self._masks[a] = mask
+
+    def _append(self, addr, value, mask):
+        """ merges the write into the last run if this keeps the order """
+        if self._runs:
+            start, values, masks = self._runs[-1]
+            last = start + 4 * (len(values) - 1)
+            if addr == last and not (values[-1] ^ value) & masks[-1] & mask:
+                values[-1] = (values[-1] & ~mask) | value
+                masks[-1] |= mask
+                return
+            if addr == last + 4:
+                values.append(value)
+                masks.append(mask)
+                return
+        self._runs.append([addr, [value], [mask]])
+
+    def read(self, addr, length):
+        """
+        returns the pending values of the registers starting at addr if all
+        of them are known, else None
+        """
+        try:
+            if all(self._masks[addr + 4 * i] == self.FULL_MASK
+                   for i in range(length)):
+                return np.array([self._values[addr + 4 * i]
+                                 for i in range(length)], dtype=np.uint32)
+        except KeyError:
+            pass
+        return None
+
+    def overlay(self, addr, data):
+        """ applies the pending writes to data read from the FPGA """
+        data = np.array(data, dtype=np.uint32)
+        for i in range(len(data)):
+            a = addr + 4 * i
+            if a in self._values:
+                data[i] = (int(data[i]) & ~self._masks[a]) | self._values[a]
+        return data
+
+    def flush(self):
+        """ writes all pending values to the FPGA in program order """
+        if not self._runs:
+            return
+        runs = self._runs
+        self._runs, self._values, self._masks = [], dict(), dict()
+        client = self.rp.client
+        cache = self.rp.register_cache
+        for addr, values, masks in runs:
+            start = time()
+            if all(mask == self.FULL_MASK for mask in masks):
+                client.writes(addr, values)
+                self.rp.profiler.record(None, 'write', addr,
+                                        4 * len(values), start,
+                                        name='transaction')
+                cache.write(addr, values)
+            else:
+                # the server merges the partially known registers
+                client.writes_masked(addr, values, masks)
+                self.rp.profiler.record(None, 'write', addr,
+                                        8 * len(values), start,
+                                        name='transaction')
+                cache.write_masked(addr, values, masks)
+
+
+class RegisterCache(object):
+    """
+    A write-through shadow of the registers of a RedPitaya.
+
+    The cache stores the values last written to or read from the FPGA
+    registers. Reads of attributes that are not declared volatile (see
+    :obj:`pyrpl.attributes.BaseProperty`) are served from the cache if
+    possible. Volatile attributes, such as status bits, write pointers or
+    sampled signal values, always read the FPGA.
+
+    The cache assumes that no other program modifies the registers. If
+    this cannot be guaranteed, call :meth:`invalidate` or :meth:`resync`.
+    """
+    def __init__(self, rp, enabled=False):
+        self.rp = rp
+        self.enabled = enabled
+        self._values = dict()  # address -> register value
+        self.hits = 0  # for debugging and unittests
+        self.misses = 0
+
+    def read(self, addr, length):
+        """
+        returns the cached values of the registers starting at addr, or
+        None if any of them is not cached
+        """
+        if not self.enabled:
+            return None
+        try:
+            values = np.array([self._values[addr + 4 * i]
+                               for i in range(length)], dtype=np.uint32)
+        except KeyError:
+            self.misses += 1
+            return None
+        else:
+            self.hits += 1
+            return values
+
+    def contains(self, addr, length=1):
+        """ returns True if all registers starting at addr are cached """
+        return self.enabled and all((addr + 4 * i) in self._values
+                                    for i in range(length))
+
+    def write(self, addr, values):
+        """ stores the values of the registers starting at addr """
+        if not self.enabled:
+            return
+        for i, value in enumerate(values):
+            self._values[addr + 4 * i] = int(value)
+
+    def write_masked(self, addr, values, masks):
+        """
+        updates the bits selected by masks of the registers starting at addr
+        if the registers are cached
+        """
+        if not self.enabled:
+            return
+        for i, (value, mask) in enumerate(zip(values, masks)):
+            a = addr + 4 * i
+            if a in self._values:
+                self._values[a] = (self._values[a] & ~int(mask)) \
+                                  | (int(value) & int(mask))
+
+    def invalidate(self, addr=None, length=1):
+        """
+        removes the registers starting at addr from the cache, or all
+        registers if addr is None
+        """
+        if addr is None:
+            self._values.clear()
+        else:
+            for i in range(length):
+                self._values.pop(addr + 4 * i, None)
+
+    def resync(self):
+        """ reads all cached registers from the FPGA with a single request """
+        blocks = []
+        for a in sorted(self._values):
+            if blocks and blocks[-1][0] + 4 * blocks[-1][1] == a:
+                blocks[-1][1] += 1
+            else:
+                blocks.append([a, 1])
+        if not blocks:
+            return
+        results = self.rp.client.reads_many(blocks)
+        if results is None:
+            # the FPGA values are unknown: do not serve stale ones
+            self.invalidate()
+            return
+        for (addr, length), values in zip(blocks, results):
+            self.write(addr, values)
+
+
+class RegisterProfiler(object):
+    """
+    Statistics of the register accesses of the HardwareModules of a
+    RedPitaya, to find the code that loads the connection most.
+
+    Each access is attributed to 'module.attribute', where attribute is the
+    name of the descriptor that reads or writes the register, or else the
+    name of the method of the module that accesses it. The writes of
+    transactions and the reads of prefetches are attributed to
+    'transaction' and 'module.prefetch'. For each name and type of access,
+    the profiler records the number of requests, the transferred bytes and
+    a histogram of the latencies, and counts the accesses served without a
+    request (register cache, pending transaction or prefetched values).
+
+    The profiler is disabled by default, since finding the name of the
+    attribute costs a few microseconds per access. As a context manager, it
+    profiles a code block::
+
+        with redpitaya.io_profiling() as profiler:
+            redpitaya.scope.curve()
+        print(profiler.table())
+    """
+    # upper edges of the bins of the latency histograms in seconds
+    LATENCY_BINS = [1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1,
+                    float('inf')]
+    # methods of HardwareModule skipped to find the accessing method
+    _ACCESS_METHODS = ('_read', '_reads', '_reads_async', '_reads_int16',
+                       '_reads_int16_async', '_write', '_writes',
+                       '_writes_async', '_write_masked', '_writes_masked')
+    # methods of the descriptors that may access the registers
+    _DESCRIPTOR_METHODS = ('get_value', 'set_value', '__get__', '__set__')
+    _MAX_DEPTH = 12  # number of stack frames searched for the accessor
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._entries = dict()  # (name, access) -> statistics
+        self._lock = threading.Lock()
+        self._enabled_before = []
+
+    def __enter__(self):
+        self._enabled_before.append(self.enabled)
+        self.reset()
+        self.enabled = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.enabled = self._enabled_before.pop()
+
+    def reset(self):
+        """ discards the statistics recorded so far """
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, module, access, addr, nbytes, start, name=None):
+        """
+        records an access ('read' or 'write') of nbytes to the registers of
+        module at the offset addr, started at time start and completed now
+        """
+        if not self.enabled:
+            return
+        duration = time() - start
+        entry = self._entry(name or self._accessor(module, addr), access)
+        with self._lock:
+            entry['count'] += 1
+            entry['bytes'] += nbytes
+            entry['time'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['histogram'][bisect.bisect_left(self.LATENCY_BINS,
+                                                  duration)] += 1
+
+    def record_local(self, module, access, addr):
+        """ records an access served without a request to the Red Pitaya """
+        if not self.enabled:
+            return
+        entry = self._entry(self._accessor(module, addr), access)
+        with self._lock:
+            entry['local'] += 1
+
+    def _entry(self, name, access):
+        with self._lock:
+            try:
+                return self._entries[(name, access)]
+            except KeyError:
+                entry = dict(count=0, local=0, bytes=0, time=0.0, max=0.0,
+                             histogram=[0] * len(self.LATENCY_BINS))
+                self._entries[(name, access)] = entry
+                return entry
+
+    def _accessor(self, module, addr):
+        """
+        returns 'module.attribute' for the descriptor or method of module
+        that accesses the registers at addr, found in the calling stack
+        frames, or 'module.0x...' if there is none
+        """
+        method = None
+        frame = sys._getframe(2)
+        for depth in range(self._MAX_DEPTH):
+            if frame is None:
+                break
+            name = frame.f_code.co_name
+            if name in self._DESCRIPTOR_METHODS:
+                local_variables = frame.f_locals
+                if isinstance(local_variables.get('self'), BaseAttribute) \
+                        and module in (local_variables.get('obj'),
+                                       local_variables.get('instance')):
+                    return '%s.%s' % (module.name,
+                                      local_variables['self'].name)
+            elif method is None and name not in self._ACCESS_METHODS \
+                    and frame.f_locals.get('self') is module:
+                method = name
+            frame = frame.f_back
+        return '%s.%s' % (module.name, method or '0x%X' % addr)
+
+    def table(self, sort='time'):
+        """
+        returns a pandas DataFrame with one row per name and type of
+        access, sorted by the column sort in descending order. The columns
+        are the number of requests (count), the number of accesses served
+        without request (local), the transferred bytes, the total, mean and
+        maximum latency in seconds and the number of requests per latency
+        bin (e.g. '<1ms').
+        """
+        import pandas as pd
+        labels = ['<%s' % self._format(edge) for edge in
+                  self.LATENCY_BINS[:-1]] + \
+                 ['>%s' % self._format(self.LATENCY_BINS[-2])]
+        rows = []
+        with self._lock:
+            for (name, access), entry in self._entries.items():
+                row = OrderedDict(name=name, access=access)
+                for key in ['count', 'local', 'bytes', 'time']:
+                    row[key] = entry[key]
+                row['mean'] = entry['time'] / entry['count'] \
+                    if entry['count'] else 0.0
+                row['max'] = entry['max']
+                row.update(zip(labels, entry['histogram']))
+                rows.append(row)
+        columns = ['name', 'access', 'count', 'local', 'bytes', 'time',
+                   'mean', 'max'] + labels
+        table = pd.DataFrame(rows, columns=columns)
+        return table.sort_values(sort, ascending=False).reset_index(
+            drop=True)
+
+    @staticmethod
+    def _format(seconds):
+        if seconds >= 1e-3:
+            return '%gms' % (seconds * 1e3)
+        return '%gus' % (seconds * 1e6)
+
+
 class HardwareModule(Module):
     """
     Module that directly maps a FPGA module. In addition to BaseModule's
@@ -732,6 +1155,9 @@ class HardwareModule(Module):
 
     parent = None  # parent will be redpitaya instance
 
+    # register values read in advance by RegisterPrefetch (None if inactive)
+    _prefetched = None
+
     def __init__(self, parent, name=None):
         """ Creates the prototype of a RedPitaya Module interface
 
@@ -766,14 +1192,225 @@ class HardwareModule(Module):
                                  "'frequency_correction'. ", self.name)
             return 1.0
 
-    def _reads(self, addr, length):
-        return self._client.reads(self._addr_base + addr, length)
+    def _register_ranges(self, names):
+        """
+        Returns a list of (address offset, length) of the registers behind
+        the attributes in names, except those available in the register
+        cache.
+        """
+        ranges = []
+        cache = self._rp.register_cache
+        for name in names:
+            attr = getattr(type(self), name, None)
+            if isinstance(attr, BaseRegister):
+                length = getattr(attr, 'size', 1)
+                if not attr.volatile and cache.contains(
+                        self._addr_base + attr.address, length):
+                    continue  # will be served by the register cache
+                ranges.append((attr.address, length))
+        return ranges
+
+    def _prefetch(self, names):
+        """
+        Returns a context manager that reads the registers of all
+        attributes in names with a single request.
+        """
+        return RegisterPrefetch(self, names)
+
+    @property
+    def setup_attributes(self):
+        """
+        :return: a dict with the current values of the setup attributes.
+        All registers are read with a single request to the Red Pitaya.
+        """
+        with self._prefetch(self._setup_attributes):
+            return super(HardwareModule, self).setup_attributes
+
+    @setup_attributes.setter
+    def setup_attributes(self, kwds):
+        Module.setup_attributes.fset(self, kwds)
+
+    def transaction(self):
+        """
+        Returns a context manager that coalesces all register writes of the
+        Red Pitaya into as few requests as possible (see
+        :obj:`RegisterTransaction`).
+        """
+        return self._rp.transaction()
+
+    def load_state(self, name=None):
+        with self.transaction():
+            super(HardwareModule, self).load_state(name=name)
+
+    def _reads(self, addr, length, volatile=True):
+        """
+        Reads length registers starting at addr. Unless volatile is False,
+        the values are read from the FPGA and not from the register cache.
+        """
+        data = self._reads_local(addr, length, volatile=volatile)
+        profiler = self._rp.profiler
+        if data is None:
+            start = time()
+            data = self._client.reads(self._addr_base + addr, length)
+            profiler.record(self, 'read', addr, 4 * length, start)
+            data = self._reads_received(addr, data, volatile=volatile)
+        else:
+            profiler.record_local(self, 'read', addr)
+        return data
+
+    async def _reads_async(self, addr, length, volatile=True):
+        """
+        Coroutine version of _reads that does not block the event loop
+        while waiting for the Red Pitaya.
+        """
+        data = self._reads_local(addr, length, volatile=volatile)
+        profiler = self._rp.profiler
+        if data is None:
+            start = time()
+            # preserve the order with respect to pipelined writes
+            await self._client.drain()
+            data = await self._rp.async_client.reads(self._addr_base + addr,
+                                                     length)
+            profiler.record(self, 'read', addr, 4 * length, start)
+            data = self._reads_received(addr, data, volatile=volatile)
+        else:
+            profiler.record_local(self, 'read', addr)
+        return data
+
+    def _reads_local(self, addr, length, volatile=True):
+        """
+        Returns the values of the registers if they are available without
+        a request to the Red Pitaya (pending transaction, register cache or
+        prefetched values), and None otherwise.
+        """
+        transaction = self._rp._transaction
+        if transaction.active:
+            data = transaction.read(self._addr_base + addr, length)
+            if data is not None:
+                return data
+        data = None
+        cache = self._rp.register_cache
+        if not volatile:
+            data = cache.read(self._addr_base + addr, length)
+        if data is None and self._prefetched is not None:
+            try:
+                data = np.array([self._prefetched[addr + 4 * i]
+                                 for i in range(length)], dtype=np.uint32)
+            except KeyError:
+                pass
+            else:
+                if not volatile:
+                    cache.write(self._addr_base + addr, data)
+        if data is not None and transaction.active:
+            data = transaction.overlay(self._addr_base + addr, data)
+        return data
+
+    def _reads_received(self, addr, data, volatile=True):
+        """ Processes the register values received from the Red Pitaya """
+        if not volatile:
+            self._rp.register_cache.write(self._addr_base + addr, data)
+        transaction = self._rp._transaction
+        if transaction.active:
+            data = transaction.overlay(self._addr_base + addr, data)
+        return data
+
+    def _reads_int16(self, addr, length, out=None):
+        """
+        Reads length registers holding signed 14-bit samples, such as data
+        buffers, and returns them as an int16 array (or in the array out).
+        Sample buffers are volatile and are never cached.
+        """
+        start = time()
+        data = self._client.reads_int16(self._addr_base + addr, length,
+                                        out=out)
+        self._rp.profiler.record(self, 'read', addr, 2 * length, start)
+        return data
+
+    async def _reads_int16_async(self, addr, length):
+        """ Coroutine version of _reads_int16 """
+        start = time()
+        await self._client.drain()
+        data = await self._rp.async_client.reads_int16(self._addr_base + addr,
+                                                       length)
+        self._rp.profiler.record(self, 'read', addr, 2 * length, start)
+        return data
 
     def _writes(self, addr, values):
+        if self._writes_local(addr, values):
+            self._rp.profiler.record_local(self, 'write', addr)
+            return
+        start = time()
         self._client.writes(self._addr_base + addr, values)
-
-    def _read(self, addr):
-        return int(self._reads(addr, 1)[0])
+        self._rp.profiler.record(self, 'write', addr, 4 * len(values),
+                                 start)
+        self._rp.register_cache.write(self._addr_base + addr, values)
+
+    async def _writes_async(self, addr, values):
+        """
+        Coroutine version of _writes that does not block the event loop
+        while waiting for the acknowledgement of the Red Pitaya.
+        """
+        if self._writes_local(addr, values):
+            self._rp.profiler.record_local(self, 'write', addr)
+            return
+        start = time()
+        await self._client.drain()
+        await self._rp.async_client.writes(self._addr_base + addr, values)
+        self._rp.profiler.record(self, 'write', addr, 4 * len(values),
+                                 start)
+        self._rp.register_cache.write(self._addr_base + addr, values)
+
+    def _writes_local(self, addr, values):
+        """
+        Updates the prefetched values and the pending transaction with the
+        written values. Returns True if the write is deferred to the end of
+        the transaction.
+        """
+        if self._prefetched is not None:
+            for i, value in enumerate(values):
+                if addr + 4 * i in self._prefetched:
+                    self._prefetched[addr + 4 * i] = int(value)
+        transaction = self._rp._transaction
+        if transaction.active:
+            transaction.write(self._addr_base + addr, values)
+            return True
+        return False
+
+    def _write_masked(self, addr, value, mask):
+        """
+        Writes the bits of value selected by mask to the register at addr
+        and leaves the other bits unchanged.
+        """
+        self._writes_masked(addr, [value], [mask])
+
+    def _writes_masked(self, addr, values, masks):
+        """
+        Writes the bits of values selected by masks to the registers
+        starting at addr with a single atomic read-modify-write request.
+        """
+        values = [int(value) & int(mask) for value, mask in zip(values, masks)]
+        masks = [int(mask) for mask in masks]
+        if self._prefetched is not None:
+            for i, (value, mask) in enumerate(zip(values, masks)):
+                if addr + 4 * i in self._prefetched:
+                    self._prefetched[addr + 4 * i] = \
+                        (self._prefetched[addr + 4 * i] & ~mask) | value
+        transaction = self._rp._transaction
+        if transaction.active:
+            for i, (value, mask) in enumerate(zip(values, masks)):
+                transaction.write(self._addr_base + addr + 4 * i, [value],
+                                  mask=mask)
+            self._rp.profiler.record_local(self, 'write', addr)
+        else:
+            start = time()
+            self._client.writes_masked(self._addr_base + addr, values, masks)
+            self._rp.profiler.record(self, 'write', addr, 8 * len(values),
+                                     start)
+            self._rp.register_cache.write_masked(self._addr_base + addr,
+                                                 values, masks)
+
+    def _read(self, addr, volatile=True):
+        return int(self._reads(addr, 1, volatile=volatile)[0])
 
     def _write(self, addr, value):
         self._writes(addr, [int(value)])
@@ -40,17 +40,40 @@ Communication protocol for the data server:
 The program is launched on the redpitaya with 
 
 ./monitor-server PORT-NUMBER, where the default port number is 2222.  
+The FPGA address space 0x40000000 to 0x40800000 is mapped once at startup. With the optional second argument -r, 
+the memory is mapped again for each request instead (slow legacy mode). 
 
-We allow for bidirectional data transfer. The client (python program) connects to the server, which in return accepts the connection. 
+We allow for bidirectional data transfer. The client (python program) connects to the server, which in return accepts the connection. Up to 16 clients can be connected at the same time, e.g. the slave interfaces created by RedPitaya.make_a_slave. Their requests are served one after the other, such that each request is processed without interruption. 
 The client sends 8 bytes of data:
-Byte 1 is interpreted as a character: 'r' for read and 'w' for write, and 'c' for close. All other messages are ignored. 
-Byte 2 is reserved. 
+Byte 1 is interpreted as a character: 'r' for read, 'w' for write, 'p' for packed read, 'g' for gather-read, 'm' for masked write, 'R' for bulk read, 'W' for bulk write, 's' for sampler statistics, 't' for timing statistics and 'c' for close. All other messages are ignored. 
+Byte 2 is reserved. It is echoed back unchanged and used by the client as a sequence number for pipelined writes. 
 Bytes 3+4 are interpreted as unsigned int. This number n is the amount of 4-byte-units to be read or written. Maximum is 2^16. 
 Bytes 5-8 are the start address to be written to. 
 
 If the command is read, the server will then send the requested 4*n bytes to the client. 
+If the command is packed read, the server reads n registers, sign-extends the 14 least significant bits of each 
+register to a 16-bit integer and sends the header, followed by the resulting 2*n bytes (used for ADC sample buffers). 
 If the command is write, the server will wait for 4*n bytes of data from the server and write them to the designated FPGA address space. 
-If the command is close, or if the connection is broken, the server program will terminate. 
+If the command is gather-read, n is the number of address ranges to read and the address field is ignored. The server 
+waits for 2*n 4-byte-units (start address and length of each range) and then sends the header, followed by the 
+concatenated data of all ranges. The total length of all ranges must not exceed MAX_LENGTH. 
+If the command is masked write, the server waits for 2*n 4-byte-units (a value and a mask for each of the n registers 
+starting at the designated address). Each register is replaced by (old & ~mask) | (value & mask), and the header is 
+sent back once all registers have been written. n must not exceed MAX_RANGES. 
+If the command is bulk read or bulk write, bytes 3+4 are ignored and the client sends 4 additional bytes, interpreted as 
+a 32-bit unsigned int n. The server echoes the resulting 12-byte header and then sends the 4*n bytes read from the designated 
+address (bulk read), or it receives 4*n bytes and echoes the 12-byte header after writing them (bulk write). The transfer is 
+split into chunks of at most MAX_LENGTH internally. 
+If the command is sampler statistics, n is the number of signals. The server waits for 2+n 4-byte-units: the duration 
+in microseconds, the maximum number of samples (0 for no limit) and the addresses of the n signals. It samples the 14-bit 
+signed content of all addresses until one of the limits is reached (at least once), and sends the header followed by one 
+record of 8 4-byte-units per signal: number of samples, reserved, sum (low and high word), sum of squares (low and high 
+word), minimum and maximum. Other clients are served once the sampling is finished. 
+If the command is timing statistics, the other header bytes are ignored, except for the address: if it is non-zero, 
+the statistics are reset after sending them. The server sends the header, followed by the number m of commands that 
+have been served so far and by m records of 6 4-byte-units: command character, number of requests, total service time 
+in ns (low and high word), minimum and maximum service time in ns. 
+If the command is close, or if the connection is broken, the server closes the connection. The server program terminates when the last client has disconnected. 
 
 After this, the server will wait for the next command. 
 */
@@ -73,6 +96,9 @@ After this, the server will wait for the next command.
 #include <stdint.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <sys/select.h>
+#include <time.h>
 
 void error(const char *msg);
 
@@ -85,91 +111,438 @@ void error(const char *msg);
 //allowed address space: 0x40000000 to 0x40800000 has size 0x800000 = 128*65536 = 8388608
 //#define MAP_SIZE 8388608UL
 #define MAP_MASK (MAP_SIZE - 1)
+//the whole FPGA address space is mapped once at startup (persistent mapping)
+#define FPGA_BASE 0x40000000UL
+#define FPGA_SIZE 0x800000UL
 #define MAX_LENGTH 65535
+#define MAX_RANGES (MAX_LENGTH/2)
+#define MAX_STATS_SIGNALS 64
+//version of the protocol, reported by the hello command
+#define SERVER_VERSION 2
 
 #define DEBUG_MONITOR 0
 
-unsigned long read_value(unsigned long a_addr);
 unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len);
-void write_value(unsigned long a_addr, unsigned long a_value);
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len);
+int write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len);
+int write_masked_values(unsigned long a_addr, unsigned long* a_values_and_masks, unsigned long a_len);
+unsigned long* read_values_remap(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len);
+void write_values_remap(unsigned long a_addr, unsigned long* a_values, unsigned long a_len);
+void write_masked_values_remap(unsigned long a_addr, unsigned long* a_values_and_masks, unsigned long a_len);
 
 //FPGA memory handlers
 void* map_base = (void*)(-1);
 int fd = -1;
+//if 0, /dev/mem is opened and mapped again for every request (slow, legacy mode)
+int persistent_mapping = 1;
+
+//service time statistics for each command character
+struct command_stats {
+	unsigned long count;
+	uint64_t total_ns;
+	unsigned long min_ns;
+	unsigned long max_ns;
+};
+struct command_stats stats[256];
+
+void record_stats(unsigned char command, struct timespec* start, struct timespec* stop) {
+	uint64_t ns = (uint64_t)(stop->tv_sec - start->tv_sec) * 1000000000ULL
+	              + stop->tv_nsec - start->tv_nsec;
+	if (ns > 0xFFFFFFFFUL)
+		ns = 0xFFFFFFFFUL;
+	if (stats[command].count == 0 || ns < stats[command].min_ns)
+		stats[command].min_ns = ns;
+	if (ns > stats[command].max_ns)
+		stats[command].max_ns = ns;
+	stats[command].count++;
+	stats[command].total_ns += ns;
+}
 
 //sockets are globally defined for error handling
 int sockfd;
-int newsockfd;
+int newsockfd = -1;
 
 //open and close memory mapping to FPGA registers
 void open_map_base() {
-    int addr = 0x40000000;
     if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
-    map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, addr & ~MAP_MASK);
+    map_base = mmap(0, FPGA_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, FPGA_BASE);
 	if(map_base == (void *) -1) FATAL;
 }
 
 void close_map_base() {
-	/*if (map_base != (void*)(-1)) {
-		if(munmap(map_base, MAP_SIZE) == -1) FATAL;
+	if (map_base != (void*)(-1)) {
+		if(munmap(map_base, FPGA_SIZE) == -1) FATAL;
 		map_base = (void*)(-1);
 	}
 	if (fd != -1) {
 		close(fd);
+		fd = -1;
 	}
-	*/;
 }
-/*
-//basic read and write operations
+
+//returns the address of a_len registers starting at a_addr in the persistent
+//mapping, or NULL if they lie outside the FPGA address space
+volatile unsigned long* fpga_pointer(unsigned long a_addr, unsigned long a_len) {
+	if (a_addr < FPGA_BASE || a_addr - FPGA_BASE > FPGA_SIZE
+	    || a_len > (FPGA_SIZE - (a_addr - FPGA_BASE)) / sizeof(unsigned long))
+		return NULL;
+	return (volatile unsigned long*)(map_base + (a_addr - FPGA_BASE));
+}
+
+//basic read and write operations, return NULL or -1 for invalid addresses
 unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len) {
-	unsigned long* virt_addr = map_base + (a_addr & MAP_MASK);
+	volatile unsigned long* virt_addr;
 	unsigned long i;
-	printf("address to read %d",(int)a_addr);
-	for (i = 0; i < a_len; i++) {;
+	if (!persistent_mapping)
+		return read_values_remap(a_addr, a_values_buffer, a_len);
+	virt_addr = fpga_pointer(a_addr, a_len);
+	if (virt_addr == NULL)
+		return NULL;
+	for (i = 0; i < a_len; i++) {
 		a_values_buffer[i] = virt_addr[i];
 	}
 	return a_values_buffer;
 }
 
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
-	void* virt_addr = map_base + (a_addr & MAP_MASK);
+int write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
+	volatile unsigned long* virt_addr;
 	unsigned long i;
+	if (!persistent_mapping) {
+		write_values_remap(a_addr, a_values, a_len);
+		return 0;
+	}
+	virt_addr = fpga_pointer(a_addr, a_len);
+	if (virt_addr == NULL)
+		return -1;
 	for (i = 0; i < a_len; i++) {
-		((unsigned long *) virt_addr)[i] = a_values[i];
+		virt_addr[i] = a_values[i];
 	}
+	return 0;
+}
+
+int write_masked_values(unsigned long a_addr, unsigned long* a_values_and_masks, unsigned long a_len) {
+	volatile unsigned long* virt_addr;
+	unsigned long i, value, mask;
+	if (!persistent_mapping) {
+		write_masked_values_remap(a_addr, a_values_and_masks, a_len);
+		return 0;
+	}
+	virt_addr = fpga_pointer(a_addr, a_len);
+	if (virt_addr == NULL)
+		return -1;
+	for (i = 0; i < a_len; i++) {
+		value = a_values_and_masks[2*i];
+		mask = a_values_and_masks[2*i+1];
+		virt_addr[i] = (virt_addr[i] & ~mask) | (value & mask);
+	}
+	return 0;
 }
-*/
 
 /* server process and error handling */
 
+#define MAX_CLIENTS 16
+
+//each connection keeps its own buffers for its whole lifetime
+struct client_connection {
+	int fd;
+	char* data_buffer; //header followed by up to MAX_LENGTH values
+	unsigned long* range_buffer; //up to MAX_RANGES pairs of unsigned long
+};
+
+struct client_connection clients[MAX_CLIENTS];
+
 void error(const char *msg)
 {
+    int c;
     perror(msg);
-    close(newsockfd); 
+    for (c = 0; c < MAX_CLIENTS; c++)
+        if (clients[c].fd >= 0)
+            close(clients[c].fd);
     close(sockfd);
 	//clean up the memory mapping
 	close_map_base();
     exit(-1);
 }
 
-int main(int argc, char *argv[])
+//errors of a single connection only terminate this connection
+#define CLIENT_ERROR(msg) do { perror(msg); return -1; } while(0)
+
+int open_connection(int fd)
+{
+	int c;
+	int enable = 1;
+	for (c = 0; c < MAX_CLIENTS; c++) {
+		if (clients[c].fd < 0) {
+			clients[c].data_buffer = malloc(8+sizeof(unsigned long)*MAX_LENGTH);
+			clients[c].range_buffer = malloc(2*sizeof(unsigned long)*MAX_RANGES);
+			if (clients[c].data_buffer == NULL || clients[c].range_buffer == NULL)
+				error("ERROR allocating connection buffers");
+			//send acknowledgements immediately, pipelined clients do not wait for them
+			if (setsockopt(fd,IPPROTO_TCP,TCP_NODELAY,&enable,sizeof(int))<0)
+				error("setsockopt(TCP_NODELAY) failed");
+			clients[c].fd = fd;
+			return c;
+		}
+	}
+	//no free slot: refuse the connection
+	close(fd);
+	return -1;
+}
+
+void close_connection(int c)
+{
+	close(clients[c].fd);
+	clients[c].fd = -1;
+	free(clients[c].data_buffer);
+	free(clients[c].range_buffer);
+}
+
+//serves one complete request of a client. Requests of different clients are
+//never interleaved. Returns 0 on success, 1 if the client closes the
+//connection and -1 on errors.
+int serve_request(struct client_connection* client)
 {
-     int portno;
 	 unsigned int data_length;
+	 unsigned long total_length;
 	 unsigned long address;
-     socklen_t clilen;
-
-     char data_buffer[8+sizeof(unsigned long)*MAX_LENGTH];
+	 unsigned long i;
+	 long sample;
+	 unsigned long bulk_length, chunk_length;
+	 char bulk_header[12];
+	 unsigned long value, samples, max_samples;
+	 uint64_t duration_ns;
+	 struct timespec start, now;
+	 int64_t sum[MAX_STATS_SIGNALS];
+	 uint64_t sumsq[MAX_STATS_SIGNALS];
+	 long min[MAX_STATS_SIGNALS], max[MAX_STATS_SIGNALS];
+	 char* data_buffer = client->data_buffer;
 	 unsigned long * rw_buffer =(unsigned long*)&(data_buffer[8]);
 	 char* buffer = (char*)&(data_buffer[0]);
-     
+	 unsigned long* range_buffer = client->range_buffer;
+	 int n;
+
+	 //read next header from client
+	 bzero(buffer,8);
+	 n = recv(client->fd,buffer,8,MSG_WAITALL);
+	 if (n == 0) return 1; //connection closed by client
+	 if (n < 0) CLIENT_ERROR("ERROR reading from socket");
+	 if (n != 8) CLIENT_ERROR("ERROR reading from socket - incorrect header length");
+	 //confirm control sequence
+ ////n=send(client->fd,buffer,8,0); 
+ ////if (n != 8) CLIENT_ERROR("ERROR control sequence mirror incorreclty transmitted");
+     //interpret the header
+    	 address = ((unsigned long*)buffer)[1]; //address to be read/written
+	 data_length = (unsigned char)buffer[2]+((unsigned char)buffer[3]<<8); //number of "unsigned long" to be read/written
+	 if (buffer[0] == 't') { //send service time statistics
+		//one record of 6 unsigned long per command that has been served:
+		//command, count, total time (ns, low and high word), min time, max time
+		total_length = 0;
+		for (i = 0; i < 256; i++) {
+			if (stats[i].count == 0)
+				continue;
+			rw_buffer[1+6*total_length] = i;
+			rw_buffer[2+6*total_length] = stats[i].count;
+			rw_buffer[3+6*total_length] = stats[i].total_ns & 0xFFFFFFFFUL;
+			rw_buffer[4+6*total_length] = stats[i].total_ns >> 32;
+			rw_buffer[5+6*total_length] = stats[i].min_ns;
+			rw_buffer[6+6*total_length] = stats[i].max_ns;
+			total_length++;
+		}
+		rw_buffer[0] = total_length;
+		n = send(client->fd,(void*)data_buffer,(1+6*total_length)*sizeof(unsigned long)+8,0);
+		if (n != (1+6*total_length)*sizeof(unsigned long)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+		if (address != 0) //reset the statistics
+			memset(stats, 0, sizeof(stats));
+		return 0;
+	 }
+	 if (buffer[0] == 'h') { //hello: send the protocol version and the limits of the server
+		rw_buffer[0] = SERVER_VERSION;
+		rw_buffer[1] = MAX_LENGTH;
+		rw_buffer[2] = MAX_CLIENTS;
+		rw_buffer[3] = persistent_mapping;
+		n = send(client->fd,(void*)data_buffer,4*sizeof(unsigned long)+8,0);
+		if (n != 4*sizeof(unsigned long)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+		return 0;
+	 }
+	 if (buffer[0] == 'R' || buffer[0] == 'W') { //bulk transfers with 32-bit length
+		memcpy(bulk_header, buffer, 8);
+		n = recv(client->fd,bulk_header+8,4,MSG_WAITALL);
+		if (n != 4) CLIENT_ERROR("ERROR reading from socket - incorrect bulk header length");
+		bulk_length = ((uint32_t*)bulk_header)[2];
+		//an unaligned address within the last word of a mapping would yield empty chunks
+		if (address % sizeof(uint32_t)) { errno = EINVAL; CLIENT_ERROR("ERROR unaligned address"); }
+		if (buffer[0] == 'R') {
+			n = send(client->fd,bulk_header,12,0);
+			if (n != 12) CLIENT_ERROR("ERROR control sequence mirror incorreclty transmitted");
+		}
+		while (bulk_length > 0) {
+			//chunks must not cross the boundary of the memory mapping
+			chunk_length = (MAP_SIZE - (address & MAP_MASK)) / sizeof(uint32_t);
+			if (chunk_length > MAX_LENGTH)
+				chunk_length = MAX_LENGTH;
+			if (chunk_length > bulk_length)
+				chunk_length = bulk_length;
+			if (buffer[0] == 'R') {
+				if (read_values(address, rw_buffer, chunk_length) == NULL) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+				n = send(client->fd,(void*)rw_buffer,chunk_length*sizeof(unsigned long),0);
+				if (n != chunk_length*sizeof(unsigned long)) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+			}
+			else {
+				n = recv(client->fd,(void*)rw_buffer,chunk_length*sizeof(unsigned long),MSG_WAITALL);
+				if (n != chunk_length*sizeof(unsigned long)) CLIENT_ERROR("ERROR read incorrect number of bytes from socket");
+				if (write_values(address, rw_buffer, chunk_length) < 0) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+			}
+			address += chunk_length*sizeof(unsigned long);
+			bulk_length -= chunk_length;
+		}
+		if (buffer[0] == 'W') {
+			n = send(client->fd,bulk_header,12,0);
+			if (n != 12) CLIENT_ERROR("ERROR control sequence mirror incorreclty transmitted");
+		}
+		return 0;
+	 }
+	 if (data_length > MAX_LENGTH)
+		 data_length = MAX_LENGTH;
+	 if (data_length == 0)
+		return 0;
+	 //test for various cases Read, Write, Close
+	 else if (buffer[0] == 'r') { //read from FPGA
+		if (read_values(address, rw_buffer, data_length) == NULL) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+		//send the data
+		n = send(client->fd,(void*)data_buffer,data_length*sizeof(unsigned long)+8,0);
+		if (n < 0) CLIENT_ERROR("ERROR writing to socket");
+		if (n != data_length*sizeof(unsigned long)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+	 }
+	 else if (buffer[0] == 'p') { //packed read of 14-bit samples from FPGA
+		if (read_values(address, rw_buffer, data_length) == NULL) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+		//sign-extend to 16 bits in place (the write index never overtakes the read index)
+		for (i = 0; i < data_length; i++) {
+			sample = rw_buffer[i] & 0x3FFF;
+			((int16_t*)rw_buffer)[i] = (sample & 0x2000) ? (int16_t)(sample - 0x4000) : (int16_t)sample;
+		}
+		//send the data
+		n = send(client->fd,(void*)data_buffer,data_length*sizeof(int16_t)+8,0);
+		if (n < 0) CLIENT_ERROR("ERROR writing to socket");
+		if (n != data_length*sizeof(int16_t)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+	 }
+	 else if  (buffer[0] == 'w') { //write to FPGA
+		//read new data from socket
+		n = recv(client->fd,(void*)rw_buffer,data_length*sizeof(unsigned long),MSG_WAITALL);
+		if (n < 0) CLIENT_ERROR("ERROR reading from socket");
+		if (n != data_length*sizeof(unsigned long)) CLIENT_ERROR("ERROR read incorrect number of bytes to socket");
+		//write FPGA memory
+		if (write_values(address, rw_buffer, data_length) < 0) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+		n=send(client->fd,buffer,8,0);
+		if (n != 8) CLIENT_ERROR("ERROR control sequence mirror incorreclty transmitted");
+	 }
+	 else if  (buffer[0] == 'g') { //gather-read a list of address ranges
+		if (data_length > MAX_RANGES) CLIENT_ERROR("ERROR too many ranges in gather-read");
+		//read the list of (address, length) pairs from socket
+		n = recv(client->fd,(void*)range_buffer,2*data_length*sizeof(unsigned long),MSG_WAITALL);
+		if (n < 0) CLIENT_ERROR("ERROR reading from socket");
+		if (n != 2*data_length*sizeof(unsigned long)) CLIENT_ERROR("ERROR read incorrect number of bytes from socket");
+		//read all ranges into one contiguous buffer
+		total_length = 0;
+		for (i = 0; i < data_length; i++) {
+			//compare without sum, which could wrap around for huge lengths
+			if (range_buffer[2*i+1] > MAX_LENGTH - total_length) CLIENT_ERROR("ERROR gather-read exceeds maximum length");
+			if (read_values(range_buffer[2*i], rw_buffer + total_length, range_buffer[2*i+1]) == NULL) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+			total_length += range_buffer[2*i+1];
+		}
+		//send the data
+		n = send(client->fd,(void*)data_buffer,total_length*sizeof(unsigned long)+8,0);
+		if (n < 0) CLIENT_ERROR("ERROR writing to socket");
+		if (n != total_length*sizeof(unsigned long)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+	 }
+	 else if  (buffer[0] == 'm') { //masked write (read-modify-write on the server side)
+		if (data_length > MAX_RANGES) CLIENT_ERROR("ERROR too many registers in masked write");
+		//read the list of (value, mask) pairs from socket
+		n = recv(client->fd,(void*)range_buffer,2*data_length*sizeof(unsigned long),MSG_WAITALL);
+		if (n < 0) CLIENT_ERROR("ERROR reading from socket");
+		if (n != 2*data_length*sizeof(unsigned long)) CLIENT_ERROR("ERROR read incorrect number of bytes from socket");
+		//modify FPGA memory
+		if (write_masked_values(address, range_buffer, data_length) < 0) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+		n=send(client->fd,buffer,8,0);
+		if (n != 8) CLIENT_ERROR("ERROR control sequence mirror incorreclty transmitted");
+	 }
+	 else if  (buffer[0] == 's') { //statistics of 14-bit signals sampled on the board
+		if (data_length > MAX_STATS_SIGNALS) CLIENT_ERROR("ERROR too many signals for statistics");
+		//read duration (us), maximum number of samples and the signal addresses
+		n = recv(client->fd,(void*)range_buffer,(2+data_length)*sizeof(unsigned long),MSG_WAITALL);
+		if (n < 0) CLIENT_ERROR("ERROR reading from socket");
+		if (n != (2+data_length)*sizeof(unsigned long)) CLIENT_ERROR("ERROR read incorrect number of bytes from socket");
+		duration_ns = (uint64_t)range_buffer[0] * 1000ULL;
+		max_samples = range_buffer[1];
+		for (i = 0; i < data_length; i++) {
+			sum[i] = 0;
+			sumsq[i] = 0;
+			min[i] = 0x2000;
+			max[i] = -0x2000;
+		}
+		clock_gettime(CLOCK_MONOTONIC, &start);
+		//sample until the duration has elapsed or max_samples are acquired (0 = no limit)
+		for (samples = 1; ; samples++) {
+			for (i = 0; i < data_length; i++) {
+				if (read_values(range_buffer[2+i], &value, 1) == NULL) { errno = EFAULT; CLIENT_ERROR("ERROR invalid address"); }
+				sample = value & 0x3FFF;
+				if (sample & 0x2000)
+					sample -= 0x4000;
+				sum[i] += sample;
+				sumsq[i] += sample * sample;
+				if (sample < min[i])
+					min[i] = sample;
+				if (sample > max[i])
+					max[i] = sample;
+			}
+			if (max_samples != 0 && samples >= max_samples)
+				break;
+			if (duration_ns == 0) {
+				if (max_samples == 0)
+					break;
+			}
+			else if ((samples & 0xF) == 0) { //do not query the clock for every sample
+				clock_gettime(CLOCK_MONOTONIC, &now);
+				if ((uint64_t)(now.tv_sec - start.tv_sec) * 1000000000ULL + now.tv_nsec - start.tv_nsec >= duration_ns)
+					break;
+			}
+		}
+		//one record of 8 unsigned long per signal: count, reserved, sum (low and high word),
+		//sum of squares (low and high word), min, max
+		for (i = 0; i < data_length; i++) {
+			rw_buffer[8*i] = samples;
+			rw_buffer[8*i+1] = 0;
+			rw_buffer[8*i+2] = (uint64_t)sum[i] & 0xFFFFFFFFUL;
+			rw_buffer[8*i+3] = (uint64_t)sum[i] >> 32;
+			rw_buffer[8*i+4] = sumsq[i] & 0xFFFFFFFFUL;
+			rw_buffer[8*i+5] = sumsq[i] >> 32;
+			rw_buffer[8*i+6] = (unsigned long)min[i];
+			rw_buffer[8*i+7] = (unsigned long)max[i];
+		}
+		n = send(client->fd,(void*)data_buffer,8*data_length*sizeof(unsigned long)+8,0);
+		if (n < 0) CLIENT_ERROR("ERROR writing to socket");
+		if (n != 8*data_length*sizeof(unsigned long)+8) CLIENT_ERROR("ERROR wrote incorrect number of bytes to socket");
+	 }
+	 else if (buffer[0] == 'c') return 1; //close connection
+	 else CLIENT_ERROR("ERROR unknown control character - server and client out of sync"); //if an unknown control sequence is received, drop the connection for security reasons
+	 return 0;
+}
+
+int main(int argc, char *argv[])
+{
+     int portno;
+     int c, nclients, maxfd, result;
+     fd_set readfds;
+     struct timespec start, stop;
+     socklen_t clilen;
      struct sockaddr_in serv_addr, cli_addr;
-     int n;
      if (argc < 2) {
          fprintf(stderr,"ERROR, no port provided\n");
          exit(1);
      }
+     //optional argument -r: map the FPGA memory for each request (legacy mode)
+     if (argc > 2 && strcmp(argv[2], "-r") == 0)
+         persistent_mapping = 0;
+     for (c = 0; c < MAX_CLIENTS; c++)
+         clients[c].fd = -1;
      sockfd = socket(AF_INET, SOCK_STREAM, 0);
      if (sockfd < 0) 
         error("ERROR opening socket");
@@ -185,56 +558,58 @@ int main(int argc, char *argv[])
               sizeof(serv_addr)) < 0) 
               error("ERROR on binding");
      listen(sockfd,5);
-     clilen = sizeof(cli_addr);
-     newsockfd = accept(sockfd, 
-                 (struct sockaddr *) &cli_addr, 
-                 &clilen);
-     if (newsockfd < 0) 
-          error("ERROR on accept");
-	 else
-		 printf("Incoming client connection accepted!");
 	
-	//open_map_base();
-	 //service loop
+	if (persistent_mapping)
+		open_map_base();
+	 //service loop: wait for new connections and requests of all clients
+	 nclients = 0;
      while (0==0) {
-		 //read next header from client
-		 bzero(buffer,8);
-		 n = recv(newsockfd,buffer,8,MSG_WAITALL);
-		 if (n < 0) error("ERROR reading from socket");
-		 if (n != 8) error("ERROR reading from socket - incorrect header length");
-		 //confirm control sequence
-	 ////n=send(newsockfd,buffer,8,0); 
-	 ////if (n != 8) error("ERROR control sequence mirror incorreclty transmitted");
-	     //interpret the header
-    	 address = ((unsigned long*)buffer)[1]; //address to be read/written
-		 data_length = buffer[2]+(buffer[3]<<8); //number of "unsigned long" to be read/written
-		 if (data_length > MAX_LENGTH)
-			 data_length = MAX_LENGTH;
-		 if (data_length == 0)
-			continue;
-		 //test for various cases Read, Write, Close
-		 else if (buffer[0] == 'r') { //read from FPGA
-			read_values(address, rw_buffer, data_length);
-			//send the data
-			n = send(newsockfd,(void*)data_buffer,data_length*sizeof(unsigned long)+8,0);
-			if (n < 0) error("ERROR writing to socket");
-			if (n != data_length*sizeof(unsigned long)+8) error("ERROR wrote incorrect number of bytes to socket");
+		 FD_ZERO(&readfds);
+		 FD_SET(sockfd, &readfds);
+		 maxfd = sockfd;
+		 for (c = 0; c < MAX_CLIENTS; c++) {
+			 if (clients[c].fd >= 0) {
+				 FD_SET(clients[c].fd, &readfds);
+				 if (clients[c].fd > maxfd)
+					 maxfd = clients[c].fd;
+			 }
+		 }
+		 if (select(maxfd+1, &readfds, NULL, NULL, NULL) < 0) {
+			 if (errno == EINTR)
+				 continue;
+			 error("ERROR on select");
 		 }
-		 else if  (buffer[0] == 'w') { //write to FPGA
-			//read new data from socket
-			n = recv(newsockfd,(void*)rw_buffer,data_length*sizeof(unsigned long),MSG_WAITALL);
-			if (n < 0) error("ERROR reading from socket");
-			if (n != data_length*sizeof(unsigned long)) error("ERROR read incorrect number of bytes to socket");
-			//write FPGA memory
-			write_values(address, rw_buffer, data_length);
-			n=send(newsockfd,buffer,8,0);
-			if (n != 8) error("ERROR control sequence mirror incorreclty transmitted");
+		 if (FD_ISSET(sockfd, &readfds)) {
+			 clilen = sizeof(cli_addr);
+			 newsockfd = accept(sockfd, 
+						 (struct sockaddr *) &cli_addr, 
+						 &clilen);
+			 if (newsockfd < 0) 
+				  error("ERROR on accept");
+			 else if (open_connection(newsockfd) >= 0) {
+				 nclients++;
+				 printf("Incoming client connection accepted!");
+			 }
 		 }
-		 else if (buffer[0] == 'c') break; //close program
-		 else error("ERROR unknown control character - server and client out of sync"); //if an unknown control sequence is received, terminate for security reasons
+		 for (c = 0; c < MAX_CLIENTS; c++) {
+			 if (clients[c].fd >= 0 && FD_ISSET(clients[c].fd, &readfds)) {
+				 clock_gettime(CLOCK_MONOTONIC, &start);
+				 result = serve_request(&clients[c]);
+				 clock_gettime(CLOCK_MONOTONIC, &stop);
+				 //failed requests and disconnections are not served commands
+				 if (result == 0)
+					 record_stats(clients[c].data_buffer[0], &start, &stop);
+				 if (result != 0) {
+					 close_connection(c);
+					 nclients--;
+				 }
+			 }
+		 }
+		 //the server terminates once the last client has disconnected
+		 if (nclients == 0)
+			 break;
 	 }
 	 //close the socket
-     close(newsockfd); 
 	 close(sockfd);
 	 //clean up the memory mapping
 	 close_map_base();
@@ -243,7 +618,7 @@ int main(int argc, char *argv[])
 
 
 // old version with steady reinstantiation of mmap (slow)
-unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len) {
+unsigned long* read_values_remap(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len) {
     int fd = -1;
     if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
     map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, a_addr & ~MAP_MASK);
@@ -265,7 +640,7 @@ unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer,
 	return a_values_buffer;
 }
 
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
+void write_values_remap(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
     int fd = -1;
     if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
     map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, a_addr & ~MAP_MASK);
@@ -285,3 +660,26 @@ void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a
 		close(fd);
 	}
 }
+
+void write_masked_values_remap(unsigned long a_addr, unsigned long* a_values_and_masks, unsigned long a_len) {
+    int fd = -1;
+    if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
+    map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, a_addr & ~MAP_MASK);
+	if(map_base == (void *) -1) FATAL;
+	
+	void* virt_addr = map_base + (a_addr & MAP_MASK);
+	unsigned long i, value, mask;
+	for (i = 0; i < a_len; i++) {
+		value = a_values_and_masks[2*i];
+		mask = a_values_and_masks[2*i+1];
+		((unsigned long *) virt_addr)[i] = (((unsigned long *) virt_addr)[i] & ~mask) | (value & mask);
+	}
+	
+	if (map_base != (void*)(-1)) {
+		if(munmap(map_base, MAP_SIZE) == -1) FATAL;
+		map_base = (void*)(-1);
+	}
+	if (fd != -1) {
+		close(fd);
+	}
+}
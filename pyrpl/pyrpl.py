@@ -147,12 +147,16 @@ import logging
 import os
 import os.path as osp
 from shutil import copyfile
-from qtpy import QtCore, QtWidgets
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from qtpy import QtCore
 
-from .widgets.pyrpl_widget import PyrplWidget
+from .widgets import widget_class
+PyrplWidget = widget_class('pyrpl_widget', 'PyrplWidget')
 from . import software_modules
 from .memory import MemoryTree
-from .redpitaya import RedPitaya
+from .redpitaya import RedPitaya, defaultparameters
+from .errors import ExpectedPyrplError
 from . import pyrpl_utils
 from .software_modules import get_module
 from .async_utils import sleep
@@ -250,6 +254,15 @@ class Pyrpl(object):
                  config=None,
                  source=None,
                  **kwargs):
+        self._load_config(config, source, kwargs)
+        start = pyrpl_utils.time()
+        redpitaya = RedPitaya(config=self.c)
+        self._start(redpitaya, pyrpl_utils.time() - start)
+
+    def _load_config(self, config, source, kwargs):
+        """
+        loads the config file and writes kwargs to its redpitaya branch
+        """
         # logger initialisation
         self.logger = logging.getLogger(name='pyrpl') # default: __name__
         # use gui or commandline for questions?
@@ -257,6 +270,7 @@ class Pyrpl(object):
         # get config file if None is specified
         if config is None:
             if gui:
+                from qtpy import QtWidgets
                 self.logger.info("Please select or create a configuration "
                                  "file in the file selector window!")
                 config = QtWidgets.QFileDialog.getSaveFileName(
@@ -315,9 +329,19 @@ class Pyrpl(object):
         self.c._get_or_create('redpitaya')
         self.c.redpitaya._update(kwargs)
         self.name = pyrplbranch.name
-        self.rp = RedPitaya(config=self.c)
+
+    def _start(self, redpitaya, duration):
+        """
+        creates the software modules and the gui for the RedPitaya object,
+        whose startup took duration seconds
+        """
+        self.rp = redpitaya
         self.redpitaya = self.rp  # alias
         self.rp.parent=self
+        # duration of the startup stages in seconds
+        self.startup_times = OrderedDict(self.rp.startup_times)
+        self.startup_times['redpitaya'] = duration
+        start = pyrpl_utils.time()
         self.widgets = [] # placeholder for widgets
         # create software modules...
         self.load_software_modules()
@@ -336,9 +360,14 @@ class Pyrpl(object):
                 #                       'Error message: %s',
                 #                       module.name, module.name, self.c._filename, e)
                 #     raise e
+        self.startup_times['software_modules'] = pyrpl_utils.time() - start
         # make the gui if applicable
         if self.c.redpitaya.gui:
+            start = pyrpl_utils.time()
             self.show_gui()
+            self.startup_times['gui'] = pyrpl_utils.time() - start
+        self.logger.info("Startup times: %s", ", ".join(
+            "%s %.3f s" % item for item in self.startup_times.items()))
 
     def show_gui(self):
         if len(self.widgets) == 0:
@@ -423,3 +452,171 @@ class Pyrpl(object):
         # end redpitatya communication
         self.rp.end_all()
         sleep(0.1)
+
+
+class PyrplCluster(object):
+    """
+    Several Pyrpl instances, one per Red Pitaya board, that are started in
+    parallel and can be controlled as one object.
+
+    The steps of the startup that communicate with the boards over ssh
+    (connection, flashing of the FPGA, start of the server) run in one thread
+    per board, such that starting N boards takes about as long as starting
+    one. The clients, modules and widgets are then created in the calling
+    thread.
+
+    Parameters
+    ----------
+    configs: list of str
+        Names of the config files of the boards.
+    hostnames: list of str
+        If not None, the hostnames of the boards. Otherwise, the hostnames
+        must be specified in the config files.
+    source: str
+        Template config file for config files that do not exist yet.
+    **kwargs: dict
+        Additional arguments for all boards, see Pyrpl.
+
+    Usage example::
+
+        cluster = PyrplCluster(['lab1', 'lab2'],
+                               hostnames=['192.168.1.100', '192.168.1.101'])
+        cluster.setup('asg0', frequency=1e3, amplitude=0.5, output_direct='out1')
+        print(cluster.get('sampler.in1'))  # {'lab1': ..., 'lab2': ...}
+    """
+    def __init__(self, configs, hostnames=None, source=None, **kwargs):
+        self.logger = logging.getLogger(name='pyrpl')
+        if hostnames is None:
+            hostnames = [None] * len(configs)
+        if len(hostnames) != len(configs):
+            raise ExpectedPyrplError("PyrplCluster needs one hostname per "
+                                     "config file.")
+        pyrpls = []
+        for config, hostname in zip(configs, hostnames):
+            pyrpl = Pyrpl.__new__(Pyrpl)
+            boardkwargs = dict(kwargs)
+            if hostname is not None:
+                boardkwargs['hostname'] = hostname
+            pyrpl._load_config(config, source, boardkwargs)
+            # the startup threads cannot ask for missing hostnames
+            if not pyrpl.c.redpitaya._data.get('hostname'):
+                raise ExpectedPyrplError("Please specify the hostname of "
+                                         "the board of config file %s."
+                                         % config)
+            pyrpls.append(pyrpl)
+        self._executor = ThreadPoolExecutor(max_workers=len(pyrpls))
+        start = pyrpl_utils.time()
+        redpitayas = self._gather([self._executor.submit(self._connect, pyrpl)
+                                   for pyrpl in pyrpls])
+        self.pyrpls = OrderedDict()
+        for pyrpl, (redpitaya, duration) in zip(pyrpls, redpitayas):
+            clientstart = pyrpl_utils.time()
+            redpitaya._start_pending_client()
+            pyrpl._start(redpitaya,
+                         duration + pyrpl_utils.time() - clientstart)
+            self.pyrpls[pyrpl.name] = pyrpl
+        self.logger.info("Started %d boards in %.3f s.", len(self.pyrpls),
+                         pyrpl_utils.time() - start)
+
+    @staticmethod
+    def _connect(pyrpl):
+        """
+        returns a RedPitaya object for the config of pyrpl without client,
+        and the duration of its startup
+        """
+        start = pyrpl_utils.time()
+        # the boards need independent parameters
+        redpitaya = RedPitaya(config=pyrpl.c,
+                              parameters=dict(defaultparameters),
+                              start_client=False)
+        return redpitaya, pyrpl_utils.time() - start
+
+    def _gather(self, futures):
+        """
+        returns the results of futures, or raises the first exception after
+        all futures are done
+        """
+        results, error = [], None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BaseException as e:
+                self.logger.error("Error in parallel call: %s", e)
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+    def __getitem__(self, name):
+        return self.pyrpls[name]
+
+    def __iter__(self):
+        return iter(self.pyrpls.values())
+
+    def __len__(self):
+        return len(self.pyrpls)
+
+    @property
+    def names(self):
+        """ names of the Pyrpl instances (of their config files) """
+        return list(self.pyrpls.keys())
+
+    def _module(self, pyrpl, name):
+        """ returns the software or hardware module name of pyrpl """
+        if name in pyrpl.rp.modules:
+            return pyrpl.rp.modules[name]
+        return getattr(pyrpl, name)
+
+    def map(self, function, *args, **kwargs):
+        """
+        calls function(pyrpl, *args, **kwargs) for all Pyrpl instances in
+        parallel threads and returns an OrderedDict of the results, with the
+        names of the instances as keys. The function should only read from
+        the boards, since modules that start acquisitions or timers must be
+        configured in the main thread (see setup).
+        """
+        futures = [self._executor.submit(function, pyrpl, *args, **kwargs)
+                   for pyrpl in self]
+        return OrderedDict(zip(self.names, self._gather(futures)))
+
+    def get(self, attribute):
+        """
+        returns an OrderedDict with the value of attribute for all boards,
+        where attribute is given as 'module.attribute', e.g.
+        'sampler.in1'. The values are read in parallel.
+        """
+        module, attribute = attribute.split('.', 1)
+
+        def read(pyrpl):
+            value = self._module(pyrpl, module)
+            for name in attribute.split('.'):
+                value = getattr(value, name)
+            return value
+        return self.map(read)
+
+    def setup(self, module, **kwds):
+        """
+        calls setup(**kwds) of the module with name module for all boards.
+        The register writes of each board are coalesced in a transaction
+        (see RedPitaya.transaction), and the transactions are sent to the
+        boards in parallel.
+        """
+        transactions = [pyrpl.rp.transaction() for pyrpl in self]
+        try:
+            for pyrpl, transaction in zip(self, transactions):
+                transaction.__enter__()
+                self._module(pyrpl, module).setup(**kwds)
+        finally:
+            self._gather([self._executor.submit(transaction.__exit__,
+                                                None, None, None)
+                          for transaction in transactions
+                          if transaction.active])
+
+    def _clear(self):
+        """
+        kill all timers and closes the connections to all boards
+        """
+        for pyrpl in self:
+            pyrpl._clear()
+        self._executor.shutdown()
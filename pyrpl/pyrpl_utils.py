@@ -1,6 +1,9 @@
 import time
 from timeit import default_timer
+import atexit
 import logging
+import threading
+import weakref
 logger = logging.getLogger(__file__)
 from collections import OrderedDict, Counter
 
@@ -24,6 +27,53 @@ def time():
     """ returns the time. used instead of time.time for rapid portability"""
     return default_timer()
 
+class ThreadTimer(object):
+    """
+    A single-shot timer that calls function in a daemon thread interval
+    seconds after start(), used in place of a QTimer without a Qt event
+    loop (headless mode). Since function runs in another thread, it must
+    protect the data it shares with the main thread by a lock (see
+    MemoryTree._write_to_file). Pending calls are executed when the
+    interpreter exits.
+    """
+    _pending = weakref.WeakSet()
+
+    def __init__(self, interval, function):
+        self.interval = interval
+        self.function = function
+        self._timer = None
+
+    def isActive(self):
+        return self._timer is not None
+
+    def start(self):
+        self.stop()
+        self._timer = threading.Timer(self.interval, self._timeout)
+        self._timer.daemon = True
+        self._timer.start()
+        ThreadTimer._pending.add(self)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        ThreadTimer._pending.discard(self)
+
+    def _timeout(self):
+        self._timer = None
+        ThreadTimer._pending.discard(self)
+        self.function()
+
+    @classmethod
+    def _run_pending(cls):
+        for timer in list(cls._pending):
+            timer.stop()
+            timer.function()
+
+
+atexit.register(ThreadTimer._run_pending)
+
+
 def get_unique_name_list_from_class_list(cls_list):
     """
     returns a list of names using cls.name if unique or cls.name1, cls.name2... otherwise.
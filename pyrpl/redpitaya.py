@@ -16,14 +16,22 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###############################################################################
 
+from . import async_utils
 from . import redpitaya_client
+from . import redpitaya_emulator
 from . import hardware_modules as rp
 from .sshshell import SshShell
-from .pyrpl_utils import get_unique_name_list_from_class_list, update_with_typeconversion
+from .pyrpl_utils import get_unique_name_list_from_class_list, update_with_typeconversion, time
 from .memory import MemoryTree
+from .modules import RegisterTransaction, RegisterCache, RegisterProfiler
 from .errors import ExpectedPyrplError
-from .widgets.startup_widget import HostnameSelectorWidget
+from .widgets import widget_class
+HostnameSelectorWidget = widget_class('startup_widget',
+                                      'HostnameSelectorWidget')
 
+import copy
+import hashlib
+from contextlib import contextmanager
 import logging
 import os
 import random
@@ -43,7 +51,7 @@ except NameError:  # Python 3
 
 # default parameters for redpitaya object creation
 defaultparameters = dict(
-    hostname='', #'192.168.1.100', # the ip or hostname of the board, '' triggers gui
+    hostname='', #'192.168.1.100', # the ip or hostname of the board, '' triggers gui, 'localhost-mmap' maps the FPGA registers on the board itself, '_REPLAY_' replays record_file
     port=2222,  # port for PyRPL datacommunication
     sshport=22,  # port of ssh server - default 22
     user='root',
@@ -51,13 +59,25 @@ defaultparameters = dict(
     delay=0.05,  # delay between ssh commands - console is too slow otherwise
     autostart=True,  # autostart the client?
     reloadserver=False,  # reinstall the server at startup if not necessary?
-    reloadfpga=True,  # reload the fpga bitfile at startup?
+    reloadfpga=True,  # reload the fpga bitfile at startup (skipped if already flashed)?
     serverbinfilename='fpga.bin',  # name of the binfile on the server
     serverdirname = "//opt//pyrpl//",  # server directory for server app and bitfile
     leds_off=True,  # turn off all GPIO lets at startup (improves analog performance)
     frequency_correction=1.0,  # actual FPGA frequency is 125 MHz * frequency_correction
     timeout=1,  # timeout in seconds for ssh communication
     monitor_server_name='monitor_server',  # name of the server program on redpitaya
+    monitor_server_binary='',  # binary of monitor_server that runs on the board, detected by installserver if ''
+    server_timeout=2.0,  # maximum time in seconds for the server to accept connections after its start
+    pipelined_writes=False,  # do not wait for the acknowledgement of each write?
+    cache_registers=False,  # serve reads of non-volatile registers from the last written values?
+    profile_io=False,  # record statistics of the register accesses of each attribute (see io_profile)?
+    io_thread=False,  # serve all requests from a dedicated I/O thread (see ThreadedClient)?
+    bulk_connections=0,  # number of extra connections for long data transfers (see ClientPool)
+    mmap_filename='/dev/mem',  # memory file mapped with hostname='localhost-mmap' (see LocalMmapClient)
+    emulator_latency=0.0,  # reply delay in seconds of the network emulated with hostname='_EMULATED_'
+    emulator_bandwidth=0.0,  # bandwidth in bytes/s of the emulated network, 0 for no limit
+    emulator_version=2,  # protocol version of the emulated monitor_server, 1 for the servers without hello command
+    record_file='',  # file to record all register accesses to (see RecordingClient), replayed with hostname='_REPLAY_'
     silence_env=False,   # suppress all environment variables that may override the configuration?
     gui=True  # show graphical user interface or work on command-line only?
     )
@@ -68,6 +88,8 @@ class RedPitaya(object):
                   [rp.Pwm] * 2 + [rp.Iq] * 3 + [rp.Pid] * 3 + [rp.Trig] + [ rp.IIR]
 
     def __init__(self, config=None,  # configfile is needed to store parameters. None simulates one
+                 parameters=None,  # dict holding the parameters, None shares defaultparameters
+                 start_client=True,  # start the client and create the modules?
                  **kwargs):
         """ this class provides the basic interface to the redpitaya board
 
@@ -80,8 +102,19 @@ class RedPitaya(object):
 
         'config=None' specifies that no persistent config file is saved on the disc.
 
+        By default, all RedPitaya objects of a session share the dictionary
+        'defaultparameters' of this module. Interfaces to several boards
+        need independent parameters, e.g. 'parameters=dict(defaultparameters)'.
+
+        'start_client=False' only performs the steps of the startup that
+        communicate with the board over ssh (flashing of the FPGA, start of the
+        server). The client and the modules, which are Qt objects owned by the
+        thread that creates them, are then created by a later call of
+        _start_pending_client(). This allows PyrplCluster to start several
+        boards in parallel threads.
+
         Possible keyword arguments and their defaults are:
-            hostname='192.168.1.100', # the ip or hostname of the board
+            hostname='192.168.1.100', # the ip or hostname of the board, 'localhost-mmap' maps the FPGA registers on the board itself
             port=2222,  # port for PyRPL datacommunication
             sshport=22,  # port of ssh server - default 22
             user='root',
@@ -89,7 +122,7 @@ class RedPitaya(object):
             delay=0.05,  # delay between ssh commands - console is too slow otherwise
             autostart=True,  # autostart the client?
             reloadserver=False,  # reinstall the server at startup if not necessary?
-            reloadfpga=True,  # reload the fpga bitfile at startup?
+            reloadfpga=True,  # reload the fpga bitfile at startup (skipped if already flashed)?
             filename='fpga//red_pitaya.bin',  # name of the bitfile for the fpga, None is default file
             serverbinfilename='fpga.bin',  # name of the binfile on the server
             serverdirname = "//opt//pyrpl//",  # server directory for server app and bitfile
@@ -97,6 +130,18 @@ class RedPitaya(object):
             frequency_correction=1.0,  # actual FPGA frequency is 125 MHz * frequency_correction
             timeout=3,  # timeout in seconds for ssh communication
             monitor_server_name='monitor_server',  # name of the server program on redpitaya
+            monitor_server_binary='',  # binary of monitor_server that runs on the board, detected by installserver if ''
+            server_timeout=2.0,  # maximum time in seconds for the server to accept connections after its start
+            pipelined_writes=False,  # do not wait for the acknowledgement of each write?
+            cache_registers=False,  # serve reads of non-volatile registers from the last written values?
+            profile_io=False,  # record statistics of the register accesses of each attribute (see io_profile)?
+            io_thread=False,  # serve all requests from a dedicated I/O thread (see ThreadedClient)?
+            bulk_connections=0,  # number of extra connections for long data transfers (see ClientPool)
+            mmap_filename='/dev/mem',  # memory file mapped with hostname='localhost-mmap' (see LocalMmapClient)
+            emulator_latency=0.0,  # reply delay in seconds of the network emulated with hostname='_EMULATED_'
+            emulator_bandwidth=0.0,  # bandwidth in bytes/s of the emulated network, 0 for no limit
+            emulator_version=2,  # protocol version of the emulated monitor_server, 1 for the servers without hello command
+            record_file='',  # file to record all register accesses to (see RecordingClient), replayed with hostname='_REPLAY_'
             silence_env=False,   # suppress all environment variables that may override the configuration?
             gui=True  # show graphical user interface or work on command-line only?
 
@@ -115,7 +160,9 @@ class RedPitaya(object):
         # 3. config file
         # 4. command line arguments
         # 5. (if missing information) request from GUI or command-line
-        self.parameters = defaultparameters # BEWARE: By not copying the
+        if parameters is None:
+            parameters = defaultparameters
+        self.parameters = parameters # BEWARE: By not copying the
         # dictionary, defaultparameters are modified in the session (which
         # can be advantageous for instance with hostname in unit_tests)
 
@@ -181,16 +228,54 @@ class RedPitaya(object):
         # memorize whether server is running - nearly obsolete
         self._serverrunning = False
         self.client = None  # client class
+        self._async_client = None  # coroutine client (see async_client)
+        self._emulator = None  # emulated monitor_server (see startserver)
+        self._server_probe = None  # keeps the server alive (see _launchserver)
+        self.server_info = None  # reply of the server to the hello command
+        # (or redpitaya_client.LEGACY_SERVER_INFO for older servers)
+        # duration of the startup stages in seconds (see _startup_stage)
+        self.startup_times = OrderedDict()
+        self._pending_client = None  # start method of a deferred client
+        self._fpga_flash_skipped = False  # see _check_fpga_id
         self._slaves = []  # slave interfaces to same redpitaya
+        self._master = None  # the redpitaya interface this one is a slave of
         self.modules = OrderedDict()  # all submodules
+        self._transaction = RegisterTransaction(self)  # coalesces writes
+        # shadow of the register values (see RegisterCache)
+        self.register_cache = RegisterCache(
+            self, enabled=self.parameters['cache_registers'])
+        # statistics of the register accesses (see io_profile)
+        self.profiler = RegisterProfiler(enabled=self.parameters['profile_io'])
 
         # provide option to simulate a RedPitaya
         if self.parameters['hostname'] in ['_FAKE_REDPITAYA_', '_FAKE_']:
-            self.startdummyclient()
+            self._start_client(self.startdummyclient, start_client)
             self.logger.warning("Simulating RedPitaya because (hostname=="
                                 +self.parameters["hostname"]+"). Incomplete "
                                 "functionality possible. ")
             return
+        elif self.parameters['hostname'] in ['_EMULATED_']:
+            # serve the protocol of monitor_server for emulated registers
+            with self._startup_stage('server'):
+                self.startserver()
+            self._start_client(self.startclient, start_client)
+            self.logger.warning("Emulating RedPitaya because (hostname=="
+                                + self.parameters["hostname"] + "). "
+                                "Incomplete functionality possible. ")
+            return
+        elif self.parameters['hostname'] in ['_REPLAY_']:
+            # serve the register accesses of an earlier recording
+            self._start_client(self.startreplayclient, start_client)
+            self.logger.warning("Replaying the register accesses recorded in "
+                                "%s because (hostname==_REPLAY_). ",
+                                self.parameters['record_file'])
+            return
+        elif self.parameters['hostname'] in ['localhost-mmap']:
+            # running on the board itself: map the FPGA registers directly
+            self._start_client(self.startlocalclient, start_client)
+            self.logger.info("Accessing the FPGA registers through a memory "
+                             "mapping of %s.", self.parameters['mmap_filename'])
+            return
         elif self.parameters['hostname'] in ['_NONE_']:
             self.modules = []
             self.logger.warning("No RedPitaya created (hostname=="
@@ -198,14 +283,17 @@ class RedPitaya(object):
                                 " No hardware modules are available. ")
             return
         # connect to the redpitaya board
-        self.start_ssh()
+        with self._startup_stage('ssh'):
+            self.start_ssh()
         # start other stuff
         if self.parameters['reloadfpga']:  # flash fpga
-            self.update_fpga()
+            with self._startup_stage('fpga'):
+                self._fpga_flash_skipped = not self.update_fpga()
         if self.parameters['reloadserver']:  # reinstall server app
-            self.installserver()
+            with self._startup_stage('server'):
+                self.installserver()
         if self.parameters['autostart']:  # start client
-            self.start()
+            self.start(client=start_client)
         self.logger.info('Successfully connected to Redpitaya with hostname '
                          '%s.'%self.ssh.hostname)
         self.parent = self
@@ -263,33 +351,34 @@ class RedPitaya(object):
                 return True
 
     def switch_led(self, gpiopin=0, state=False):
-        self.ssh.ask("echo " + str(gpiopin) + " > /sys/class/gpio/export")
-        sleep(self.parameters['delay'])
-        self.ssh.ask(
-            "echo out > /sys/class/gpio/gpio" +
-            str(gpiopin) +
-            "/direction")
-        sleep(self.parameters['delay'])
         if state:
             state = "1"
         else:
             state = "0"
-        self.ssh.ask("echo " + state + " > /sys/class/gpio/gpio" +
-            str(gpiopin) + "/value")
-        sleep(self.parameters['delay'])
+        self.ssh.ask_sync(
+            "echo " + str(gpiopin) + " > /sys/class/gpio/export\n"
+            "echo out > /sys/class/gpio/gpio" + str(gpiopin) + "/direction\n"
+            "echo " + state + " > /sys/class/gpio/gpio" + str(gpiopin) +
+            "/value")
 
-    def update_fpga(self, filename=None):
+    def update_fpga(self, filename=None, force=False):
+        """
+        flashes the FPGA with the bitfile filename (defaults to the
+        parameter 'filename') and returns True. Unless force is True,
+        nothing is done and False is returned if the FPGA has already been
+        flashed with an identical bitfile since the last boot of the board.
+
+        The marker file on the board cannot tell whether another program,
+        e.g. a web application of the Red Pitaya, has loaded a different
+        bitfile since. In this case, force=True is required.
+        """
         if filename is None:
             try:
                 source = self.parameters['filename']
             except KeyError:
                 source = None
-        self.end()
-        sleep(self.parameters['delay'])
-        self.ssh.ask('rw')
-        sleep(self.parameters['delay'])
-        self.ssh.ask('mkdir ' + self.parameters['serverdirname'])
-        sleep(self.parameters['delay'])
+        else:
+            source = filename
         if source is None or not os.path.isfile(source):
             if source is not None:
                 self.logger.warning('Desired bitfile "%s" does not exist. Using default file.',
@@ -302,6 +391,17 @@ class RedPitaya(object):
               "and filename=\"red_pitaya.bin\"! Current dirname: "
               + self.parameters['dirname'] +
               " current filename: "+self.parameters['filename'])
+        digest = self._bitfile_digest(source)
+        if not force and self._fpga_marker() == digest:
+            self.logger.debug("FPGA already configured with bitfile %s.",
+                              source)
+            return False
+        # flashing resets all registers
+        self.register_cache.invalidate()
+        # the marker is only written once the flashing has completed
+        self._remove_fpga_marker()
+        self.ssh.ask_sync('rw')
+        self.ssh.ask_sync('mkdir ' + self.parameters['serverdirname'])
         for i in range(3):
             try:
                 self.ssh.scp.put(source,
@@ -315,68 +415,90 @@ class RedPitaya(object):
                 break
         # kill all other servers to prevent reading while fpga is flashed
         self.end()
-        self.ssh.ask('killall nginx')
-        self.ssh.ask('systemctl stop redpitaya_nginx') # for 0.94 and higher
-        self.ssh.ask('cat '
+        self.ssh.ask_sync('killall nginx')
+        self.ssh.ask_sync('systemctl stop redpitaya_nginx') # for 0.94 and higher
+        # the fpga is configured once the command has terminated
+        self.ssh.ask_sync('cat '
                  + os.path.join(self.parameters['serverdirname'], self.parameters['serverbinfilename'])
-                 + ' > //dev//xdevcfg')
-        sleep(self.parameters['delay'])
-        self.ssh.ask('rm -f '+ os.path.join(self.parameters['serverdirname'], self.parameters['serverbinfilename']))
-        self.ssh.ask("nginx -p //opt//www//")
-        self.ssh.ask('systemctl start redpitaya_nginx')  # for 0.94 and higher #needs test
-        sleep(self.parameters['delay'])
-        self.ssh.ask('ro')
-
-    def fpgarecentlyflashed(self):
-        self.ssh.ask()
-        result =self.ssh.ask("echo $(($(date +%s) - $(date +%s -r \""
-        + os.path.join(self.parameters['serverdirname'], self.parameters['serverbinfilename']) +"\")))")
-        age = None
+                 + ' > //dev//xdevcfg', timeout=10.)
+        self.ssh.ask_sync('rm -f '+ os.path.join(self.parameters['serverdirname'], self.parameters['serverbinfilename']))
+        self.ssh.ask_sync("nginx -p //opt//www//")
+        self.ssh.ask_sync('systemctl start redpitaya_nginx')  # for 0.94 and higher #needs test
+        self.ssh.ask_sync('ro')
+        self._write_fpga_marker(digest)
+        return True
+
+    # file on the board with the digest of the last flashed bitfile and the
+    # boot id of the board at that time (a reboot resets the fpga)
+    _FPGA_MARKER = '/tmp/pyrpl_fpga_bitfile'
+
+    @staticmethod
+    def _bitfile_digest(filename):
+        """ returns the md5 hexdigest of the bitfile filename """
+        with open(filename, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def _fpga_marker(self):
+        """
+        returns the digest of the bitfile flashed since the last boot of
+        the board, or None if unknown
+        """
+        result = self.ssh.ask_sync("echo pyrpl_fpga "
+                              "$(cat /proc/sys/kernel/random/boot_id) "
+                              "$(cat " + self._FPGA_MARKER + " 2>/dev/null)")
         for line in result.split('\n'):
-            try:
-                age = int(line.strip())
-            except:
-                pass
-            else:
-                break
-        if not age:
-            self.logger.debug("Could not retrieve bitfile age from: %s",
-                            result)
-            return False
-        elif age > 10:
-            self.logger.debug("Found expired bitfile. Age: %s", age)
-            return False
-        else:
-            self.logger.debug("Found recent bitfile. Age: %s", age)
-            return True
+            words = line.split()
+            if words[:1] == ['pyrpl_fpga']:
+                # words = ['pyrpl_fpga', boot_id, digest, flash boot_id]
+                if len(words) == 4 and words[1] == words[3]:
+                    return words[2]
+        self.logger.debug("No valid FPGA marker found in: %s", result)
+        return None
+
+    def _write_fpga_marker(self, digest):
+        self.ssh.ask_sync("echo " + digest + " $(cat "
+                     "/proc/sys/kernel/random/boot_id) > " + self._FPGA_MARKER)
+
+    def _remove_fpga_marker(self):
+        self.ssh.ask_sync("rm -f " + self._FPGA_MARKER)
+
+    # binaries of monitor_server for the different versions of the
+    # RedPitaya OS, in the order in which they are tried
+    monitor_server_binaries = ['monitor_server', 'monitor_server_0.95']
 
     def installserver(self):
+        """
+        uploads and starts the binary of monitor_server that runs on the
+        board and returns the port of the server, or None. The working binary
+        is remembered in the parameter monitor_server_binary (and the config
+        file), such that it is tried first at the next installation.
+        """
         self.endserver()
-        sleep(self.parameters['delay'])
-        self.ssh.ask('rw')
-        sleep(self.parameters['delay'])
-        self.ssh.ask('mkdir ' + self.parameters['serverdirname'])
-        sleep(self.parameters['delay'])
-        self.ssh.ask("cd " + self.parameters['serverdirname'])
-        #try both versions
-        for serverfile in ['monitor_server','monitor_server_0.95']:
-            sleep(self.parameters['delay'])
+        self.ssh.ask_sync('rw')
+        self.ssh.ask_sync('mkdir ' + self.parameters['serverdirname'])
+        self.ssh.ask_sync("cd " + self.parameters['serverdirname'])
+        binaries = list(self.monitor_server_binaries)
+        cached = self.parameters['monitor_server_binary']
+        if cached in binaries:
+            binaries.remove(cached)
+            binaries.insert(0, cached)
+        for serverfile in binaries:
+            self.server_info = None  # the binaries may differ in version
             try:
                 self.ssh.scp.put(
                     os.path.join(os.path.abspath(os.path.dirname(__file__)), 'monitor_server', serverfile),
                     self.parameters['serverdirname'] + self.parameters['monitor_server_name'])
             except (SCPException, SSHException):
                 self.logger.exception("Upload error. Try again after rebooting your RedPitaya..")
-            sleep(self.parameters['delay'])
-            self.ssh.ask('chmod 755 ./'+self.parameters['monitor_server_name'])
-            sleep(self.parameters['delay'])
-            self.ssh.ask('ro')
-            result = self.ssh.ask("./"+self.parameters['monitor_server_name']+" "+ str(self.parameters['port']))
-            sleep(self.parameters['delay'])
-            result += self.ssh.ask()
-            if not "sh" in result:
-                self.logger.debug("Server application started on port %d",
-                              self.parameters['port'])
+            self.ssh.ask_sync('chmod 755 ./'+self.parameters['monitor_server_name'])
+            self.ssh.ask_sync('ro')
+            if self._launchserver():
+                self.logger.debug("Server application %s started on port %d",
+                                  serverfile, self.parameters['port'])
+                if serverfile != cached:
+                    self.parameters['monitor_server_binary'] = serverfile
+                    self.c.redpitaya.monitor_server_binary = serverfile
+                self._serverrunning = True
                 return self.parameters['port']
             else: # means we tried the wrong binary version. make sure server is not running and try again with next file
                 self.endserver()
@@ -391,52 +513,279 @@ class RedPitaya(object):
         return None
 
     def startserver(self):
+        if self._shares_server:
+            # reconnect only, the master restarts the server if necessary
+            return self._server_port
+        if self._emulated:
+            return self._startemulator()
         self.endserver()
-        sleep(self.parameters['delay'])
-        if self.fpgarecentlyflashed():
-            self.logger.info("FPGA is being flashed. Please wait for 2 "
-                            "seconds.")
-            sleep(2.0)
-        result = self.ssh.ask(self.parameters['serverdirname']+"/"+self.parameters['monitor_server_name']
-                          +" "+ str(self.parameters['port']))
-        if not "sh" in result: # sh in result means we tried the wrong binary version
+        if self._launchserver():
             self.logger.debug("Server application started on port %d",
                               self.parameters['port'])
             self._serverrunning = True
             return self.parameters['port']
-        #something went wrong
+        #something went wrong, e.g. wrong binary version
         return self.installserver()
 
+    def _launchserver(self):
+        """
+        starts the installed monitor_server in the ssh shell and polls its
+        port until it accepts connections. Returns True on success and False
+        if the server program terminated (e.g. the wrong binary for the OS
+        of the board) or did not accept connections within the parameter
+        server_timeout.
+
+        The first connection (self._server_probe) asks the server for its
+        version (see server_info) and stays open until endserver, because
+        monitor_server terminates when its last client disconnects.
+
+        Servers before version 2 ignore the hello command and serve a single
+        client only, which must be the client of this interface. They are
+        therefore relaunched without any probe connection.
+        """
+        terminated = self.ssh.launch(
+            self.parameters['serverdirname'] + "/" +
+            self.parameters['monitor_server_name'] + " " +
+            str(self.parameters['port']))
+        if self.server_info is not None and self.server_info['version'] < 2:
+            # the client connection is retried if the server is not ready
+            sleep(self.parameters['delay'])
+            return not terminated()
+        deadline = time() + self.parameters['server_timeout']
+        while time() < deadline:
+            if terminated():
+                self.logger.debug("Server application terminated at "
+                                  "startup.")
+                return False
+            try:
+                probe = socket.create_connection(
+                    (self._server_hostname, self._server_port), timeout=0.1)
+            except socket.error:  # the port is not open yet
+                sleep(0.005)
+                continue
+            self._server_probe = probe
+            # older servers do not reply at all
+            probe.settimeout(0.5)
+            try:
+                self.server_info = redpitaya_client.server_hello(probe)
+            except socket.error:  # no reply within the probe timeout
+                self.logger.warning("The server application on the board "
+                                    "does not know the hello command. The "
+                                    "client is restricted to the commands of "
+                                    "older versions. Please recompile "
+                                    "monitor_server for faster transfers.")
+                self.server_info = dict(redpitaya_client.LEGACY_SERVER_INFO)
+                # closing the probe terminates the server
+                self.endserver()
+                return self._launchserver()
+            if self.server_info is None:  # not a monitor_server
+                self.logger.error("Unexpected reply to the hello command "
+                                  "on port %d.", self.parameters['port'])
+                return False
+            self.logger.debug("Server application ready: %s",
+                              self.server_info)
+            return True
+        self.logger.debug("Server application did not accept connections "
+                          "within %s s.", self.parameters['server_timeout'])
+        return False
+
+    @property
+    def server_version(self):
+        """
+        protocol version of the monitor_server, 1 for servers without the
+        hello command (see server_info). The clients only use the commands
+        supported by this version.
+        """
+        if self.server_info is None:
+            return redpitaya_client.LEGACY_SERVER_INFO['version']
+        return self.server_info['version']
+
+    @property
+    def _single_client_server(self):
+        """
+        True if the monitor_server accepts only one connection (servers
+        before version 2), such that slaves, the async_client and bulk
+        connections cannot connect to it
+        """
+        info = self.server_info or redpitaya_client.LEGACY_SERVER_INFO
+        return info['max_clients'] < 2
+
+    @property
+    def _emulated(self):
+        """ True if the monitor_server is emulated (hostname '_EMULATED_') """
+        return self.parameters['hostname'] == '_EMULATED_'
+
+    @property
+    def _server_hostname(self):
+        return '127.0.0.1' if self._emulated else self.parameters['hostname']
+
+    @property
+    def _server_port(self):
+        if self._emulated and self._emulator is not None:
+            return self._emulator.port
+        return self.parameters['port']
+
+    def _startemulator(self):
+        """ (re-)starts the emulated monitor_server and returns its port """
+        registers = None
+        if self._emulator is not None:
+            self._emulator.stop()
+            # the emulated FPGA keeps its register values
+            registers = self._emulator.registers
+        self._emulator = redpitaya_emulator.EmulatorServer(
+            latency=self.parameters['emulator_latency'],
+            bandwidth=self.parameters['emulator_bandwidth'],
+            registers=registers,
+            version=self.parameters['emulator_version'])
+        port = self._emulator.start()
+        self.server_info = self._emulator.info
+        self.logger.debug("Emulated server started on port %d", port)
+        self._serverrunning = True
+        return port
+
+    @property
+    def _shares_server(self):
+        """ True for slaves that use the monitor_server of their master """
+        return self._master is not None and \
+               self.parameters is self._master.parameters
+
     def endserver(self):
+        if self._shares_server:
+            return  # the server belongs to the master
+        if self._emulated:
+            if self._emulator is not None:
+                self._emulator.stop()
+            return
+        if self._server_probe is not None:
+            self._server_probe.close()
+            self._server_probe = None
         try:
-            self.ssh.ask('\x03') #exit running server application
+            self.ssh.write('\x03') #exit running server application
         except:
             self.logger.exception("Server not responding...")
-        if 'pitaya' in self.ssh.ask():
-            self.logger.debug('>') # formerly 'console ready'
-        sleep(self.parameters['delay'])
         # make sure no other monitor_server blocks the port
-        self.ssh.ask('killall ' + self.parameters['monitor_server_name'])
+        self.ssh.ask_sync('killall ' + self.parameters['monitor_server_name'])
         self._serverrunning = False
 
     def endclient(self):
+        if isinstance(self.client, (redpitaya_client.ThreadedClient,
+                                    redpitaya_client.ClientPool,
+                                    redpitaya_client.RecordingClient)):
+            self.client.close()
         del self.client
         self.client = None
+        self._endasyncclient()
+
+    @property
+    def async_client(self):
+        """
+        client whose methods reads, reads_int16, writes and writes_masked
+        are coroutines to be awaited within the event loop (see
+        :obj:`pyrpl.redpitaya_client.AsyncMonitorClient`). It uses its own
+        connection to the monitor_server. Servers that accept only one
+        connection are accessed through the blocking client instead.
+        """
+        if self._async_client is None:
+            # the accesses of the async_client are not recorded
+            client = self._unrecorded_client()
+            if isinstance(client, (redpitaya_client.DummyClient,
+                                   redpitaya_client.LocalMmapClient,
+                                   redpitaya_client.ReplayClient)) \
+                    or self._single_client_server:
+                self._async_client = redpitaya_client.AsyncDummyClient(
+                    client)
+            else:
+                self._async_client = redpitaya_client.AsyncMonitorClient(
+                    self._server_hostname, self._server_port)
+        return self._async_client
+
+    def _unrecorded_client(self):
+        """ returns the client without the RecordingClient wrapper """
+        if isinstance(self.client, redpitaya_client.RecordingClient):
+            return self.client.client
+        return self.client
+
+    def _startrecording(self):
+        """ records the register accesses to the file record_file, except
+        for slave interfaces, which would overwrite it """
+        if self.parameters['record_file'] and self._master is None:
+            self.client = redpitaya_client.RecordingClient(
+                self.client, self.parameters['record_file'])
+
+    def _endasyncclient(self):
+        if self._async_client is not None:
+            self._async_client.close()
+            self._async_client = None
+
+    def start(self, client=True):
+        """
+        starts the server and the client. With client=False, the client is
+        only started by a later call of _start_pending_client().
+        """
+        if self.parameters['leds_off'] and not self._emulated:
+            with self._startup_stage('leds'):
+                self.switch_led(gpiopin=0, state=False)
+                self.switch_led(gpiopin=7, state=False)
+        # the server accepts connections when startserver returns
+        with self._startup_stage('server'):
+            self.startserver()
+        self._start_client(self.startclient, client)
+
+    def _start_client(self, startclient, now=True):
+        """
+        calls the method startclient, or defers the call to
+        _start_pending_client() if now is False
+        """
+        if not now:
+            self._pending_client = startclient
+            return
+        with self._startup_stage('client'):
+            startclient()
+        self._check_fpga_id()
+
+    def _start_pending_client(self):
+        """ starts the client deferred by start_client=False """
+        startclient, self._pending_client = self._pending_client, None
+        if startclient is not None:
+            self._start_client(startclient)
+
+    def _check_fpga_id(self):
+        """
+        flashes the FPGA again if the flashing at startup was skipped, but the
+        board does not run the bitfile of pyrpl.
 
-    def start(self):
-        if self.parameters['leds_off']:
-            self.switch_led(gpiopin=0, state=False)
-            self.switch_led(gpiopin=7, state=False)
-        self.startserver()
-        sleep(self.parameters['delay'])
-        self.startclient()
+        This check is not sufficient to detect a foreign bitfile: the
+        bitfiles of the Red Pitaya web applications report the same device
+        ID. It only catches boards whose FPGA is not configured at all or
+        runs a bitfile of a different board type.
+        """
+        if self._fpga_flash_skipped:
+            self._fpga_flash_skipped = False
+            if self.hk.id != 'release1':
+                # the marker is outdated, e.g. the fpga was flashed by
+                # other means since
+                self.logger.warning("Unexpected FPGA device ID %s, "
+                                    "flashing the FPGA again.", self.hk.id)
+                self.update_fpga(force=True)
+                self.start()
+
+    @contextmanager
+    def _startup_stage(self, name):
+        """ adds the duration of the enclosed code to startup_times[name] """
+        start = time()
+        try:
+            yield
+        finally:
+            self.startup_times[name] = self.startup_times.get(name, 0.) \
+                                       + time() - start
 
     def end(self):
         self.endserver()
         self.endclient()
 
     def end_ssh(self):
-        self.ssh.channel.close()
+        if hasattr(self, 'ssh'):  # simulated boards have no ssh connection
+            self.ssh.channel.close()
 
     def end_all(self):
         self.end()
@@ -463,15 +812,95 @@ class RedPitaya(object):
     "LICENSE" in the source directory for details.\r\n""")
 
     def startclient(self):
+        self.register_cache.invalidate()
+        self._endasyncclient()
         self.client = redpitaya_client.MonitorClient(
-            self.parameters['hostname'], self.parameters['port'], restartserver=self.restartserver)
+            self._server_hostname, self._server_port, restartserver=self.restartserver,
+            pipelined=self.parameters['pipelined_writes'],
+            server_version=self.server_version)
+        if self._io_thread:
+            self.client = redpitaya_client.ThreadedClient(self.client)
+        if self.parameters['bulk_connections'] > 0 \
+                and self._single_client_server:
+            self.logger.warning("The monitor_server of version %d accepts "
+                                "only one connection, bulk_connections=%d "
+                                "is ignored.", self.server_version,
+                                self.parameters['bulk_connections'])
+        elif self.parameters['bulk_connections'] > 0:
+            self.client = redpitaya_client.ClientPool(
+                self.client, [self._startbulkclient()
+                              for i in range(self.parameters['bulk_connections'])])
+        self._startrecording()
         self.makemodules()
         self.logger.debug("Client started successfully. ")
 
+    def _startbulkclient(self):
+        """ returns an additional client for long data transfers """
+        client = redpitaya_client.MonitorClient(
+            self._server_hostname, self._server_port,
+            # reconnect only, the control channel restarts the server
+            restartserver=lambda: self._server_port,
+            server_version=self.server_version)
+        if self._io_thread:
+            client = redpitaya_client.ThreadedClient(client)
+        return client
+
+    @property
+    def _io_thread(self):
+        # the coroutines of a threaded event loop (see async_utils) share
+        # the connection with the calling thread
+        return self.parameters['io_thread'] or async_utils.BACKEND.threaded
+
+    def startlocalclient(self):
+        self.register_cache.invalidate()
+        self._endasyncclient()
+        self.client = redpitaya_client.LocalMmapClient(
+            self.parameters['mmap_filename'])
+        self._startrecording()
+        self.makemodules()
+
     def startdummyclient(self):
+        self._endasyncclient()
         self.client = redpitaya_client.DummyClient()
+        self._startrecording()
+        self.makemodules()
+
+    def startreplayclient(self):
+        self.register_cache.invalidate()
+        self._endasyncclient()
+        self.client = redpitaya_client.ReplayClient(
+            self.parameters['record_file'])
         self.makemodules()
 
+    def io_profile(self, sort='time'):
+        """
+        Returns a pandas DataFrame with the number of requests, bytes and
+        latencies of the register accesses of each module.attribute, sorted
+        by the column sort (see :obj:`pyrpl.modules.RegisterProfiler`).
+        Accesses are only recorded if the parameter profile_io is True or
+        within the context manager io_profiling().
+        """
+        return self.profiler.table(sort=sort)
+
+    def io_profiling(self):
+        """
+        Returns a context manager that records the register accesses of a
+        code block. Usage example::
+
+            with redpitaya.io_profiling() as profiler:
+                redpitaya.scope.curve()
+            print(profiler.table())
+        """
+        return self.profiler
+
+    def transaction(self):
+        """
+        Returns a context manager that coalesces the register writes of all
+        modules into as few requests as possible. See
+        :obj:`pyrpl.modules.RegisterTransaction`.
+        """
+        return self._transaction
+
     def makemodule(self, name, cls):
         module = cls(self, name)
         setattr(self, name, module)
@@ -486,6 +915,40 @@ class RedPitaya(object):
             self.makemodule(name, cls)
 
     def make_a_slave(self, port=None, monitor_server_name=None, gui=False):
+        """
+        Returns another interface to the same board, e.g. for use in a
+        different thread.
+
+        By default, the slave connects a new client to the monitor_server of
+        this interface, which serves several clients at once. If port or
+        monitor_server_name is specified, or if the server accepts only one
+        connection (version 1), a separate server is launched for the slave
+        instead.
+        """
+        client = self._unrecorded_client()
+        shares_server = isinstance(client, (
+            redpitaya_client.DummyClient, redpitaya_client.ReplayClient,
+            redpitaya_client.LocalMmapClient)) \
+            or not self._single_client_server
+        if port is None and monitor_server_name is None and shares_server:
+            r = copy.copy(self)  # shares parameters, ssh and register_cache
+            r._master = self
+            # the slave must not modify the config file of its master
+            r.c = MemoryTree(None)
+            r._slaves = []
+            r._async_client = None
+            r.modules = OrderedDict()
+            r._transaction = RegisterTransaction(r)
+            # slaves of a replayed interface are simulated
+            if isinstance(client, (redpitaya_client.DummyClient,
+                                   redpitaya_client.ReplayClient)):
+                r.startdummyclient()
+            elif isinstance(client, redpitaya_client.LocalMmapClient):
+                r.startlocalclient()
+            else:
+                r.startclient()
+            self._slaves.append(r)
+            return r
         if port is None:
             port = self.parameters['port'] + len(self._slaves)*10 + 1
         if monitor_server_name is None:
@@ -498,7 +961,16 @@ class RedPitaya(object):
                          reloadserver=False,
                          monitor_server_name=monitor_server_name,
                          silence_env=True))
-        r = RedPitaya(**slaveparameters) #gui=gui)
+        # the slave must not modify the parameters of its master
+        r = RedPitaya(parameters=slaveparameters, start_client=False)
         r._master = self
+        if self._emulated and self._emulator is not None:
+            # the emulated server of the slave accesses the same registers
+            r._emulator.registers = self._emulator.registers
+            r.startserver()
+        # master and slaves must see each other's register writes
+        r.register_cache = self.register_cache
+        r.profiler = self.profiler
+        r._start_pending_client()
         self._slaves.append(r)
         return r
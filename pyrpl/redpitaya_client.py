@@ -18,8 +18,21 @@
 
 
 import numpy as np
+import asyncio
+import ctypes
+import mmap
+import os
 import socket
+import select
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+try:
+    from queue import PriorityQueue
+except ImportError:  # Python 2
+    from Queue import PriorityQueue
 try:
     raise  # disable sound output for now
     from pysine import sine  # for debugging read/write calls
@@ -33,14 +46,89 @@ from .pyrpl_utils import time
 # only used for debugging purposes
 CLIENT_NUMBER = 0
 
+# FPGA address space, as mapped by monitor_server
+FPGA_BASE = 0x40000000
+FPGA_SIZE = 0x800000
+# maximum number of 32-bit words per request of monitor_server
+MAX_LENGTH = 65535
+# maximum number of address ranges per gather-read request
+MAX_RANGES = MAX_LENGTH // 2
+# maximum number of signals per sampler statistics request
+MAX_STATS_SIGNALS = 64
+# version of the monitor_server protocol, reported by the hello command
+SERVER_VERSION = 2
+# maximum number of simultaneous connections of monitor_server
+MAX_CLIENTS = 16
+# fields of the reply of monitor_server to the hello command
+HELLO_FIELDS = ['version', 'max_length', 'max_clients', 'persistent_mapping']
+# properties of the servers before version 2 (e.g. the shipped binaries of
+# older pyrpl versions), which do not know the hello command: they only
+# serve the commands 'r', 'w' and 'c', a single client, and terminate at
+# any other command
+LEGACY_SERVER_INFO = dict(version=1, max_length=MAX_LENGTH, max_clients=1,
+                          persistent_mapping=0)
+# record returned by monitor_server for each signal of a statistics request
+STATS_DTYPE = np.dtype(dict(names=['count', 'sum', 'sumsq', 'min', 'max'],
+                            formats=['<u4', '<i8', '<u8', '<i4', '<i4'],
+                            offsets=[0, 8, 16, 24, 28],
+                            itemsize=32))
+# maximum number of unacknowledged writes in pipelined mode (the 8-bit
+# sequence number in the reserved header byte must not wrap around)
+MAX_PENDING_WRITES = 255
+# interval in seconds at which drain() polls for acknowledgements
+DRAIN_POLL_INTERVAL = 0.0005
+# priorities of the requests of ThreadedClient (lowest value first): writes
+# go ahead of register reads, which go ahead of long data transfers
+IO_PRIORITY_WRITE = 0
+IO_PRIORITY_READ = 1
+IO_PRIORITY_BULK = 2
+# reads of at least this number of registers are long data transfers
+BULK_READ_LENGTH = 1024
+# number of registers per request of long reads on a bulk channel of
+# ClientPool (the server serves the other clients between two requests)
+BULK_CHUNK_LENGTH = 4096
+# header of each register access in the files of RecordingClient, followed
+# by nbytes of payload (the reply of reads, the values of writes)
+RECORD_DTYPE = np.dtype([('time', '<f8'), ('duration', '<f4'), ('op', 'S1'),
+                         ('addr', '<u4'), ('length', '<u4'),
+                         ('nbytes', '<u4')])
+
+
+def server_hello(sock):
+    """
+    sends the hello command of monitor_server over the connected socket
+    sock and returns the reply as a dict with the keys HELLO_FIELDS, or None
+    if the reply is out of sync. Raises socket.error if the server closes
+    the connection, as servers older than version 2 do.
+    """
+    header = b'h' + bytes(bytearray(7))
+    sock.sendall(header)
+    reply = b''
+    while len(reply) < 8 + 4 * len(HELLO_FIELDS):
+        data = sock.recv(8 + 4 * len(HELLO_FIELDS) - len(reply))
+        if not data:
+            raise socket.error("Connection closed by server")
+        reply += data
+    if reply[:8] != header:
+        return None
+    values = np.frombuffer(reply[8:], dtype='<u4')
+    return dict(zip(HELLO_FIELDS, [int(v) for v in values]))
+
 
 class MonitorClient(object):
-    def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None):
+    def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None,
+                 pipelined=False, server_version=SERVER_VERSION):
         """initiates a client connected to monitor_server
 
         hostname: server address, e.g. "localhost" or "192.168.1.0"
         port:    the port that the server is running on. 2222 by default
         restartserver: a function to call that restarts the server in case of problems
+        pipelined: if True, writes do not wait for the acknowledgement of
+            the server. Acknowledgements are verified later on, at the latest
+            by the next read or by a call to flush().
+        server_version: protocol version of the server (see server_hello).
+            With servers before version 2, all requests are performed with
+            the commands 'r' and 'w' only.
         """
         self.logger = logging.getLogger(name=__name__)
         # update global client counter and assign a number to this client
@@ -54,6 +142,13 @@ class MonitorClient(object):
         self._port = port
         self._read_counter = 0 # For debugging and unittests
         self._write_counter = 0 # For debugging and unittests
+        self.pipelined = pipelined
+        self.server_version = server_version
+        self._sequence_number = 0
+        self._pending_writes = deque()  # headers of unacknowledged writes
+        self._pending_echo = b''  # partially received acknowledgement
+        self._pipeline_errors = 0
+        self._header_buffer = bytearray(8)  # reused for every reply header
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # try to connect at least 5 times
         for i in range(5):
@@ -78,9 +173,13 @@ class MonitorClient(object):
             else:
                 break
         self.socket.settimeout(1.0)  # 1 second timeout for socket operations
+        # send small requests immediately instead of waiting for the
+        # acknowledgement of the previous ones (Nagle's algorithm)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def close(self):
         try:
+            self.flush()
             self.socket.send(
                 b'c' + bytes(bytearray([0, 0, 0, 0, 0, 0, 0])))
             self.socket.close()
@@ -91,50 +190,449 @@ class MonitorClient(object):
         self.close()
         
     # the public methods to use which will recover from connection problems
-    def reads(self, addr, length):
+    def reads(self, addr, length, out=None):
+        """
+        reads length registers starting at addr.
+
+        out: optional uint32 array with at least length elements that
+            receives the data without any intermediate copy. By default,
+            a new array is returned.
+
+        Reads longer than MAX_LENGTH are performed with a bulk transfer,
+        or with several requests for servers before version 2.
+        """
         self._read_counter+=1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(440, 0.05)
-        return self.try_n_times(self._reads, addr, length)
+        if length > MAX_LENGTH:
+            return self._reads_long(addr, length, out=out)
+        return self.try_n_times(self._reads, addr, length, out=out)
+
+    def reads_int16(self, addr, length, out=None):
+        """
+        reads length registers holding 14-bit signed samples (such as the
+        scope data buffers) and returns them as an array of int16. Only
+        2 bytes per sample are transferred.
+
+        out: optional int16 array with at least length elements that
+            receives the data without any intermediate copy.
+        """
+        if self.server_version < 2:
+            # 'p' is unknown: read full words and sign-extend on the host
+            out = self._output_array(length, np.int16, out)[:length]
+            data = self.reads(addr, length)
+            if data is None:
+                return None
+            out[:] = ((data & 0x3FFF) ^ 0x2000).astype(np.int32) - 0x2000
+            return out
+        self._read_counter += 1
+        if hasattr(self, '_sound_debug') and self._sound_debug:
+            sine(440, 0.05)
+        if length <= MAX_LENGTH:
+            return self.try_n_times(self._reads_int16, addr, length, out=out)
+        # one request per MAX_LENGTH samples
+        out = self._output_array(length, np.int16, out)[:length]
+        for start in range(0, length, MAX_LENGTH):
+            chunk = out[start:start + MAX_LENGTH]
+            if self.try_n_times(self._reads_int16, addr + 4 * start,
+                                len(chunk), out=chunk) is None:
+                return None
+        return out
 
     def writes(self, addr, values):
         self._write_counter += 1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(880, 0.05)
+        if len(values) > MAX_LENGTH - 2:
+            return self._writes_long(addr, values)
         return self.try_n_times(self._writes, addr, values)
-    
+
+    def reads_bulk(self, addr, length, out=None):
+        """
+        reads an arbitrary number of registers starting at addr with a
+        single request. The server streams the data in chunks, such that
+        whole address windows are transferred at wire speed.
+
+        out: optional uint32 array that receives the data (see reads)
+
+        Servers before version 2 do not know bulk transfers, the data is
+        then read with several requests of at most MAX_LENGTH registers.
+        """
+        self._read_counter += 1
+        return self._reads_long(addr, length, out=out)
+
+    def writes_bulk(self, addr, values):
+        """
+        writes an arbitrary number of values to the registers starting at
+        addr with a single request, acknowledged once all data has been
+        written. Servers before version 2 receive several requests instead.
+        """
+        self._write_counter += 1
+        return self._writes_long(addr, values)
+
+    def writes_masked(self, addr, values, masks):
+        """
+        writes only the bits selected by masks of the registers starting at
+        addr. The read-modify-write is performed by the server, i.e.
+        with a single request and without interference from other requests.
+        Servers before version 2 do not know this command, the
+        read-modify-write is then performed by the client. More than
+        MAX_RANGES registers are written with several requests.
+        """
+        if self.server_version < 2:
+            masks = np.asarray(masks, dtype=np.uint32)
+            old = self.reads(addr, len(masks))
+            if old is None:
+                return None
+            return self.writes(addr, (old & ~masks) |
+                               (np.asarray(values, dtype=np.uint32) & masks))
+        self._write_counter += 1
+        if hasattr(self, '_sound_debug') and self._sound_debug:
+            sine(880, 0.05)
+        values_and_masks = np.array([values, masks], dtype=np.uint32).T
+        for start in range(0, len(values_and_masks), MAX_RANGES):
+            if self.try_n_times(
+                    self._writes_masked, addr + 4 * start,
+                    values_and_masks[start:start + MAX_RANGES].flatten()) \
+                    is None:
+                return None
+        return True  # indicate successful write
+
+    def reads_many(self, ranges):
+        """
+        reads several non-contiguous address ranges with as few requests
+        to the server as possible.
+
+        ranges: list of (addr, length) tuples
+        returns a list of numpy arrays, one for each range, or None if the
+        server did not answer, like reads
+        """
+        ranges = [(int(addr), int(length)) for addr, length in ranges]
+        if self.server_version < 2:
+            # 'g' is unknown: one read request per range
+            results = [self.reads(addr, length) for addr, length in ranges]
+            if any(result is None for result in results):
+                return None
+            return results
+        results = []
+        # split the list into requests that fit into the server buffer
+        batch, batch_length = [], 0
+        for addr, length in ranges + [(None, None)]:
+            if addr is None or len(batch) >= MAX_RANGES \
+                    or batch_length + length > MAX_LENGTH:
+                if len(batch) == 1:
+                    results.append(self.reads(*batch[0]))
+                elif len(batch) > 1:
+                    self._read_counter += 1
+                    if hasattr(self, '_sound_debug') and self._sound_debug:
+                        sine(440, 0.05)
+                    values = self.try_n_times(self._reads_many, 0, batch)
+                    if values is None:
+                        return None
+                    results += values
+                batch, batch_length = [], 0
+            if addr is None:
+                break
+            elif length > MAX_LENGTH:  # too long for a gather-read
+                results.append(self.reads(addr, length))
+            else:
+                batch.append((addr, length))
+                batch_length += length
+        if any(result is None for result in results):
+            return None
+        return results
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        """
+        lets the server sample the 14-bit signed registers at addrs during
+        duration (in seconds) or until max_samples samples (0 for no limit)
+        are acquired, whatever comes first, and returns their statistics.
+
+        The result is a numpy array of dtype STATS_DTYPE with one record
+        (fields count, sum, sumsq, min and max in raw register units) per
+        address. All registers are sampled within the same loop iteration.
+        """
+        addrs = [int(addr) for addr in addrs]
+        if not addrs:
+            return np.zeros(0, dtype=STATS_DTYPE)
+        self._read_counter += 1
+        return self.try_n_times(self._reads_stats, addrs[0], addrs,
+                                duration=duration, max_samples=max_samples)
+
+    def server_stats(self, reset=False):
+        """
+        returns the service time statistics of the server for each command.
+
+        The result is a dict with the command characters as keys and dicts
+        with the entries 'count', 'total_time', 'mean_time', 'min_time'
+        and 'max_time' (in seconds) as values. The statistics are shared by
+        all clients of the server. If reset is True, they are reset after
+        the readout.
+        """
+        return self.try_n_times(self._server_stats, int(bool(reset)), None)
+
+    def hello(self):
+        """
+        returns the version of the server and its limits as a dict with
+        the keys HELLO_FIELDS (see server_hello)
+        """
+        return self.try_n_times(self._hello, 0, None)
+
+    def flush(self):
+        """
+        waits until all pending pipelined writes have been acknowledged by
+        the server.
+
+        returns True if all writes since the last flush were acknowledged
+        in sync, and False otherwise
+        """
+        self._collect_echoes(block=True)
+        errors, self._pipeline_errors = self._pipeline_errors, 0
+        if errors:
+            self.logger.error("%d pipelined writes of client %s were not "
+                              "acknowledged correctly by the server.",
+                              errors, self.client_number)
+        return errors == 0
+
+    async def drain(self):
+        """
+        coroutine version of flush, which waits for the acknowledgements
+        of the pending pipelined writes without blocking the event loop
+        """
+        timeout = self.socket.gettimeout()
+        deadline = time() + (timeout if timeout is not None else 1.0)
+        while self._pending_writes and time() < deadline:
+            self._collect_echoes(block=False)
+            if self._pending_writes:
+                await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        # reports the errors (and blocks only if the server did not
+        # acknowledge the writes within the timeout)
+        return self.flush()
+
     # the actual code
-    def _reads(self, addr, length):
-        if length > 65535:
-            length = 65535
+    def _header(self, command, addr, length, sequence_number=0):
+        return command + bytes(bytearray([sequence_number,
+                                          length & 0xFF,
+                                          (length >> 8) & 0xFF,
+                                          addr & 0xFF,
+                                          (addr >> 8) & 0xFF,
+                                          (addr >> 16) & 0xFF,
+                                          (addr >> 24) & 0xFF]))
+
+    def _bulk_header(self, command, addr, length, sequence_number=0):
+        return self._header(command, addr, 0, sequence_number) + \
+            bytes(bytearray([length & 0xFF,
+                             (length >> 8) & 0xFF,
+                             (length >> 16) & 0xFF,
+                             (length >> 24) & 0xFF]))
+
+    def _receive_into(self, view):
+        """ fills the writable buffer view with bytes from the socket """
+        received, length = 0, len(view)
+        while received < length:
+            n = self.socket.recv_into(view[received:], length - received)
+            if not n:
+                raise socket.error("Connection closed by server")
+            received += n
+
+    def _reads(self, addr, length, out=None):
+        return self._reads_array(b'r', addr, length, np.uint32, out)
+
+    def _reads_int16(self, addr, length, out=None):
+        return self._reads_array(b'p', addr, length, np.int16, out)
+
+    def _reads_array(self, command, addr, length, dtype, out=None):
+        """
+        sends a read request and receives the reply directly into the
+        memory of the returned array (out if specified)
+        """
+        if length > MAX_LENGTH:
+            length = MAX_LENGTH
             self.logger.warning("Maximum read-length is %d", length)
-        header = b'r' + bytes(bytearray([0,
-                                         length & 0xFF, (length >> 8) & 0xFF,
-                                         addr & 0xFF, (addr >> 8) & 0xFF, (addr >> 16) & 0xFF, (addr >> 24) & 0xFF]))
+        out = self._output_array(length, dtype, out)
+        header = self._header(command, addr, length)
+        self._collect_echoes(block=True)
+        self.socket.send(header)
+        self._receive_into(memoryview(self._header_buffer))
+        if self._header_buffer == header:  # check for in-sync transmission
+            # numpy arrays are little-endian on all supported platforms
+            out = out[:length]
+            self._receive_into(memoryview(out.view(np.uint8)))
+            return out
+        else:  # error handling
+            self.logger.error("Wrong control sequence from server: %s",
+                              bytes(self._header_buffer))
+            self.emptybuffer()
+            return None
+
+    def _output_array(self, length, dtype, out=None):
+        """ returns an array of length elements to receive data into """
+        if out is None:
+            return np.empty(length, dtype=dtype)
+        elif out.dtype != dtype or not out.flags.c_contiguous \
+                or len(out) < length:
+            raise ValueError("out must be a contiguous array of %d elements "
+                             "of type %s." % (length, np.dtype(dtype).name))
+        return out
+
+    def _reads_bulk(self, addr, length, out=None):
+        out = self._output_array(length, np.uint32, out)[:length]
+        header = self._bulk_header(b'R', addr, length)
+        self._collect_echoes(block=True)
+        self.socket.send(header)
+        echo = bytearray(len(header))
+        self._receive_into(memoryview(echo))
+        if echo == header:  # check for in-sync transmission
+            self._receive_into(memoryview(out.view(np.uint8)))
+            return out
+        else:  # error handling
+            self.logger.error("Wrong control sequence from server: %s",
+                              bytes(echo))
+            self.emptybuffer()
+            return None
+
+    def _writes_bulk(self, addr, values):
+        values = np.ascontiguousarray(values, dtype=np.uint32)
+        header = self._bulk_header(b'W', addr, len(values))
+        self._collect_echoes(block=True)
+        self.socket.sendall(header)
+        self.socket.sendall(memoryview(values.view(np.uint8)))
+        echo = bytearray(len(header))
+        self._receive_into(memoryview(echo))
+        if echo == header:  # check for in-sync transmission
+            return True  # indicate successful write
+        else:  # error handling
+            self.logger.error("Error: wrong control sequence from server")
+            self.emptybuffer()
+            return None
+
+    def _reads_long(self, addr, length, out=None):
+        """ reads any number of registers, in chunks for legacy servers """
+        if self.server_version >= 2:
+            return self.try_n_times(self._reads_bulk, addr, length, out=out)
+        out = self._output_array(length, np.uint32, out)[:length]
+        for start in range(0, length, MAX_LENGTH):
+            n = min(MAX_LENGTH, length - start)
+            if self.try_n_times(self._reads, addr + 4 * start, n,
+                                out=out[start:start + n]) is None:
+                return None
+        return out
+
+    def _writes_long(self, addr, values):
+        """ writes any number of registers, in chunks for legacy servers """
+        if self.server_version >= 2:
+            return self.try_n_times(self._writes_bulk, addr, values)
+        values = np.asarray(values, dtype=np.uint32)
+        for start in range(0, len(values), MAX_LENGTH - 2):
+            if self.try_n_times(self._writes, addr + 4 * start,
+                                values[start:start + MAX_LENGTH - 2]) is None:
+                return None
+        return True  # indicate successful write
+
+    def _reads_stats(self, addr, addrs, duration=1e-2, max_samples=0):
+        # addr is ignored, the signature is required by try_n_times
+        if len(addrs) > MAX_STATS_SIGNALS:
+            raise ValueError("At most %d signals can be sampled at once."
+                             % MAX_STATS_SIGNALS)
+        header = self._header(b's', 0, len(addrs))
+        self._collect_echoes(block=True)
+        self.socket.sendall(header + np.array(
+            [int(round(duration * 1e6)), max_samples] + addrs,
+            dtype=np.uint32).tobytes())
+        # the reply arrives only after the sampling duration
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(timeout + duration)
+        try:
+            self._receive_into(memoryview(self._header_buffer))
+            if self._header_buffer != header:  # check for in-sync transmission
+                self.logger.error("Wrong control sequence from server: %s",
+                                  bytes(self._header_buffer))
+                self.emptybuffer()
+                return None
+            records = np.empty(len(addrs), dtype=STATS_DTYPE)
+            self._receive_into(memoryview(records.view(np.uint8)))
+        finally:
+            self.socket.settimeout(timeout)
+        return records
+
+    def _server_stats(self, addr, value):
+        # addr is the reset flag, value is ignored
+        header = self._header(b't', addr, 0)
+        self._collect_echoes(block=True)
         self.socket.send(header)
-        data = self.socket.recv(length * 4 + 8)
-        while (len(data) < length * 4 + 8):
-            data += self.socket.recv(length * 4 - len(data) + 8)
-        if data[:8] == header:  # check for in-sync transmission
-            return np.frombuffer(data[8:], dtype=np.uint32)
+        self._receive_into(memoryview(self._header_buffer))
+        if self._header_buffer != header:  # check for in-sync transmission
+            self.logger.error("Wrong control sequence from server: %s",
+                              bytes(self._header_buffer))
+            self.emptybuffer()
+            return None
+        count = np.empty(1, dtype=np.uint32)
+        self._receive_into(memoryview(count.view(np.uint8)))
+        records = np.empty(6 * int(count[0]), dtype=np.uint32)
+        self._receive_into(memoryview(records.view(np.uint8)))
+        stats = dict()
+        for command, n, total_low, total_high, min_ns, max_ns in \
+                records.reshape(-1, 6):
+            total = (int(total_high) << 32) + int(total_low)
+            stats[chr(command)] = dict(count=int(n),
+                                       total_time=total * 1e-9,
+                                       mean_time=total * 1e-9 / n,
+                                       min_time=min_ns * 1e-9,
+                                       max_time=max_ns * 1e-9)
+        return stats
+
+    def _hello(self, addr, value):
+        # addr and value are ignored
+        self._collect_echoes(block=True)
+        result = server_hello(self.socket)
+        if result is None:
+            self.logger.error("Wrong reply of the server to the hello "
+                              "command.")
+            self.emptybuffer()
+        return result
+
+    def _reads_many(self, addr, ranges):
+        # addr is ignored, the signature is required by try_n_times
+        header = self._header(b'g', 0, len(ranges))
+        self._collect_echoes(block=True)
+        self.socket.sendall(header +
+                            np.array(ranges, dtype=np.uint32).tobytes())
+        total_length = sum(length for a, length in ranges)
+        self._receive_into(memoryview(self._header_buffer))
+        if self._header_buffer == header:  # check for in-sync transmission
+            data = np.empty(total_length, dtype=np.uint32)
+            self._receive_into(memoryview(data.view(np.uint8)))
+            offsets = np.cumsum([0] + [length for a, length in ranges])
+            return [data[start:stop]
+                    for start, stop in zip(offsets[:-1], offsets[1:])]
         else:  # error handling
-            self.logger.error("Wrong control sequence from server: %s", data[:8])
+            self.logger.error("Wrong control sequence from server: %s",
+                              bytes(self._header_buffer))
             self.emptybuffer()
             return None
 
     def _writes(self, addr, values):
-        values = values[:65535 - 2]
-        length = len(values)
-        header = b'w' + bytes(bytearray([0,
-                                         length & 0xFF,
-                                         (length >> 8) & 0xFF,
-                                         addr & 0xFF,
-                                         (addr >> 8) & 0xFF,
-                                         (addr >> 16) & 0xFF,
-                                         (addr >> 24) & 0xFF]))
+        values = values[:MAX_LENGTH - 2]
+        return self._send_write(b'w', addr, len(values),
+                                np.array(values, dtype=np.uint32).tobytes())
+
+    def _writes_masked(self, addr, values_and_masks):
+        # values_and_masks: interleaved values and masks of each register
+        if len(values_and_masks) > 2 * MAX_RANGES:
+            raise ValueError("At most %d registers can be written with one "
+                             "masked write." % MAX_RANGES)
+        return self._send_write(
+            b'm', addr, len(values_and_masks) // 2,
+            np.array(values_and_masks, dtype=np.uint32).tobytes())
+
+    def _send_write(self, command, addr, length, body):
+        """ sends a request that is acknowledged by an echo of the header """
+        if self.pipelined:
+            return self._send_write_pipelined(command, addr, length, body)
+        header = self._header(command, addr, length)
+        self._collect_echoes(block=True)
         # send header+body
-        self.socket.send(header +
-                         np.array(values, dtype=np.uint32).tobytes())
+        self.socket.send(header + body)
         if self.socket.recv(8) == header:  # check for in-sync transmission
             return True  # indicate successful write
         else:  # error handling
@@ -142,17 +640,74 @@ class MonitorClient(object):
             self.emptybuffer()
             return None
 
+    def _send_write_pipelined(self, command, addr, length, body):
+        # make room for more unacknowledged writes
+        if len(self._pending_writes) >= MAX_PENDING_WRITES:
+            self._collect_echoes(block=True, n=MAX_PENDING_WRITES // 2)
+        self._sequence_number = (self._sequence_number + 1) & 0xFF
+        header = self._header(command, addr, length,
+                              sequence_number=self._sequence_number)
+        self.socket.sendall(header + body)
+        self._pending_writes.append(header)
+        # from time to time, verify acknowledgements that have arrived in
+        # the meantime (polling at every write would cost more than the
+        # write itself on a fast link)
+        if len(self._pending_writes) % 32 == 0:
+            self._collect_echoes(block=False)
+        return True
+
+    def _collect_echoes(self, block=False, n=None):
+        """
+        receives the acknowledgements of pending pipelined writes and
+        compares them to the sent headers.
+
+        block: if False, only the acknowledgements that have already
+            arrived are processed.
+        n: number of acknowledgements to wait for if block is True (by
+            default, all pending ones)
+        """
+        if n is None:
+            n = len(self._pending_writes)
+        while self._pending_writes:
+            if block:
+                if n <= 0:
+                    return
+            elif not select.select([self.socket], [], [], 0)[0]:
+                return  # no acknowledgement available yet
+            data = self.socket.recv(8 * len(self._pending_writes)
+                                    - len(self._pending_echo))
+            if not data:
+                raise socket.error("Connection closed by server")
+            self._pending_echo += data
+            while len(self._pending_echo) >= 8:
+                echo = self._pending_echo[:8]
+                self._pending_echo = self._pending_echo[8:]
+                header = self._pending_writes.popleft()
+                n -= 1
+                if echo != header:  # out-of-sync transmission
+                    self.logger.error("Wrong acknowledgement of pipelined "
+                                      "write with sequence number %d from "
+                                      "server: %s", header[1], echo)
+                    self._pipeline_errors += 1 + len(self._pending_writes)
+                    self._pending_writes.clear()
+                    self._pending_echo = b''
+                    self.emptybuffer()
+                    return
+
     def emptybuffer(self):
         for i in range(100):
-            n = len(self.socket.recv(16384))
+            try:
+                n = len(self.socket.recv(16384))
+            except socket.timeout:  # nothing left to read
+                return
             if (n <= 0):
                 return
             self.logger.debug("Read %d bytes from socket...", n)
 
-    def try_n_times(self, function, addr, value, n=5):
+    def try_n_times(self, function, addr, value, n=5, **kwargs):
         for i in range(n):
             try:
-                value = function(addr, value)
+                result = function(addr, value, **kwargs)
             except (socket.timeout, socket.error):
                 self.logger.error("Error occured in reading attempt %s. "
                                   "Reconnecting at addr %s to %s value %s by "
@@ -165,107 +720,1092 @@ class MonitorClient(object):
                 if self._restartserver is not None:
                     self.restart()
             else:
-                if value is not None:
-                    return value
+                if result is not None:
+                    return result
 
     def restart(self):
+        if self._pending_writes:
+            self.logger.warning("%d pipelined writes may have been lost "
+                                "during the restart of client %s.",
+                                len(self._pending_writes),
+                                self.client_number)
+            self._pending_writes.clear()
+            self._pending_echo = b''
         self.close()
         port = self._restartserver()
         self.__init__(
             hostname=self._hostname,
             port=port,
-            restartserver=self._restartserver)
+            restartserver=self._restartserver,
+            pipelined=self.pipelined,
+            server_version=self.server_version)
+
+
+class AsyncMonitorClient(object):
+    def __init__(self, hostname="192.168.1.0", port=2222, timeout=1.0):
+        """initiates an asyncio client of monitor_server
+
+        The methods reads, reads_int16, writes and writes_masked are
+        coroutines that do not block the event loop while waiting for the
+        server. They can be awaited concurrently, e.g. by several
+        acquisition coroutines, and are then served one after the other.
+        The connection is opened at the first request, it is separate from
+        the one of a MonitorClient with the same hostname and port.
+
+        hostname: server address, e.g. "localhost" or "192.168.1.0"
+        port:    the port that the server is running on. 2222 by default
+        timeout: timeout in seconds for the reply of the server
+        """
+        self.logger = logging.getLogger(name=__name__)
+        global CLIENT_NUMBER
+        CLIENT_NUMBER += 1
+        self.client_number = CLIENT_NUMBER
+        self._hostname = hostname
+        self._port = port
+        self._timeout = timeout
+        self._read_counter = 0  # For debugging and unittests
+        self._write_counter = 0  # For debugging and unittests
+        self._loop = None  # event loop of the connection
+        self._lock = None  # serializes the requests on the connection
+        self._reader = None
+        self._writer = None
+
+    # the header format is the same as the one of MonitorClient
+    _header = MonitorClient._header
+    _bulk_header = MonitorClient._bulk_header
+
+    def close(self):
+        """ closes the connection, a new one is opened by the next request """
+        if self._writer is not None:
+            try:
+                self._writer.write(b'c' + bytes(bytearray(7)))
+                self._writer.close()
+            except (OSError, RuntimeError):
+                pass
+        self._reader, self._writer = None, None
+
+    async def reads(self, addr, length):
+        """ reads length registers starting at addr """
+        self._read_counter += 1
+        length = int(length)
+        if length > MAX_LENGTH:
+            header = self._bulk_header(b'R', addr, length)
+        else:
+            header = self._header(b'r', addr, length)
+        data = await self._request(header, header, 4 * length)
+        if data is not None:
+            return np.frombuffer(data, dtype=np.uint32).copy()
+
+    async def reads_int16(self, addr, length):
+        """
+        reads length registers holding 14-bit signed samples and returns
+        them as an array of int16 (see MonitorClient.reads_int16)
+        """
+        self._read_counter += 1
+        length = int(length)
+        data = np.empty(length, dtype=np.int16)
+        # one request per MAX_LENGTH samples
+        for start in range(0, length, MAX_LENGTH):
+            chunk = min(MAX_LENGTH, length - start)
+            header = self._header(b'p', addr + 4 * start, chunk)
+            reply = await self._request(header, header, 2 * chunk)
+            if reply is None:
+                return None
+            data[start:start + chunk] = np.frombuffer(reply, dtype=np.int16)
+        return data
+
+    async def writes(self, addr, values):
+        """ writes values to the registers starting at addr """
+        self._write_counter += 1
+        values = np.ascontiguousarray(values, dtype=np.uint32)
+        if len(values) > MAX_LENGTH - 2:
+            header = self._bulk_header(b'W', addr, len(values))
+        else:
+            header = self._header(b'w', addr, len(values))
+        # writes are not retried (see _request)
+        if await self._request(header + values.tobytes(), header, n=1) \
+                is not None:
+            return True  # indicate successful write
+
+    async def writes_masked(self, addr, values, masks):
+        """
+        writes only the bits selected by masks of the registers starting at
+        addr (see MonitorClient.writes_masked)
+        """
+        self._write_counter += 1
+        values_and_masks = np.array([values, masks], dtype=np.uint32).T
+        # at most MAX_RANGES registers per request
+        for start in range(0, len(values_and_masks), MAX_RANGES):
+            chunk = values_and_masks[start:start + MAX_RANGES]
+            header = self._header(b'm', addr + 4 * start, len(chunk))
+            if await self._request(header + chunk.tobytes(), header,
+                                   n=1) is None:
+                return None
+        return True  # indicate successful write
+
+    def _get_lock(self):
+        """ returns the lock of the connection in the running event loop """
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            # streams cannot be shared between event loops
+            self.close()
+            self._loop, self._lock = loop, asyncio.Lock()
+        return self._lock
+
+    async def _connect(self):
+        if self._writer is not None:
+            return
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self._hostname, self._port),
+            self._timeout)
+        sock = self._writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def _request(self, request, header, length=0, n=5):
+        """
+        sends request and returns the length bytes following the echo of
+        header, or None if no valid reply was received after n attempts.
+
+        Only idempotent requests (reads) may be sent more than once: a
+        write whose acknowledgement was lost may already have been
+        executed, and repeating it could undo the writes of other clients
+        in the meantime.
+        """
+        for i in range(n):
+            async with self._get_lock():
+                try:
+                    await self._connect()
+                    self._writer.write(request)
+                    echo = await asyncio.wait_for(
+                        self._reader.readexactly(len(header)), self._timeout)
+                    if echo == header:  # check for in-sync transmission
+                        return await asyncio.wait_for(
+                            self._reader.readexactly(length), self._timeout)
+                    self.logger.error("Wrong control sequence from server: "
+                                      "%s", echo)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        OSError) as e:
+                    self.logger.error("Error occured in attempt %s of async "
+                                      "client %s: %s", i, self.client_number,
+                                      e)
+                # the stream cannot be resynchronized, reconnect
+                self.close()
+
+
+class ThreadedClient(object):
+    def __init__(self, client):
+        """
+        serves all requests to the wrapped client (e.g. a MonitorClient)
+        from a single worker thread, the only one to use its socket.
+
+        Requests are queued with a priority: writes go ahead of register
+        reads, which go ahead of long data transfers such as scope traces.
+        Requests of equal priority are served in the order of submission.
+        The methods of MonitorClient block until the request has been
+        served, the methods ending with _future immediately return a
+        concurrent.futures.Future instead. A read that is identical to a
+        pending one is not sent to the server again, but receives a copy of
+        its result.
+        """
+        self.logger = logging.getLogger(name=__name__)
+        self.client = client
+        self._queue = PriorityQueue()
+        self._counter = 0  # orders requests of equal priority
+        self._lock = threading.Lock()
+        self._pending_reads = dict()  # (method, addr, length) -> future
+        self.coalesced_reads = 0  # For debugging and unittests
+        self._thread = threading.Thread(target=self._work,
+                                        name="pyrpl I/O worker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, priority, function, *args, **kwargs):
+        """
+        queues the call function(*args, **kwargs) to be executed by the
+        worker thread and returns a Future of its result
+        """
+        future = Future()
+        with self._lock:
+            self._counter += 1
+            self._queue.put((priority, self._counter,
+                             (future, function, args, kwargs, None)))
+        return future
+
+    def reads_future(self, addr, length):
+        """ returns a Future of the result of reads(addr, length) """
+        return self._submit_read(self.client.reads, addr, length)
+
+    def reads_int16_future(self, addr, length):
+        """ returns a Future of the result of reads_int16(addr, length) """
+        return self._submit_read(self.client.reads_int16, addr, length)
+
+    def writes_future(self, addr, values):
+        """ returns a Future of the result of writes(addr, values) """
+        return self.submit(IO_PRIORITY_WRITE, self.client.writes, addr,
+                           values)
+
+    def writes_masked_future(self, addr, values, masks):
+        """ returns a Future of the result of writes_masked(addr, ...) """
+        return self.submit(IO_PRIORITY_WRITE, self.client.writes_masked,
+                           addr, values, masks)
+
+    # the interface of MonitorClient
+    def reads(self, addr, length, out=None):
+        if out is not None:
+            priority = self._read_priority(length)
+            return self.submit(priority, self.client.reads, addr, length,
+                               out=out).result()
+        return self.reads_future(addr, length).result()
+
+    def reads_int16(self, addr, length, out=None):
+        if out is not None:
+            return self.submit(IO_PRIORITY_BULK, self.client.reads_int16,
+                               addr, length, out=out).result()
+        return self.reads_int16_future(addr, length).result()
+
+    def reads_bulk(self, addr, length, out=None):
+        return self.submit(IO_PRIORITY_BULK, self.client.reads_bulk, addr,
+                           length, out=out).result()
+
+    def reads_many(self, ranges):
+        return self.submit(IO_PRIORITY_READ, self.client.reads_many,
+                           ranges).result()
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        return self.submit(IO_PRIORITY_BULK, self.client.reads_stats, addrs,
+                           duration=duration,
+                           max_samples=max_samples).result()
+
+    def server_stats(self, reset=False):
+        return self.submit(IO_PRIORITY_READ, self.client.server_stats,
+                           reset=reset).result()
+
+    def writes(self, addr, values):
+        return self.writes_future(addr, values).result()
+
+    def writes_bulk(self, addr, values):
+        return self.submit(IO_PRIORITY_WRITE, self.client.writes_bulk, addr,
+                           values).result()
+
+    def writes_masked(self, addr, values, masks):
+        return self.writes_masked_future(addr, values, masks).result()
+
+    def flush(self):
+        # all writes submitted so far are served before the flush
+        return self.submit(IO_PRIORITY_WRITE, self.client.flush).result()
+
+    async def drain(self):
+        """ coroutine version of flush (see MonitorClient.drain) """
+        return await asyncio.wrap_future(
+            self.submit(IO_PRIORITY_WRITE, self.client.flush))
+
+    def restart(self):
+        return self.submit(IO_PRIORITY_WRITE, self.client.restart).result()
+
+    @property
+    def pipelined(self):
+        return self.client.pipelined
+
+    @pipelined.setter
+    def pipelined(self, value):
+        self.flush()
+        self.client.pipelined = value
+
+    def __getattr__(self, name):
+        # other attributes, such as the request counters, of the client
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def stop(self):
+        """ stops the worker thread once all queued requests are served """
+        if self._thread.is_alive():
+            with self._lock:
+                self._counter += 1
+                self._queue.put((IO_PRIORITY_BULK + 1, self._counter, None))
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+        self.client.close()
+
+    def _read_priority(self, length):
+        if length >= BULK_READ_LENGTH:
+            return IO_PRIORITY_BULK
+        return IO_PRIORITY_READ
+
+    def _submit_read(self, function, addr, length):
+        key = (function.__name__, addr, length)
+        with self._lock:
+            pending = self._pending_reads.get(key)
+            if pending is None:
+                future = Future()
+                self._counter += 1
+                self._pending_reads[key] = future
+                self._queue.put((self._read_priority(length), self._counter,
+                                 (future, function, (addr, length), {}, key)))
+                return future
+            self.coalesced_reads += 1
+        # every caller receives its own copy of the data
+        future = Future()
+        def copy_result(pending):
+            try:
+                result = pending.result()
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None if result is None else result.copy())
+        pending.add_done_callback(copy_result)
+        return future
+
+    def _work(self):
+        while True:
+            priority, counter, request = self._queue.get()
+            if request is None:
+                return
+            future, function, args, kwargs, key = request
+            if key is not None:
+                # later reads of the same registers must be sent again
+                with self._lock:
+                    del self._pending_reads[key]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self.logger.error("Error in I/O worker thread during %s: %s",
+                                  getattr(function, '__name__', function), e)
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class ClientPool(object):
+    def __init__(self, control, bulk):
+        """
+        distributes the requests among several clients connected to the
+        same server, such that short register accesses are not delayed
+        by long data transfers.
+
+        control: client for register accesses (the control channel)
+        bulk: list of clients for long data transfers (the bulk channels),
+            i.e. sample buffers, reads and writes of at least
+            BULK_READ_LENGTH registers and sampler statistics.
+
+        Long reads are split into requests of BULK_CHUNK_LENGTH registers,
+        between which the server serves the requests of the control
+        channel. Each client is used by one thread at a time.
+        """
+        self.control = control
+        self.bulk = list(bulk)
+        self._control_lock = threading.Lock()
+        self._bulk_locks = [threading.Lock() for client in self.bulk]
+        self._next_bulk = 0
+
+    def reads(self, addr, length, out=None):
+        if length >= BULK_READ_LENGTH:
+            return self._reads_chunked('reads', np.uint32, addr, length, out)
+        with self._control_lock:
+            return self.control.reads(addr, length, out=out)
+
+    def reads_int16(self, addr, length, out=None):
+        return self._reads_chunked('reads_int16', np.int16, addr, length,
+                                   out)
+
+    def reads_bulk(self, addr, length, out=None):
+        with self._bulk_client() as client:
+            return client.reads_bulk(addr, length, out=out)
+
+    def reads_many(self, ranges):
+        with self._control_lock:
+            return self.control.reads_many(ranges)
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        with self._bulk_client() as client:
+            return client.reads_stats(addrs, duration=duration,
+                                      max_samples=max_samples)
+
+    def server_stats(self, reset=False):
+        with self._control_lock:
+            return self.control.server_stats(reset=reset)
+
+    def writes(self, addr, values):
+        if len(values) >= BULK_READ_LENGTH:
+            with self._bulk_client() as client:
+                return client.writes(addr, values)
+        with self._control_lock:
+            return self.control.writes(addr, values)
+
+    def writes_bulk(self, addr, values):
+        with self._bulk_client() as client:
+            return client.writes_bulk(addr, values)
+
+    def writes_masked(self, addr, values, masks):
+        with self._control_lock:
+            return self.control.writes_masked(addr, values, masks)
+
+    def flush(self):
+        with self._control_lock:
+            return self.control.flush()
+
+    async def drain(self):
+        """ coroutine version of flush (see MonitorClient.drain) """
+        if not self.control.pipelined:
+            return True  # all writes are acknowledged already
+        # the control channel may be in use by another thread, wait for
+        # its lock in a worker thread
+        return await asyncio.get_event_loop().run_in_executor(None,
+                                                              self.flush)
+
+    def restart(self):
+        for client in self._clients():
+            client.restart()
+
+    def close(self):
+        for client in self._clients():
+            client.close()
+
+    @property
+    def pipelined(self):
+        return self.control.pipelined
+
+    @pipelined.setter
+    def pipelined(self, value):
+        with self._control_lock:
+            self.control.flush()
+            self.control.pipelined = value
+
+    def __getattr__(self, name):
+        # other attributes, such as the request counters, of the control
+        # channel
+        if name == 'control':
+            raise AttributeError(name)
+        return getattr(self.control, name)
+
+    def _clients(self):
+        return [self.control] + self.bulk
+
+    @contextmanager
+    def _bulk_client(self):
+        """ reserves a bulk channel, preferably one that is not in use """
+        # pending pipelined writes must arrive before the bulk request
+        if getattr(self.control, 'pipelined', False):
+            self.flush()
+        n = len(self.bulk)
+        start = self._next_bulk
+        self._next_bulk = (start + 1) % n
+        for i in list(range(start, n)) + list(range(start)):
+            if self._bulk_locks[i].acquire(False):
+                break
+        else:  # all channels are in use
+            i = start
+            self._bulk_locks[i].acquire()
+        try:
+            yield self.bulk[i]
+        finally:
+            self._bulk_locks[i].release()
+
+    def _reads_chunked(self, method, dtype, addr, length, out=None):
+        if out is None:
+            out = np.empty(length, dtype=dtype)
+        with self._bulk_client() as client:
+            for start in range(0, length, BULK_CHUNK_LENGTH):
+                n = min(BULK_CHUNK_LENGTH, length - start)
+                if getattr(client, method)(addr + 4 * start, n,
+                                           out=out[start:start + n]) is None:
+                    return None
+        return out[:length]
+
+
+class LocalMmapClient(object):
+    def __init__(self, filename="/dev/mem"):
+        """
+        accesses the FPGA registers directly through a memory mapping of
+        the FPGA address space, i.e. without monitor_server. This is only
+        possible when running on the Red Pitaya itself, with the FPGA
+        bitfile already loaded.
+
+        filename: file whose bytes FPGA_BASE to FPGA_BASE + FPGA_SIZE are
+            mapped, "/dev/mem" for the FPGA. Any other file of sufficient
+            size can be used for testing.
+        """
+        self.logger = logging.getLogger(name=__name__)
+        self._filename = filename
+        self._read_counter = 0  # For debugging and unittests
+        self._write_counter = 0  # For debugging and unittests
+        self.pipelined = False  # writes are immediate anyway
+        self.server_version = SERVER_VERSION  # all requests are supported
+        flags = os.O_RDWR | getattr(os, 'O_SYNC', 0)
+        self._fd = os.open(filename, flags)
+        try:
+            self._mmap = mmap.mmap(self._fd, FPGA_SIZE, mmap.MAP_SHARED,
+                                   mmap.PROT_READ | mmap.PROT_WRITE,
+                                   offset=FPGA_BASE)
+        except Exception:
+            os.close(self._fd)
+            raise
+        # all registers as one array of 32-bit words. Like the volatile
+        # pointers of monitor_server, each element access of the ctypes
+        # array is a single 32-bit load or store, whereas numpy may copy
+        # slices with wider or narrower accesses, which the FPGA bus does
+        # not support.
+        self._words = (ctypes.c_uint32 * (FPGA_SIZE // 4)).from_buffer(
+            self._mmap)
+        self._memory = np.frombuffer(self._mmap, dtype=np.uint32)
+
+    def close(self):
+        if self._memory is not None:
+            self._memory = None
+            self._words = None
+            try:
+                self._mmap.close()
+            except BufferError:  # views returned by view() are still alive
+                pass
+            os.close(self._fd)
+
+    def __del__(self):
+        self.close()
+
+    def view(self, addr, length):
+        """
+        returns a numpy array of length uint32 elements that directly
+        represents the registers starting at addr. Reading the array
+        reads the registers, assigning its elements writes them. Unlike
+        reads and writes, numpy does not guarantee single 32-bit accesses
+        for operations on several elements.
+        """
+        start = self._index(addr, length)
+        return self._memory[start:start + length]
+
+    def reads(self, addr, length, out=None):
+        self._read_counter += 1
+        data = self._read_words(addr, length)
+        if out is not None:
+            out[:length] = data
+            return out[:length]
+        return data
+
+    def reads_int16(self, addr, length, out=None):
+        self._read_counter += 1
+        data = self._read_words(addr, length)
+        # sign-extend the 14 least significant bits
+        x = ((data << 18).view(np.int32) >> 18).astype(np.int16)
+        if out is not None:
+            out[:length] = x
+            return out[:length]
+        return x
+
+    def reads_bulk(self, addr, length, out=None):
+        return self.reads(addr, length, out=out)
+
+    def reads_many(self, ranges):
+        return [self.reads(addr, length) for addr, length in ranges]
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        """ see MonitorClient.reads_stats """
+        if not len(addrs):
+            return np.zeros(0, dtype=STATS_DTYPE)
+        self._read_counter += 1
+        indices = [self._index(addr, 1) for addr in addrs]
+        words = self._words
+        records = np.zeros(len(indices), dtype=STATS_DTYPE)
+        records['min'] = 2 ** 13
+        records['max'] = -2 ** 13
+        samples = 0
+        t0 = time()
+        while samples == 0 or (time() < t0 + duration and
+                               (max_samples == 0 or samples < max_samples)):
+            values = np.array([words[i] for i in indices], dtype=np.uint32)
+            values = ((values << 18).view(np.int32) >> 18).astype(np.int64)
+            samples += 1
+            records['sum'] += values
+            records['sumsq'] += (values ** 2).astype(np.uint64)
+            records['min'] = np.minimum(records['min'], values)
+            records['max'] = np.maximum(records['max'], values)
+        records['count'] = samples
+        return records
+
+    def server_stats(self, reset=False):
+        return dict()
+
+    def writes(self, addr, values):
+        self._write_counter += 1
+        start = self._index(addr, len(values))
+        words = self._words
+        for i, value in enumerate(_to_u32(values).tolist()):
+            words[start + i] = value
+        return True
+
+    def writes_bulk(self, addr, values):
+        return self.writes(addr, values)
+
+    def writes_masked(self, addr, values, masks):
+        self._write_counter += 1
+        start = self._index(addr, len(values))
+        words = self._words
+        for i, (value, mask) in enumerate(zip(_to_u32(values).tolist(),
+                                              _to_u32(masks).tolist())):
+            words[start + i] = (words[start + i] & ~mask) | (value & mask)
+        return True
+
+    def flush(self):
+        return True
+
+    async def drain(self):
+        return True
+
+    def restart(self):
+        pass
+
+    def _read_words(self, addr, length):
+        """ reads the registers one 32-bit word at a time """
+        start = self._index(addr, length)
+        words = self._words
+        return np.array([words[i] for i in range(start, start + length)],
+                        dtype=np.uint32)
+
+    def _index(self, addr, length):
+        """ returns the index of the register at addr in self._memory """
+        offset = addr - FPGA_BASE
+        if offset < 0 or offset % 4 or offset + 4 * length > FPGA_SIZE:
+            raise ValueError("Registers %s to %s lie outside the FPGA "
+                             "address space." % (hex(addr),
+                                                 hex(addr + 4 * length)))
+        return offset // 4
+
+
+def _to_u32(values):
+    """ returns values as little-endian 32-bit registers """
+    return np.asarray(values, dtype=np.int64).astype('<u4')
+
+
+def read_recording(filename):
+    """
+    returns the list of register accesses recorded by RecordingClient as
+    tuples (header, payload), where header is a RECORD_DTYPE record and
+    payload the bytes stored after it.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    records, position = [], 0
+    while position + RECORD_DTYPE.itemsize <= len(data):
+        header = np.frombuffer(data, dtype=RECORD_DTYPE, count=1,
+                               offset=position)[0]
+        position += RECORD_DTYPE.itemsize
+        records.append((header, data[position:position + header['nbytes']]))
+        position += header['nbytes']
+    return records
+
+
+class RecordingClient(object):
+    def __init__(self, client, filename):
+        """
+        records all register accesses of client to the binary file filename,
+        e.g. to serve them without hardware with ReplayClient.
+
+        Each access is stored as a RECORD_DTYPE header with the time, the
+        duration, the command character of monitor_server, the address and
+        the length of the access, followed by its payload: the reply of
+        reads (prefixed with the ranges or addresses of gather-reads and
+        statistics) and the values (and masks) of writes.
+        """
+        self.client = client
+        self.filename = filename
+        self._file = open(filename, 'wb')
+        self._lock = threading.Lock()
+
+    def _record(self, op, addr, length, start, *payload):
+        payload = b''.join(np.ascontiguousarray(p).tobytes() for p in payload)
+        header = np.array((start, time() - start, op, addr, length,
+                           len(payload)), dtype=RECORD_DTYPE)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(header.tobytes() + payload)
+
+    def _recorded_read(self, function, op, addr, length, out=None):
+        start = time()
+        data = function(addr, length, out=out)
+        self._record(op, addr, length, start,
+                     *([] if data is None else [data]))
+        return data
+
+    def reads(self, addr, length, out=None):
+        return self._recorded_read(self.client.reads, b'r', addr, length, out)
+
+    def reads_int16(self, addr, length, out=None):
+        return self._recorded_read(self.client.reads_int16, b'p', addr,
+                                   length, out)
+
+    def reads_bulk(self, addr, length, out=None):
+        return self._recorded_read(self.client.reads_bulk, b'R', addr,
+                                   length, out)
+
+    def reads_many(self, ranges):
+        start = time()
+        results = self.client.reads_many(ranges)
+        self._record(b'g', 0, len(ranges), start, _to_u32(ranges),
+                     *([] if results is None else
+                       [_to_u32(r) for r in results]))
+        return results
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        start = time()
+        records = self.client.reads_stats(addrs, duration=duration,
+                                          max_samples=max_samples)
+        self._record(b's', 0, len(addrs), start, _to_u32(addrs),
+                     *([] if records is None else [records]))
+        return records
+
+    def writes(self, addr, values):
+        start = time()
+        result = self.client.writes(addr, values)
+        self._record(b'w', addr, len(values), start, _to_u32(values))
+        return result
+
+    def writes_bulk(self, addr, values):
+        start = time()
+        result = self.client.writes_bulk(addr, values)
+        self._record(b'W', addr, len(values), start, _to_u32(values))
+        return result
+
+    def writes_masked(self, addr, values, masks):
+        start = time()
+        result = self.client.writes_masked(addr, values, masks)
+        self._record(b'm', addr, len(values), start, _to_u32(values),
+                     _to_u32(masks))
+        return result
+
+    @property
+    def pipelined(self):
+        return self.client.pipelined
+
+    @pipelined.setter
+    def pipelined(self, value):
+        self.client.pipelined = value
+
+    def __getattr__(self, name):
+        # flush, server_stats, restart, the request counters, ...
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self.client.close()
+
+
+class ReplayClient(object):
+    def __init__(self, filename):
+        """
+        serves the register accesses recorded by RecordingClient in the
+        filename, such that a measurement can be repeated without hardware,
+        e.g. to measure the time spent on the host or to count the register
+        accesses of an operation.
+
+        Each access is matched with the next recorded access with the same
+        command, address and length (and ranges or addresses for
+        gather-reads and statistics). The recorded accesses skipped in
+        between, accesses without any match (reads return zeros) and
+        writes with different values than recorded are counted in
+        replay_stats().
+        """
+        self.logger = logging.getLogger(name=__name__)
+        self.filename = filename
+        self.records = read_recording(filename)
+        self.pipelined = False
+        self.server_version = SERVER_VERSION  # all requests are supported
+        self._index = 0
+        self._lock = threading.Lock()
+        self._stats = dict(replayed=0, skipped=0, unmatched=0, differing=0)
+
+    def replay_stats(self):
+        """
+        returns a dict with the number of recorded accesses and the
+        numbers of replayed, skipped and unmatched accesses and of
+        writes with differing values
+        """
+        with self._lock:
+            return dict(self._stats, recorded=len(self.records))
+
+    def _next(self, op, addr, length, prefix=b''):
+        """ returns the payload of the next matching recorded access, or
+        None if there is none """
+        with self._lock:
+            for i in range(self._index, len(self.records)):
+                header, payload = self.records[i]
+                if header['op'] == op and header['addr'] == addr \
+                        and header['length'] == length \
+                        and payload.startswith(prefix):
+                    self._stats['skipped'] += i - self._index
+                    self._stats['replayed'] += 1
+                    self._index = i + 1
+                    return payload[len(prefix):]
+            self._stats['unmatched'] += 1
+        self.logger.warning("No access of type %s to address 0x%08X with "
+                            "length %d left in the recording %s.",
+                            op.decode(), addr, length, self.filename)
+        return None
+
+    def _replayed_read(self, op, addr, length, dtype, out=None):
+        payload = self._next(op, addr, length)
+        if payload is None:
+            data = np.zeros(length, dtype=dtype)
+        elif not payload:
+            return None  # the recorded read failed
+        else:
+            data = np.frombuffer(payload, dtype=dtype).copy()
+        if out is not None:
+            out[:length] = data
+            return out
+        return data
+
+    def reads(self, addr, length, out=None):
+        return self._replayed_read(b'r', addr, length, np.uint32, out)
+
+    def reads_int16(self, addr, length, out=None):
+        return self._replayed_read(b'p', addr, length, np.int16, out)
+
+    def reads_bulk(self, addr, length, out=None):
+        return self._replayed_read(b'R', addr, length, np.uint32, out)
+
+    def reads_many(self, ranges):
+        payload = self._next(b'g', 0, len(ranges),
+                             prefix=_to_u32(ranges).tobytes())
+        if payload is None:
+            return [np.zeros(length, dtype=np.uint32)
+                    for addr, length in ranges]
+        elif not payload:
+            return None  # the recorded read failed
+        data = np.frombuffer(payload, dtype=np.uint32)
+        splits = np.cumsum([length for addr, length in ranges])[:-1]
+        return [d.copy() for d in np.split(data, splits)]
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        payload = self._next(b's', 0, len(addrs),
+                             prefix=_to_u32(addrs).tobytes())
+        if payload is None:
+            return np.zeros(len(addrs), dtype=STATS_DTYPE)
+        return np.frombuffer(payload, dtype=STATS_DTYPE).copy()
+
+    def _replayed_write(self, op, addr, *values):
+        payload = self._next(op, addr, len(values[0]))
+        if payload is not None and payload != b''.join(
+                _to_u32(v).tobytes() for v in values):
+            with self._lock:
+                self._stats['differing'] += 1
+        return True
+
+    def writes(self, addr, values):
+        return self._replayed_write(b'w', addr, values)
+
+    def writes_bulk(self, addr, values):
+        return self._replayed_write(b'W', addr, values)
+
+    def writes_masked(self, addr, values, masks):
+        return self._replayed_write(b'm', addr, values, masks)
+
+    def flush(self):
+        return True
+
+    async def drain(self):
+        return True
+
+    def server_stats(self, reset=False):
+        return dict()
+
+    def restart(self):
+        pass
+
+    def close(self):
+        pass
 
 
 class DummyClient(object):  # pragma: no cover
-    """Class for unitary tests without RedPitaya hardware available"""
-    class fpgadict(dict):
-        def __missing__(self, key):
-            return 1 # 0 (1 is needed to avoid division_by_zero errors for some registers)
-    fpgamemory = fpgadict({str(0x40100014): 1})  # scope decimation initial value
+    """Class for unitary tests without RedPitaya hardware available
+
+    The registers are held in a numpy array that is shared by all
+    instances, such that reads and writes of many registers are vectorized.
+    Address ranges with simulated behavior (scope buffers, timestamps, ...)
+    are produced by handlers that return whole slices at once, and the
+    constant registers of the DSP modules are overlaid from a precomputed
+    table."""
+    _memory = None  # register file shared by all instances
+    _sparse = dict()  # registers outside of the FPGA address space
+    _constants = None  # (sorted addresses, values) of constant registers
+    server_version = SERVER_VERSION  # all requests are supported
+
+    def __init__(self):
+        if DummyClient._memory is None:
+            # 1 is needed to avoid division_by_zero errors for some registers
+            DummyClient._memory = np.ones(FPGA_SIZE // 4, dtype=np.uint32)
+            constants = self.constant_registers()
+            addresses = np.array(sorted(constants), dtype=np.int64)
+            DummyClient._constants = (addresses, np.array(
+                [constants[a] for a in addresses], dtype=np.uint32))
+        # (start address, stop address, function of the addresses)
+        self._handlers = [
+            (0x40100000, 0x40100004, self._zeros),  # scope control register
+            (0x4010015C, 0x40100160, self._timestamp),  # current_timestamp lv
+            (0x40100160, 0x4010016C, self._zeros),  # other timestamp parts
+            (0x40110000, 0x40130000, self._scope_data)]  # scope curve buffer
+
+    @staticmethod
+    def constant_registers():
+        """ returns a dict {address: value} of the constant registers of the
+        DSP modules """
+        constants = dict()
+        filter_constants = {0x220: 1,  # filterstages
+                            0x224: 2,  # shiftbits
+                            0x228: 1}  # minbw
+        module_constants = {
+            'pid': {0x220: 4,  # FILTERSTAGES
+                    0x228: 1},  # MINBW
+            'iir': {0x200: 64,  # IIRBITS
+                    0x204: 32,  # IIRSHIFT
+                    0x208: 16,  # IIRSTAGES
+                    0x220: 1,  # filterstages
+                    0x108: 0},  # overflow
+            'iq': {0x220: 1,  # filterstages
+                   0x230: 2,  # rbw filter: filterstages
+                   0x234: 2,  # rbw filter: shiftbits
+                   0x238: 1}}  # rbw filter: minbw
+        # modules that come first in DSP_INPUTS have precedence
+        for module in reversed(list(DSP_INPUTS)):
+            for prefix, registers in module_constants.items():
+                if module.startswith(prefix):
+                    for table in [filter_constants, registers]:
+                        for offset, value in table.items():
+                            constants[dsp_addr_base(module) + offset] = value
+        return constants
+
+    def _zeros(self, addresses):
+        return 0
+
+    def _timestamp(self, addresses):
+        return int(time()*125e6) % (2**32)
+
+    def _scope_data(self, addresses):
+        v = np.random.normal(scale=2**13 - 1, size=len(addresses)) // 4
+        v = np.clip(v, -(2**13-1), 2**13-1).astype(np.int64)
+        return v & 0x3FFF
+
+    def _valid(self, addr, length):
+        return FPGA_BASE <= addr and addr + 0x4*length <= FPGA_BASE + FPGA_SIZE
 
     def read_fpgamemory(self, addr):
-        # here we implement a fraction of the memory map to simulate the actual redpitaya
-        # scope
-        offset = addr - 0x40100000
-        # scope curve buffer
-        if offset >= 0x10000 and offset < 0x30000:
-            v = int(np.random.normal(scale=2**13 - 1))//4
-            if v > 2**13-1:
-                v = 2*13-1
-            elif v < -(2**13-1):
-                v = -(2**13-1)
-            if v < 0:
-                v += 2**14
-            return v
-        # scope control register - trigger armed, trigger source etc.
-        if offset == 0:
-            return 0
-        if offset == 0x15C:  # current_timestamp lv part
-            t = int(time()*125e6)
-            return t % (2**32)
-        if offset == 0x160:  # current_timestamp mv part
-            return 0
-            t = int(time()*125e6)
-            return t - (t % (2**32))
-        if offset == 0x164:  # trigger_timestamp lv part
-            return 0
-        if offset == 0x168:  # trigger_timestamp mv part
-            return 0
-        #DSP modules
-        all = DSP_INPUTS
-        for module in DSP_INPUTS:
-            offset = addr - dsp_addr_base(module)
-            if module.startswith('pid'):
-                if offset == 0x220: # FILTERSTAGES
-                    return 4
-                elif offset == 0x228:  # MINBW
-                    return 1
-            elif module.startswith('iir'):
-                if offset == 0x200:  # IIRBITS
-                    return 64
-                elif offset == 0x204:  # IIRSHIFT
-                    return 32
-                elif offset == 0x208:  # IIRSTAGES
-                    return 16
-                elif offset == 0x220:  # filterstages
-                    return 1
-                elif offset == 0x108:  # overflow
-                    return 0
-            elif module.startswith('iq'):
-                if offset == 0x220:  # filterstages
-                    return 1
-                # rbw filter register
-                elif offset == 0x230:  # filterstages = 0x230
-                    return 2
-                elif offset == 0x234:  # shiftbits = 0x234
-                    return 2
-                elif offset == 0x238:  # minbw = 0x238
-                    return 1
-            for filter_module in ['iq', 'pid', 'iir']:
-                if module.startswith(filter_module):
-                    if offset == 0x220:  # filterstages
-                        return 1
-                    elif offset == 0x224:  # shiftbits
-                        return 2
-                    elif offset == 0x228:  # minbw
-                        return 1
-
-        # everything else is restored from the dict
-        return self.fpgamemory[str(addr)]
-
-    def reads(self, addr, length):
-        val = []
-        for i in range(length):
-            val.append(self.read_fpgamemory(addr+0x4*i))
-        return np.array(val, dtype=np.uint32)
-    
+        return int(self.reads(addr, 1)[0])
+
+    def reads(self, addr, length, out=None):
+        if not self._valid(addr, length):
+            val = np.array([self._sparse.get(addr+0x4*i, 1)
+                            for i in range(length)], dtype=np.uint32)
+        else:
+            start = (addr - FPGA_BASE) // 4
+            val = self._memory[start:start + length].copy()
+            stop = addr + 0x4*length
+            for first, last, function in self._handlers:
+                if first < stop and addr < last:
+                    first, last = max(first, addr), min(last, stop)
+                    val[(first - addr)//4:(last - addr)//4] = function(
+                        np.arange(first, last, 0x4, dtype=np.int64))
+            addresses, values = self._constants
+            lo, hi = np.searchsorted(addresses, [addr, stop])
+            if hi > lo:
+                val[(addresses[lo:hi] - addr) // 4] = values[lo:hi]
+        if out is not None:
+            out[:length] = val
+            return out
+        return val
+
+    def reads_many(self, ranges):
+        return [self.reads(addr, length) for addr, length in ranges]
+
+    def reads_bulk(self, addr, length, out=None):
+        return self.reads(addr, length, out=out)
+
+    def writes_bulk(self, addr, values):
+        return self.writes(addr, values)
+
+    def reads_int16(self, addr, length, out=None):
+        x = np.array(self.reads(addr, length) & 0x3FFF, dtype=np.int16)
+        x[x >= 2 ** 13] -= 2 ** 14
+        if out is not None:
+            out[:length] = x
+            return out
+        return x
+
+    def flush(self):
+        return True
+
+    async def drain(self):
+        return True
+
+    def server_stats(self, reset=False):
+        return dict()
+
+    def _samples(self, addr, n):
+        """ returns n successive values of the 14-bit signed register at addr
+        """
+        values = self.reads(addr, 1)[0]
+        for first, last, function in self._handlers:
+            if first <= addr < last:
+                values = function(np.full(n, addr, dtype=np.int64))
+        values = np.resize(np.asarray(values, dtype=np.int64) & 0x3FFF, n)
+        values[values >= 2 ** 13] -= 2 ** 14
+        return values
+
+    def reads_stats(self, addrs, duration=1e-2, max_samples=0):
+        # a single vectorized batch of samples stands for the sampler loop
+        n = max_samples or 1000
+        records = np.zeros(len(addrs), dtype=STATS_DTYPE)
+        for i, addr in enumerate(addrs):
+            values = self._samples(addr, n)
+            records[i] = (n, values.sum(), (values ** 2).sum(), values.min(),
+                          values.max())
+        return records
+
     def writes(self, addr, values): # pragma: no-cover
-        for i, v in enumerate(values):
-            self.fpgamemory[str(addr+0x4*i)]=v
-    
+        # int64 values are stored modulo 2**32 like in the FPGA
+        values = np.asarray(values, dtype=np.int64)
+        if not self._valid(addr, len(values)):
+            for i, v in enumerate(values):
+                self._sparse[addr+0x4*i] = int(v) % 2**32
+        else:
+            start = (addr - FPGA_BASE) // 4
+            self._memory[start:start + len(values)] = values
+
+    def writes_masked(self, addr, values, masks):
+        values = np.asarray(values, dtype=np.int64)
+        masks = np.asarray(masks, dtype=np.int64)
+        old = self.reads(addr, len(values)).astype(np.int64)
+        self.writes(addr, (old & ~masks) | (values & masks))
+
     def restart(self):
         pass
     
     def close(self):
-        pass
\ No newline at end of file
+        pass
+
+
+class AsyncDummyClient(object):  # pragma: no cover
+    """ coroutine interface to a DummyClient or LocalMmapClient, whose
+    requests do not wait for the network (see AsyncMonitorClient) """
+    def __init__(self, client):
+        self._client = client
+
+    async def reads(self, addr, length):
+        return self._client.reads(addr, length)
+
+    async def reads_int16(self, addr, length):
+        return self._client.reads_int16(addr, length)
+
+    async def writes(self, addr, values):
+        return self._client.writes(addr, values)
+
+    async def writes_masked(self, addr, values, masks):
+        return self._client.writes_masked(addr, values, masks)
+
+    def close(self):
+        pass
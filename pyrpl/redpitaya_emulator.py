@@ -0,0 +1,512 @@
+###############################################################################
+#    pyrpl - DSP servo controller for quantum optics with the RedPitaya
+#    Copyright (C) 2014-2016  Leonhard Neuhaus  (neuhaus@spectro.jussieu.fr)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+"""
+A pure-python emulation of monitor_server and of the FPGA registers behind
+it, such that the communication with the Red Pitaya can be tested and
+benchmarked without hardware. Use it with RedPitaya(hostname='_EMULATED_'),
+or start an EmulatorServer and connect any client to its port.
+"""
+import asyncio
+import logging
+import threading
+import numpy as np
+from .redpitaya_client import DummyClient, FPGA_BASE, FPGA_SIZE, \
+    MAX_LENGTH, MAX_RANGES, MAX_STATS_SIGNALS, STATS_DTYPE, SERVER_VERSION, \
+    MAX_CLIENTS, LEGACY_SERVER_INFO, HELLO_FIELDS
+from .hardware_modules.dsp import dsp_addr_base, DSP_INPUTS
+from .pyrpl_utils import time
+
+logger = logging.getLogger(name=__name__)
+
+# addresses of the emulated scope
+SCOPE_BASE = 0x40100000
+SCOPE_DATA_LENGTH = 2 ** 14
+# number of samples per second of the sampler loop of monitor_server
+SAMPLER_RATE = 1e6
+
+
+class EmulatedRegisters(object):
+    """
+    the FPGA address space as seen by monitor_server.
+
+    All registers hold the last written value, except for the registers
+    whose behavior is emulated: the state machine, timestamps, write
+    pointers and data buffers of the scope, the inputs in1 and in2 as seen
+    by the scope and the sampler, and the network analyzer sums of the iq
+    modules. The constant registers describing the DSP modules have the
+    same values as with DummyClient.
+    """
+    def __init__(self, noise=20):
+        self.noise = noise  # rms noise of the analog inputs in counts
+        self._start_time = time()
+        # like DummyClient, 1 avoids divisions by zero for most registers
+        self.memory = np.ones(FPGA_SIZE // 4, dtype=np.uint32)
+        for addr, value in DummyClient.constant_registers().items():
+            self._set(addr, value)
+        self._set(SCOPE_BASE, 0)
+        self._armed_time = None  # time at which the scope was armed
+        self._trigger_time = None  # time of the last scope trigger
+        # (start address, stop address, function of the addresses)
+        self._read_hooks = [
+            (SCOPE_BASE, SCOPE_BASE + 4, self._scope_state),
+            (SCOPE_BASE + 0x18, SCOPE_BASE + 0x20, self._write_pointers),
+            (SCOPE_BASE + 0x2C, SCOPE_BASE + 0x30, self._samples_since_arm),
+            (SCOPE_BASE + 0x154, SCOPE_BASE + 0x15C, self._voltages),
+            (SCOPE_BASE + 0x15C, SCOPE_BASE + 0x16C, self._timestamps),
+            (SCOPE_BASE + 0x16C, SCOPE_BASE + 0x170, self._ones),
+            (SCOPE_BASE + 0x10000, SCOPE_BASE + 0x30000, self._scope_data)]
+        for module in ['in1', 'in2']:
+            address = dsp_addr_base(module) + 0x10
+            self._read_hooks.append((address, address + 4, self._sampler))
+        for module in DSP_INPUTS:
+            if module.startswith('iq') and not module.endswith('_2'):
+                address = dsp_addr_base(module) + 0x140
+                self._read_hooks.append((address, address + 16,
+                                         self._na_sums))
+
+    def valid(self, addr, length):
+        """ True if the length registers starting at addr exist """
+        return FPGA_BASE <= addr and addr % 4 == 0 \
+            and addr + 4 * length <= FPGA_BASE + FPGA_SIZE
+
+    def read(self, addr, length):
+        """ returns the values of length registers starting at addr """
+        start = (addr - FPGA_BASE) // 4
+        data = self.memory[start:start + length].copy()
+        stop = addr + 4 * length
+        for hook_start, hook_stop, function in self._read_hooks:
+            if hook_start < stop and addr < hook_stop:
+                first = max(hook_start, addr)
+                last = min(hook_stop, stop)
+                addresses = np.arange(first, last, 4, dtype=np.int64)
+                data[(first - addr) // 4:(last - addr) // 4] = \
+                    function(addresses)
+        return data
+
+    def write(self, addr, values):
+        """ writes values to the registers starting at addr """
+        start = (addr - FPGA_BASE) // 4
+        values = np.asarray(values, dtype=np.uint32)
+        self.memory[start:start + len(values)] = values
+        now = time()
+        for i, value in enumerate(values[:2]):
+            if addr + 4 * i == SCOPE_BASE:  # scope control register
+                if value & 2:  # reset of the write state machine
+                    self._armed_time = self._trigger_time = None
+                if value & 1:  # arm the trigger
+                    self._armed_time = now
+                    self._trigger_time = None
+            elif addr + 4 * i == SCOPE_BASE + 4:  # trigger source
+                # the emulated inputs trigger all sources except 'off'
+                if value != 0 and self._armed_time is not None:
+                    self._trigger_time = now
+
+    def write_masked(self, addr, values, masks):
+        start = (addr - FPGA_BASE) // 4
+        old = self.memory[start:start + len(values)]
+        self.write(addr, (old & ~masks) | (values & masks))
+
+    # emulated behaviors
+    def _get(self, addr):
+        return int(self.memory[(addr - FPGA_BASE) // 4])
+
+    def _set(self, addr, value):
+        self.memory[(addr - FPGA_BASE) // 4] = value
+
+    def _cycles(self, t):
+        return int((t - self._start_time) * 125e6)
+
+    def _decimation(self):
+        return max(self._get(SCOPE_BASE + 0x14), 1)
+
+    def _acquisition_done(self, now):
+        """ True if the scope has recorded all samples after the trigger """
+        delay = self._get(SCOPE_BASE + 0x10) * self._decimation() * 8e-9
+        return now >= self._trigger_time + delay
+
+    def _scope_state(self, addresses):
+        now = time()
+        state = self._get(SCOPE_BASE) & ~0x7
+        if self._armed_time is not None:
+            if self._trigger_time is None:
+                state |= 1  # trigger armed
+            elif not self._acquisition_done(now):
+                state |= 4  # trigger delay running
+        return [state]
+
+    def _write_pointer(self, t):
+        return (self._cycles(t) // self._decimation()) % SCOPE_DATA_LENGTH
+
+    def _write_pointers(self, addresses):
+        now = time()
+        trigger = now if self._trigger_time is None else self._trigger_time
+        values = {SCOPE_BASE + 0x18: self._write_pointer(now),
+                  SCOPE_BASE + 0x1C: self._write_pointer(trigger)}
+        return [values[int(a)] for a in addresses]
+
+    def _samples_since_arm(self, addresses):
+        if self._armed_time is None:
+            return [0]
+        samples = (self._cycles(time()) - self._cycles(self._armed_time)) \
+            // self._decimation()
+        return [min(samples, 2 ** 32 - 1)]
+
+    def _timestamps(self, addresses):
+        now = self._cycles(time())
+        trigger = 0 if self._trigger_time is None \
+            else self._cycles(self._trigger_time)
+        values = {SCOPE_BASE + 0x15C: now & 0xFFFFFFFF,
+                  SCOPE_BASE + 0x160: (now >> 32) & 0xFFFFFFFF,
+                  SCOPE_BASE + 0x164: trigger & 0xFFFFFFFF,
+                  SCOPE_BASE + 0x168: (trigger >> 32) & 0xFFFFFFFF}
+        return [values[int(a)] for a in addresses]
+
+    def _ones(self, addresses):
+        return np.ones(len(addresses), dtype=np.uint32)
+
+    def _noise(self, n):
+        return np.random.normal(scale=self.noise, size=n)
+
+    def _to_register(self, samples):
+        """ converts signed samples into 14-bit register values """
+        samples = np.clip(np.round(samples), -2 ** 13, 2 ** 13 - 1)
+        return samples.astype(np.int64) & 0x3FFF
+
+    def _voltages(self, addresses):
+        return self._to_register(self._noise(len(addresses)))
+
+    def _scope_data(self, addresses):
+        # channel 1 records a sine, channel 2 a cosine of 8 periods
+        index = (addresses - SCOPE_BASE - 0x10000) // 4
+        channel = index // SCOPE_DATA_LENGTH
+        phase = 2 * np.pi * 8 * (index % SCOPE_DATA_LENGTH) \
+            / SCOPE_DATA_LENGTH + channel * np.pi / 2
+        return self._to_register(2 ** 12 * np.sin(phase)
+                                 + self._noise(len(addresses)))
+
+    def _sampler(self, addresses):
+        return self._to_register(self._noise(len(addresses)))
+
+    def _na_sums(self, addresses):
+        # a constant transfer function of 0.5 for each averaging cycle
+        base = int(addresses[0]) & ~0xFFFF  # base address of the iq module
+        averages = self._get(base + 0x130)
+        i_sum = int(averages * 2 ** 12)
+        q_sum = int(averages * self._noise(1)[0])
+        values = {base + 0x140: i_sum & 0x7FFFFFFF,
+                  base + 0x144: (i_sum >> 31) & 0x7FFFFFFF,
+                  base + 0x148: q_sum & 0x7FFFFFFF,
+                  base + 0x14C: (q_sum >> 31) & 0x7FFFFFFF}
+        return [values[int(a)] for a in addresses]
+
+    def _samples(self, addr, n):
+        """ returns n successive values of the register at addr """
+        for hook_start, hook_stop, function in self._read_hooks:
+            if hook_start <= addr < hook_stop:
+                return np.asarray(function(np.full(n, addr, dtype=np.int64)),
+                                  dtype=np.uint32)
+        return np.full(n, self._get(addr), dtype=np.uint32)
+
+    def stats(self, addrs, duration, max_samples):
+        """
+        returns the statistics of the sampler request 's' as an array of
+        dtype STATS_DTYPE, together with the sampling duration in seconds
+        """
+        count = max(int(duration * SAMPLER_RATE), 1)
+        if max_samples:
+            count = min(count, max_samples)
+        records = np.zeros(len(addrs), dtype=STATS_DTYPE)
+        n = min(count, 1000)  # representative samples for the statistics
+        for i, addr in enumerate(addrs):
+            samples = self._samples(addr, n).astype(np.int64) & 0x3FFF
+            samples[samples >= 2 ** 13] -= 2 ** 14
+            records['count'][i] = count
+            records['sum'][i] = int(round(samples.mean() * count))
+            records['sumsq'][i] = int(round((samples ** 2).mean() * count))
+            records['min'][i] = samples.min()
+            records['max'][i] = samples.max()
+        return records, count / SAMPLER_RATE
+
+
+class EmulatorServer(object):
+    def __init__(self, port=0, latency=0.0, bandwidth=0.0, registers=None,
+                 version=SERVER_VERSION):
+        """
+        serves the monitor_server protocol for the emulated registers on
+        localhost, from an asyncio event loop in a background thread.
+
+        port: port to listen on, 0 for any free port (see self.port)
+        latency: delay of every reply in seconds, i.e. the round-trip time
+            of the emulated network
+        bandwidth: bandwidth of the emulated network in bytes per second,
+            0 for no limit. Request and reply of each transaction occupy
+            the network one after the other.
+        registers: EmulatedRegisters to serve (a new instance by default)
+        version: protocol version of the emulated server. Version 1
+            emulates the servers without the hello command (see
+            LEGACY_SERVER_INFO): only the commands 'r', 'w' and 'c' of the
+            first client are served, and the server terminates at any other
+            command or when this client disconnects.
+
+        Like monitor_server, the requests of several clients are served one
+        after the other. Only the transmission over the emulated network
+        overlaps with the service of other requests.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.registers = registers if registers is not None \
+            else EmulatedRegisters()
+        self.port = port
+        self.version = version
+        self._clients = 0  # number of connections so far
+        self._stats = dict()  # service time statistics for the 't' command
+        self._started = threading.Event()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """ starts the server and returns its port """
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="pyrpl monitor_server emulator")
+        self._thread.daemon = True
+        self._thread.start()
+        self._started.wait()
+        return self.port
+
+    def stop(self):
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def info(self):
+        """ properties of the server as returned by the hello command """
+        if self.version < 2:
+            return dict(LEGACY_SERVER_INFO)
+        # the emulated registers are always mapped
+        return dict(version=self.version, max_length=MAX_LENGTH,
+                    max_clients=MAX_CLIENTS, persistent_mapping=1)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._lock = asyncio.Lock()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._serve_client, '127.0.0.1', self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            # terminate the connections to the clients
+            all_tasks = getattr(asyncio, 'all_tasks', None) \
+                or asyncio.Task.all_tasks
+            tasks = list(all_tasks(self._loop))
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _serve_client(self, reader, writer):
+        self._clients += 1
+        if self.version < 2 and self._clients > 1:
+            # the connection is accepted by the kernel, but never served
+            while await reader.read(4096):
+                pass
+            writer.close()
+            return
+        connection = _EmulatedConnection(self, writer)
+        try:
+            while True:
+                header = await reader.readexactly(8)
+                async with self._lock:
+                    start = time()
+                    request_length, reply = \
+                        await self._serve_request(header, reader)
+                    if reply is not None:  # failed requests are not recorded
+                        self._record_stats(header[0], time() - start)
+                if reply is None:
+                    break
+                connection.send(8 + request_length, reply)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # connection closed by the client
+        except asyncio.CancelledError:
+            pass  # the emulator is stopped
+        except ValueError as e:
+            logger.error("Emulated monitor_server closes a connection: %s", e)
+        connection.close()
+        if self.version < 2:  # the server program terminates
+            self._server.close()
+
+    async def _serve_request(self, header, reader):
+        """
+        serves the request starting with header. Returns the number of
+        bytes of the request body and the reply, or None for the reply
+        to close the connection.
+        """
+        command = header[:1]
+        length = header[2] + (header[3] << 8)
+        addr = int(np.frombuffer(header[4:8], dtype='<u4')[0])
+        registers = self.registers
+        if self.version < 2:
+            if length == 0:
+                return 0, b''  # ignored
+            if command not in [b'r', b'w', b'c']:
+                logger.error("Emulated monitor_server of version %d "
+                             "terminates at the unknown command %s.",
+                             self.version, command)
+                return 0, None
+        if command == b't':
+            return 0, header + self._stats_reply(reset=(addr != 0))
+        if command == b'h':
+            info = self.info
+            return 0, header + np.array([info[field] for field in
+                                         HELLO_FIELDS], dtype='<u4').tobytes()
+        if command in [b'R', b'W']:
+            extension = await reader.readexactly(4)
+            length = int(np.frombuffer(extension, dtype='<u4')[0])
+            self._check(addr, length)
+            if command == b'R':
+                return 4, header + extension \
+                    + registers.read(addr, length).tobytes()
+            data = await reader.readexactly(4 * length)
+            registers.write(addr, np.frombuffer(data, dtype='<u4'))
+            return 4 + 4 * length, header + extension
+        length = min(length, MAX_LENGTH)
+        if length == 0:
+            return 0, b''
+        if command == b'r':
+            self._check(addr, length)
+            return 0, header + registers.read(addr, length).tobytes()
+        elif command == b'p':
+            self._check(addr, length)
+            samples = (registers.read(addr, length) & 0x3FFF).astype(np.int16)
+            samples[samples >= 2 ** 13] -= 2 ** 14
+            return 0, header + samples.tobytes()
+        elif command == b'w':
+            data = await reader.readexactly(4 * length)
+            self._check(addr, length)
+            registers.write(addr, np.frombuffer(data, dtype='<u4'))
+            return 4 * length, header
+        elif command == b'g':
+            if length > MAX_RANGES:
+                raise ValueError("too many ranges in gather-read")
+            data = await reader.readexactly(8 * length)
+            ranges = np.frombuffer(data, dtype='<u4').reshape(-1, 2)
+            if ranges[:, 1].sum(dtype=np.uint64) > MAX_LENGTH:
+                raise ValueError("gather-read exceeds maximum length")
+            reply = [header]
+            for range_addr, range_length in ranges:
+                self._check(int(range_addr), int(range_length))
+                reply.append(registers.read(int(range_addr),
+                                            int(range_length)).tobytes())
+            return 8 * length, b''.join(reply)
+        elif command == b'm':
+            if length > MAX_RANGES:
+                raise ValueError("too many registers in masked write")
+            data = await reader.readexactly(8 * length)
+            self._check(addr, length)
+            values_and_masks = np.frombuffer(data, dtype='<u4')
+            registers.write_masked(addr, values_and_masks[0::2],
+                                   values_and_masks[1::2])
+            return 8 * length, header
+        elif command == b's':
+            if length > MAX_STATS_SIGNALS:
+                raise ValueError("too many signals for statistics")
+            data = await reader.readexactly(4 * (2 + length))
+            body = np.frombuffer(data, dtype='<u4')
+            addrs = [int(a) for a in body[2:]]
+            for signal_addr in addrs:
+                self._check(signal_addr, 1)
+            start = time()
+            records, duration = registers.stats(addrs, body[0] * 1e-6,
+                                                int(body[1]))
+            # the server is busy sampling
+            await asyncio.sleep(max(duration - (time() - start), 0))
+            return 4 * (2 + length), header + records.tobytes()
+        elif command == b'c':
+            return 0, None
+        return 0, b''  # all other messages are ignored
+
+    def _check(self, addr, length):
+        if not self.registers.valid(addr, length):
+            raise ValueError("invalid address %s" % hex(addr))
+
+    def _record_stats(self, command, duration):
+        count, total, minimum, maximum = self._stats.get(
+            command, (0, 0.0, duration, duration))
+        self._stats[command] = (count + 1, total + duration,
+                                min(minimum, duration),
+                                max(maximum, duration))
+
+    def _stats_reply(self, reset=False):
+        records = [len(self._stats)]
+        for command, (count, total, minimum, maximum) in \
+                sorted(self._stats.items()):
+            total_ns = int(total * 1e9)
+            records += [command, count, total_ns & 0xFFFFFFFF,
+                        total_ns >> 32, int(minimum * 1e9),
+                        int(maximum * 1e9)]
+        if reset:
+            self._stats.clear()
+        return np.array(records, dtype='<u4').tobytes()
+
+
+class _EmulatedConnection(object):
+    """ delays the replies to one client according to the emulated
+    network """
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self._loop = asyncio.get_event_loop()
+        self._free_time = 0.0  # time when the emulated network is free
+
+    def send(self, request_bytes, reply):
+        if not reply:
+            return
+        server = self.server
+        if not server.latency and not server.bandwidth:
+            self.writer.write(reply)
+            return
+        now = self._loop.time()
+        transfer_time = 0.0
+        if server.bandwidth:
+            transfer_time = (request_bytes + len(reply)) / server.bandwidth
+        # replies arrive in order, after the previous ones
+        self._free_time = max(now, self._free_time) + transfer_time
+        self._loop.call_at(self._free_time + server.latency, self._write,
+                           reply)
+
+    def _write(self, reply):
+        if not self.writer.transport.is_closing():
+            self.writer.write(reply)
+
+    def close(self):
+        # pending delayed replies are still sent
+        delay = max(self._free_time + self.server.latency
+                    - self._loop.time(), 0)
+        self._loop.call_later(delay, self.writer.close)
@@ -4,7 +4,9 @@ from ..attributes import SelectProperty, StringProperty, TextProperty, \
     CurveProperty, CurveSelectProperty, CurveSelectListProperty
 from ..memory import MemoryTree
 from ..modules import Module
-from ..widgets.module_widgets.curve_viewer_widget import CurveViewerWidget
+from ..widgets import widget_class
+CurveViewerWidget = widget_class('module_widgets.curve_viewer_widget',
+                                 'CurveViewerWidget')
 from ..curvedb import CurveDB
 
 
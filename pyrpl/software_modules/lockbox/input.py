@@ -4,7 +4,8 @@ import numpy as np
 import logging
 from ...attributes import SelectProperty, FloatProperty, FrequencyProperty, \
     PhaseProperty, FilterProperty, FrequencyRegister, ProxyProperty
-from ...widgets.module_widgets import LockboxInputWidget
+from ...widgets import widget_class
+LockboxInputWidget = widget_class('module_widgets', 'LockboxInputWidget')
 from ...hardware_modules.dsp import DSP_INPUTS, InputSelectProperty, all_inputs
 from ...pyrpl_utils import time, recursive_getattr
 from ...module_attributes import ModuleProperty
@@ -124,17 +125,23 @@ class Signal(LockboxModule, SignalModule):
             if t is None:
                 t = self.sampler_time
             # get fresh data
-            self._lastmean, self._lastrms, self._lastmax, self._lastmin\
-                = self.pyrpl.rp.sampler.stats(self.signal(), t=t)
-            # subtract analog offset from all non-relative values
-            self._lastmean -= self.calibration_data._analog_offset
-            self._lastmax -= self.calibration_data._analog_offset
-            self._lastmin -= self.calibration_data._analog_offset
-            # save a timestamp and the employed sampler time
-            self._lasttime = time()
-            self._lastt = t
+            self._set_stats(self.pyrpl.rp.sampler.stats(self.signal(), t=t),
+                            t)
         return self._lastmean, self._lastrms, self._lastmax, self._lastmin
 
+    def _set_stats(self, stats, t):
+        """ stores the tuple (mean, rms, max, min) returned by the sampler
+        for duration t, such that subsequent calls to stats() within the
+        sampler time return these values """
+        self._lastmean, self._lastrms, self._lastmax, self._lastmin = stats
+        # subtract analog offset from all non-relative values
+        self._lastmean -= self.calibration_data._analog_offset
+        self._lastmax -= self.calibration_data._analog_offset
+        self._lastmin -= self.calibration_data._analog_offset
+        # save a timestamp and the employed sampler time
+        self._lasttime = time()
+        self._lastt = t
+
     @property
     def mean(self):
         # get fresh data
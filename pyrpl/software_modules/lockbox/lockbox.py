@@ -6,12 +6,14 @@ from ...modules import SignalLauncher
 from ...module_attributes import ModuleListProperty
 from .input import *
 from .output import *
-from ...widgets.module_widgets import LockboxWidget
+from ...widgets import widget_class
+LockboxWidget = widget_class('module_widgets', 'LockboxWidget')
 from ...pyrpl_utils import all_subclasses
 from .stage import Stage
 from . import LockboxModule, LockboxModuleDictProperty
 from . import LockboxLoop, LockboxPlotLoop
-from ...widgets.module_widgets.lockbox_widget import LockboxSequenceWidget
+LockboxSequenceWidget = widget_class('module_widgets.lockbox_widget',
+                                     'LockboxSequenceWidget')
 from pyrpl.async_utils import wait, sleep_async, sleep, ensure_future, Event
 
 
@@ -387,12 +389,30 @@ class Lockbox(LockboxModule):
                 input = self.current_stage.input
         if not isinstance(input, InputSignal):
             input = self.inputs[input]
+        # sample all inputs within one sampling window
+        self.sample_inputs()
         # call is_locked of the input
         try:
             return input.is_locked(loglevel=loglevel)
         except TypeError: # occurs if is_locked takes no argument loglevel
             return input.is_locked()
 
+    def sample_inputs(self, t=None):
+        """ samples all inputs simultaneously over the duration t, such that
+        the subsequent evaluation of their mean, rms, max and min does not
+        require any further sampling. If t is None, the longest sampler_time
+        of all inputs is used. """
+        inputs = list(self.inputs)
+        if not inputs:
+            return
+        if t is None:
+            t = max(input.sampler_time for input in inputs)
+        signals = [input.signal() for input in inputs]
+        records = self.pyrpl.rp.sampler.stats_many(signals, t=t)
+        for input, record in zip(inputs, records):
+            input._set_stats((float(record['mean']), float(record['stddev']),
+                              float(record['max']), float(record['min'])), t)
+
     def is_locked_and_final(self, loglevel=logging.INFO):
         return (self.current_state == self.sequence[-1] and
                 self.is_locked(loglevel=loglevel))
@@ -496,8 +516,8 @@ class Lockbox(LockboxModule):
             if callable(val):
                 val = val()
             d[var] = val
+        self.sample_inputs(t=1.0)
         for o in self.inputs:
-            o.stats(t=1.0)
             d[o.name+ '_mean'] = o.mean
             d[o.name + '_rms'] = o.rms
             d[o.name + '_calibration_data_min'] = o.calibration_data.min
@@ -1,7 +1,6 @@
 from __future__ import division
 
 import numpy as np
-from scipy import interpolate
 
 from ...software_modules.lockbox.input import Signal
 from ...attributes import BoolProperty, FloatProperty, SelectProperty, \
@@ -9,7 +8,8 @@ from ...attributes import BoolProperty, FloatProperty, SelectProperty, \
 from ...curvedb import CurveDB
 from ...hardware_modules.asg import Asg0, Asg1
 from ...hardware_modules.pid import Pid
-from ...widgets.module_widgets import OutputSignalWidget
+from ...widgets import widget_class
+OutputSignalWidget = widget_class('module_widgets', 'OutputSignalWidget')
 
 
 class AdditionalFilterAttribute(FilterProperty):
@@ -345,6 +345,7 @@ class OutputSignal(Signal):
             x = curve.data.index
             y = curve.data.values
             # sample the curve transfer function at the requested frequencies
+            from scipy import interpolate  # slow import, only when needed
             ampl = interpolate.interp1d(x, abs(y))(freqs)
             phase = interpolate.interp1d(x, np.unwrap(np.angle(y)))(freqs)
             analog_tf = ampl * np.exp(1j * phase)
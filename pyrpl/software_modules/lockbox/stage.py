@@ -4,8 +4,11 @@ from ...attributes import SelectProperty, FloatProperty, BoolProperty, \
     StringProperty
 from ...module_attributes import *
 from ...hardware_modules import InputSelectProperty
-from ...widgets.module_widgets import ReducedModuleWidget, \
-    LockboxSequenceWidget, LockboxStageWidget, StageOutputWidget
+from ...widgets import widget_class
+ReducedModuleWidget = widget_class('module_widgets', 'ReducedModuleWidget')
+LockboxSequenceWidget = widget_class('module_widgets', 'LockboxSequenceWidget')
+LockboxStageWidget = widget_class('module_widgets', 'LockboxStageWidget')
+StageOutputWidget = widget_class('module_widgets', 'StageOutputWidget')
 from qtpy import QtCore
 from collections import OrderedDict
 from pyrpl.async_utils import sleep_async, ensure_future, wait
@@ -115,27 +118,29 @@ class Stage(LockboxModule):
         """
         Setup the lockbox parameters according to this stage
         """
-        for output in self.lockbox.outputs:
-            setting = self.outputs[output.name]
-            if setting.lock_on == 'ignore':
-                # this part is here to remind you that BoolIgnoreProperties
-                # should not be typecasted into bools, i.e. you should avoid
-                # to write "if setting.lock_on: do_sth()" because the setting
-                # 'ignore' will be interpreted identically as "True"
-                pass
-            if setting.lock_on == False:
-                output.unlock()
-            if setting.reset_offset:
-                output._setup_offset(setting.offset)
-        # make a new iteration for enabling lock, in order
-        # to be sure that all offsets are reset before starting lock
-        for output in self.lockbox.outputs:
-            setting = self.outputs[output.name]
-            if setting.lock_on == True:
-                output.lock(input=self.input,
-                            setpoint=self.setpoint,
-                            offset=setting.offset if setting.reset_offset else None,
-                            gain_factor=self.gain_factor)
+        # coalesce all register writes of the stage into a few requests
+        with self.lockbox.transaction():
+            for output in self.lockbox.outputs:
+                setting = self.outputs[output.name]
+                if setting.lock_on == 'ignore':
+                    # this part is here to remind you that BoolIgnoreProperties
+                    # should not be typecasted into bools, i.e. you should avoid
+                    # to write "if setting.lock_on: do_sth()" because the setting
+                    # 'ignore' will be interpreted identically as "True"
+                    pass
+                if setting.lock_on == False:
+                    output.unlock()
+                if setting.reset_offset:
+                    output._setup_offset(setting.offset)
+            # make a new iteration for enabling lock, in order
+            # to be sure that all offsets are reset before starting lock
+            for output in self.lockbox.outputs:
+                setting = self.outputs[output.name]
+                if setting.lock_on == True:
+                    output.lock(input=self.input,
+                                setpoint=self.setpoint,
+                                offset=setting.offset if setting.reset_offset else None,
+                                gain_factor=self.gain_factor)
         # optionally call a user function at the end of the stage
         if self.function_call != "":
             try:
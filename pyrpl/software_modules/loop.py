@@ -2,7 +2,6 @@
 Defines a number of Loop modules to be used to perform periodically a task
 """
 import numpy as np
-import pyqtgraph as pg
 from ..modules import Module
 from ..async_utils import sleep_async, wait, ensure_future #MainThreadTimer
 from ..pyrpl_utils import time
@@ -134,6 +133,7 @@ class PlotWindow(object):
 
     close() closes the plot"""
     def __init__(self, title="plotwindow"):
+        import pyqtgraph as pg  # only needed with a gui
         self.win = pg.GraphicsWindow(title=title)
         self.pw = self.win.addPlot()
         self.curves = {}
@@ -50,8 +50,14 @@ starting from the end of the list) is returned by the module manager:
 
 import logging
 logger = logging.getLogger(name=__name__)
-from ..widgets.module_widgets import ModuleManagerWidget, AsgManagerWidget, PidManagerWidget, IqManagerWidget, \
-    ScopeManagerWidget, IirManagerWidget, PwmManagerWidget
+from ..widgets import widget_class
+ModuleManagerWidget = widget_class('module_widgets', 'ModuleManagerWidget')
+AsgManagerWidget = widget_class('module_widgets', 'AsgManagerWidget')
+PidManagerWidget = widget_class('module_widgets', 'PidManagerWidget')
+IqManagerWidget = widget_class('module_widgets', 'IqManagerWidget')
+ScopeManagerWidget = widget_class('module_widgets', 'ScopeManagerWidget')
+IirManagerWidget = widget_class('module_widgets', 'IirManagerWidget')
+PwmManagerWidget = widget_class('module_widgets', 'PwmManagerWidget')
 from ..modules import Module
 
 
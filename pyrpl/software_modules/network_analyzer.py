@@ -1,7 +1,6 @@
 from copy import copy
 
 import numpy as np
-from qtpy import QtWidgets
 import logging
 
 from ..async_utils import wait, ensure_future, sleep_async #PyrplFuture,
@@ -13,7 +12,8 @@ from ..attributes import FloatProperty, SelectProperty, FrequencyProperty, \
 from ..hardware_modules import all_inputs, all_output_directs, InputSelectProperty
 from ..modules import SignalModule
 from ..acquisition_module import AcquisitionModule
-from ..widgets.module_widgets import NaWidget
+from ..widgets import widget_class
+NaWidget = widget_class('module_widgets', 'NaWidget')
 from ..hardware_modules.iq import Iq
 
 # timeit.default_timer() is THE precise timer to use (microsecond precise vs
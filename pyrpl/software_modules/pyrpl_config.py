@@ -3,7 +3,9 @@ logger = logging.getLogger(name=__name__)
 from ..attributes import SelectProperty, StringProperty, TextProperty
 from ..memory import MemoryTree
 from ..modules import Module
-from ..widgets.module_widgets.pyrpl_config_widget import PyrplConfigWidget
+from ..widgets import widget_class
+PyrplConfigWidget = widget_class('module_widgets.pyrpl_config_widget',
+                                 'PyrplConfigWidget')
 
 
 class PyrplConfig(Module):
@@ -108,11 +108,10 @@ from ..module_attributes import *
 from ..hardware_modules import Scope
 from ..hardware_modules.dsp import all_inputs, InputSelectProperty
 from ..acquisition_module import AcquisitionModule
-from ..widgets.module_widgets import SpecAnWidget
+from ..widgets import widget_class
+SpecAnWidget = widget_class('module_widgets', 'SpecAnWidget')
 
 import sys
-import scipy.signal as sig
-import scipy.fftpack as fft
 
 
 # Some initial remarks about spectrum estimation:
@@ -398,6 +397,7 @@ class SpectrumAnalyzer(AcquisitionModule):
             window_name = ('gaussian', self.data_length/10)
         else:
             window_name = self.window
+        import scipy.signal as sig  # slow import, only when needed
         window = sig.get_window(window_name, self.data_length, fftbins=False)
         # empirical value for scaling flattop to sqrt(W)/V
         window/=(np.sum(window)/2)
@@ -456,6 +456,7 @@ class SpectrumAnalyzer(AcquisitionModule):
             return np.fft.rfftfreq(self.data_length*self.PADDING_FACTOR,
                                    self.sampling_time)
         else:
+            import scipy.fftpack as fft  # slow import, only when needed
             return self.center + fft.fftshift( fft.fftfreq(
                                   self.data_length*self.PADDING_FACTOR,
                                   self.sampling_time)) #[self.useful_index()]
@@ -611,6 +612,7 @@ class SpectrumAnalyzer(AcquisitionModule):
             return res/abs(self.transfer_function(self.frequencies))**2
         else:
             # Realize the complex fft of iq data
+            import scipy.fftpack as fft  # slow import, only when needed
             res = fft.fftshift(fft.fft(iq_data,
                                         self.data_length*self.PADDING_FACTOR))
             # at some point we need to cache the tf for performance
@@ -18,7 +18,7 @@
 
 
 import paramiko
-from time import sleep
+from time import sleep, time
 from scp import SCPClient
 import logging
 
@@ -43,6 +43,7 @@ class SshShell(object):
         self.user = user
         self.password = password
         self.timeout= timeout
+        self._sync_counter = 0  # makes the markers of ask_sync unique
         self.ssh = paramiko.SSHClient()
         self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.ssh.connect(
@@ -88,6 +89,49 @@ class SshShell(object):
     def ask(self, question=""):
         return self.askraw(question + '\n')
 
+    def ask_sync(self, question="", timeout=None):
+        """
+        Same as ask(), except that instead of waiting for a fixed delay,
+        this function returns as soon as the shell has executed question,
+        or after timeout seconds (defaults to self.timeout). The shell
+        signals the completion by echoing a marker after the command.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        marker = self._send_with_marker(question)
+        result = ""
+        deadline = time() + timeout
+        while True:
+            result += self.read()
+            lines = [line.strip() for line in result.splitlines()]
+            if marker in lines:
+                # drop the echo of the marker and the following prompt
+                return '\n'.join(result.splitlines()[:lines.index(marker)])
+            if time() > deadline:
+                self._logger.debug("Shell did not finish within %s s: %s",
+                                   timeout, question)
+                return result
+            sleep(0.002)
+
+    def launch(self, command):
+        """
+        starts command in the shell without waiting for its completion and
+        returns a function that returns True once command has terminated
+        """
+        marker = self._send_with_marker(command)
+        output = [""]
+        def terminated():
+            output[0] += self.read()
+            return marker in [line.strip() for line in output[0].splitlines()]
+        return terminated
+
+    def _send_with_marker(self, command):
+        """ sends command, followed by the echo of a unique marker """
+        self._sync_counter += 1
+        marker = "pyrpl_done_%d" % self._sync_counter
+        self.write(command + '\necho ' + marker + '\n')
+        return marker
+
     def __del__(self):
         self.endapp()
         try:
@@ -0,0 +1,54 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import asyncio
+import threading
+import time
+from ..async_utils import ThreadLoopBackend
+
+
+class TestThreadLoopBackend(object):
+    def setup(self):
+        self.backend = ThreadLoopBackend()
+
+    def teardown(self):
+        self.backend.stop()
+
+    def wait(self, future, timeout=None):
+        future = self.backend.ensure_future(future)
+        done, pending = self.backend.wait(future, timeout=timeout)
+        return future.result() if future in done else None
+
+    def test_background_task(self):
+        """ tasks progress without any call of wait """
+        async def set_flag():
+            await asyncio.sleep(0.01)
+            flag.set()
+        flag = threading.Event()
+        task = self.backend.ensure_future(set_flag())
+        assert flag.wait(1.0)
+        assert task.done()
+
+    def test_wait(self):
+        async def double(x):
+            await asyncio.sleep(0.01)
+            return 2 * x
+        assert self.wait(self.backend.ensure_future(double(2))) == 4
+        assert self.wait(double(3)) == 6
+        task = self.backend.ensure_future(asyncio.sleep(1.0))
+        assert self.wait(task, timeout=0.01) is None
+        task.cancel()
+
+    def test_cancel_from_other_thread(self):
+        task = self.backend.ensure_future(asyncio.sleep(10.0))
+        assert task.cancel()
+        t0 = time.time()
+        while not task.done() and time.time() < t0 + 1.0:
+            time.sleep(0.001)
+        assert task.cancelled()
+
+    def test_wait_in_loop_thread(self):
+        async def nested_wait():
+            self.backend.wait(self.backend.ensure_future(asyncio.sleep(0)))
+        task = self.backend.ensure_future(nested_wait())
+        self.backend.wait(task)
+        assert isinstance(task.exception(), RuntimeError)
@@ -0,0 +1,41 @@
+# tests of the skipping of the flashing of the FPGA
+import logging
+logger = logging.getLogger(name=__name__)
+import os
+import tempfile
+from .. import RedPitaya
+from .test_server_startup import LocalShell
+
+
+class TestFpgaMarker(object):
+    """ tests skipping the flashing of an identical bitfile """
+    def setup(self):
+        self.r = RedPitaya(hostname='_FAKE_', config=None)
+        self.r.ssh = LocalShell()
+        fd, self.r._FPGA_MARKER = tempfile.mkstemp()
+        os.close(fd)  # an empty marker file is not valid
+
+    def teardown(self):
+        if os.path.exists(self.r._FPGA_MARKER):
+            os.remove(self.r._FPGA_MARKER)
+
+    def test_marker(self):
+        bitfile = os.path.join(os.path.dirname(__file__), os.pardir, 'fpga',
+                               'red_pitaya.bin')
+        digest = self.r._bitfile_digest(bitfile)
+        assert self.r._fpga_marker() is None
+        self.r._write_fpga_marker(digest)
+        assert self.r._fpga_marker() == digest
+        # an identical bitfile is not uploaded again
+        assert self.r.update_fpga(filename=bitfile) is False
+        # the marker of a previous boot is not valid
+        with open(self.r._FPGA_MARKER, 'w') as f:
+            f.write(digest + ' 00000000-0000-0000-0000-000000000000\n')
+        assert self.r._fpga_marker() is None
+
+    def test_remove_marker(self):
+        self.r._write_fpga_marker('0123456789abcdef0123456789abcdef')
+        assert self.r._fpga_marker() is not None
+        self.r._remove_fpga_marker()
+        assert self.r._fpga_marker() is None
+        assert not os.path.exists(self.r._FPGA_MARKER)
@@ -32,3 +32,16 @@ class TestInput(TestPyrpl):
             # needs a small margin to work properly because of rounding off towards negative values in asg
             assert min + 2.0**(-14) >= asg.offset - asg.amplitude, \
                 (mean, std, max, min, min + 2.0**(-14), asg.offset - asg.amplitude)
+
+    def test_stats_many(self):
+        signals = ['in1', 'in2', 'asg0']
+        records = self.sampler.stats_many(signals, t=0.1)
+        assert len(records) == len(signals), records
+        for signal, record in zip(signals, records):
+            assert record['count'] > 0, (signal, record)
+            assert record['min'] <= record['mean'] <= record['max'], \
+                (signal, record)
+            assert record['stddev'] <= (record['max'] - record['min']) / 2.0\
+                + 1e-9, (signal, record)
+        mean, std, max, min = self.sampler.stats('in1', t=0.1)
+        assert isinstance(mean, float), mean
@@ -0,0 +1,151 @@
+# tests of the communication with servers before version 2, emulated with
+# EmulatorServer(version=1), which terminates at any command that the
+# shipped servers of older pyrpl versions do not know
+import logging
+logger = logging.getLogger(name=__name__)
+import socket
+import numpy as np
+from .. import RedPitaya
+from ..redpitaya import defaultparameters
+from ..async_utils import wait
+from ..redpitaya_client import MonitorClient, AsyncDummyClient, ClientPool, \
+    MAX_LENGTH, MAX_RANGES
+from ..redpitaya_emulator import EmulatorServer
+
+
+class TestLegacyServer(object):
+    """ tests the fallbacks of the client for servers before version 2 """
+    def setup(self):
+        self.r = RedPitaya(hostname='_EMULATED_', config=None,
+                           parameters=dict(defaultparameters),
+                           emulator_version=1)
+        self.client = self.r._unrecorded_client()
+
+    def teardown(self):
+        self.r.end()
+
+    def assert_server_alive(self):
+        """ the emulated server terminates at unknown commands """
+        assert self.r._emulator._server.is_serving()
+        assert self.client.reads(0x40300104, 1) is not None
+
+    def test_server_version(self):
+        assert self.r.server_version == 1, self.r.server_info
+        assert self.client.server_version == 1
+        self.assert_server_alive()
+
+    def test_emulator(self):
+        server = EmulatorServer(version=1)
+        sock = socket.create_connection(('127.0.0.1', server.start()))
+        sock.settimeout(0.2)
+        try:
+            # the hello command is ignored
+            sock.sendall(b'h' + bytes(7))
+            try:
+                sock.recv(8)
+            except socket.timeout:
+                pass
+            else:
+                assert False, "unexpected reply to hello"
+            # unknown commands terminate the server
+            sock.sendall(b'p\x00\x01\x00\x04\x01\x30\x40')
+            assert sock.recv(8) == b''
+        finally:
+            sock.close()
+            server.stop()
+
+    def test_writes_masked(self):
+        addr = self.r.asg0._addr_base
+        self.client.writes(addr, [0xF0F0])
+        self.client.writes_masked(addr, [0x000F], [0x00FF])
+        assert self.client.reads(addr, 1)[0] == 0xF00F
+        # bit fields of the modules
+        self.r.asg0.waveform = 'ramp'
+        self.r.asg0.on = True
+        assert self.r.asg0.waveform == 'ramp'
+        assert self.r.asg0.on
+        self.assert_server_alive()
+
+    def test_reads_int16(self):
+        addr = self.r.asg0._addr_base + 0x10000
+        words = [0x0000, 0x1FFF, 0x2000, 0x3FFF, 0xC0DE2001]
+        self.client.writes(addr, words)
+        data = self.client.reads_int16(addr, len(words))
+        assert data.dtype == np.int16
+        assert list(data) == [0, 8191, -8192, -1, -8191], data
+        out = np.zeros(len(words) + 1, dtype=np.int16)
+        self.client.reads_int16(addr, len(words), out=out)
+        assert list(out) == [0, 8191, -8192, -1, -8191, 0], out
+        # scope data buffers
+        assert len(self.r.scope._rawdata_ch1) == self.r.scope.data_length
+        assert len(self.r.scope._rawdata_ch2) == self.r.scope.data_length
+        self.assert_server_alive()
+
+    def test_sampler_stats(self):
+        mean, stddev, max, min = self.r.sampler.stats('in1', t=0.05)
+        assert min <= mean <= max and stddev >= 0, (mean, stddev, max, min)
+        records = self.r.sampler.stats_many(['in1', 'in2'], t=0.05)
+        assert all(records['count'] > 1), records
+        assert all(records['min'] <= records['max']), records
+        records = self.r.sampler.stats_many(['in1', self.r.asg0], t=0)
+        assert list(records['count']) == [1, 1], records
+        self.assert_server_alive()
+
+    def test_reads_many(self):
+        pid = self.r.pid0
+        pid.p, pid.i, pid.setpoint = 1.0, 10.0, 0.1
+        attributes = pid.setup_attributes
+        assert attributes['p'] == pid.p and attributes['i'] == pid.i, \
+            attributes
+        assert attributes['setpoint'] == pid.setpoint, attributes
+        addr = pid._addr_base
+        data = self.client.reads_many([(addr, 2), (addr + 0x100, 3)])
+        assert [len(d) for d in data] == [2, 3], data
+        self.assert_server_alive()
+
+    def test_long_transfers(self):
+        addr, n = 0x40600000, 2 * MAX_LENGTH + 3
+        values = np.arange(n, dtype=np.uint32)
+        assert self.client.writes(addr, values)
+        assert (self.client.reads(addr, n) == values).all()
+        assert self.client.writes_bulk(addr, values[::-1])
+        assert (self.client.reads_bulk(addr, n) == values[::-1]).all()
+        n = MAX_RANGES + 3
+        assert self.client.writes_masked(addr, np.zeros(n), np.full(n, 0xFF))
+        assert (self.client.reads(addr, n) == values[::-1][:n] & ~0xFF).all()
+        self.assert_server_alive()
+
+    def test_make_a_slave(self):
+        # the server of version 1 serves only one connection, the slave
+        # gets its own server
+        port = self.r.parameters['port']
+        slave = self.r.make_a_slave()
+        try:
+            assert slave._emulator is not self.r._emulator
+            assert self.r.parameters['port'] == port
+            self.r.pid0.p = 12.0
+            assert slave.pid0.p == 12.0
+            slave.pid0.p = -3.0
+            assert self.r.pid0.p == -3.0
+        finally:
+            slave.end()
+        self.assert_server_alive()
+
+    def test_async_client(self):
+        assert isinstance(self.r.async_client, AsyncDummyClient)
+        pid = self.r.pid0
+        addr = type(pid).p.address
+        wait(pid._writes_async(addr, [1234]))
+        assert wait(pid._reads_async(addr, 1))[0] == 1234
+        self.assert_server_alive()
+
+    def test_bulk_connections(self):
+        r = RedPitaya(hostname='_EMULATED_', config=None,
+                      parameters=dict(defaultparameters),
+                      emulator_version=1, bulk_connections=2)
+        try:
+            assert not isinstance(r.client, ClientPool)
+            assert len(r.scope._rawdata_ch1) == r.scope.data_length
+            assert r._emulator._server.is_serving()
+        finally:
+            r.end()
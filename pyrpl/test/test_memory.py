@@ -166,3 +166,46 @@ class TestMemory(object):
         m1._write_to_file()
         m2._write_to_file()
         os.remove(m1._filename)
+
+    def test_thread_timer(self):
+        """ the save timer that replaces the QTimer in headless mode """
+        from ..pyrpl_utils import ThreadTimer
+        calls = []
+        timer = ThreadTimer(0.05, lambda: calls.append(1))
+        assert not timer.isActive()
+        timer.start()
+        assert timer.isActive()
+        timer.stop()
+        assert not timer.isActive()
+        sleep(0.1)
+        assert calls == []
+        timer.start()
+        sleep(0.2)
+        assert calls == [1]
+        assert not timer.isActive()
+
+    def test_concurrent_write_to_file(self):
+        """ the tree is written to file while another thread modifies it """
+        import threading
+        m = MemoryTree('test_concurrent')
+        errors = []
+        def write_to_file():
+            try:
+                for i in range(20):
+                    m._write_to_file()
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=write_to_file)
+        thread.start()
+        i = 0
+        while thread.is_alive():
+            m['key%d' % (i % 1000)] = i
+            if i % 1000 == 999:
+                for k in list(m._keys()):
+                    m._pop(k)
+            i += 1
+        thread.join()
+        assert not errors, errors
+        # clean up
+        m._write_to_file()
+        os.remove(m._filename)
@@ -0,0 +1,57 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import os
+from .. import PyrplCluster, user_config_dir
+from ..redpitaya import defaultparameters
+
+
+class TestPyrplCluster(object):
+    """ starts several emulated boards in parallel """
+    config_files = ["nosetests_cluster%d" % i for i in range(3)]
+
+    @classmethod
+    def erase_config_files(cls):
+        for config in cls.config_files:
+            for extension in ['.yml', '.yml.bak']:
+                filename = os.path.join(user_config_dir, config + extension)
+                if os.path.isfile(filename):
+                    os.remove(filename)
+
+    @classmethod
+    def setUpAll(cls):
+        cls.erase_config_files()
+        cls.cluster = PyrplCluster(
+            cls.config_files, hostnames=['_EMULATED_'] * len(cls.config_files),
+            gui=False, modules=[])
+
+    @classmethod
+    def tearDownAll(cls):
+        cls.cluster._clear()
+        cls.erase_config_files()
+
+    def test_boards(self):
+        assert len(self.cluster) == len(self.config_files)
+        assert self.cluster.names == self.config_files
+        redpitayas = [pyrpl.rp for pyrpl in self.cluster]
+        # each board has its own parameters and server
+        for redpitaya in redpitayas:
+            assert redpitaya.parameters is not defaultparameters
+            assert redpitaya.client is not None
+            assert 'client' in redpitaya.parent.startup_times
+        assert len(set(id(r.parameters) for r in redpitayas)) == len(redpitayas)
+        assert len(set(r._server_port for r in redpitayas)) == len(redpitayas)
+
+    def test_setup(self):
+        self.cluster.setup('asg0', amplitude=0.3, offset=0.1)
+        for name, pyrpl in zip(self.cluster.names, self.cluster):
+            assert abs(pyrpl.rp.asg0.amplitude - 0.3) < 0.001
+            assert abs(pyrpl.rp.asg0.offset - 0.1) < 0.001
+        assert list(self.cluster.get('asg0.amplitude').keys()) == \
+            self.config_files
+
+    def test_get(self):
+        for i, pyrpl in enumerate(self.cluster):
+            pyrpl.rp.pid0.setpoint = 0.1 * i
+        setpoints = self.cluster.get('pid0.setpoint')
+        for i, name in enumerate(self.config_files):
+            assert abs(setpoints[name] - 0.1 * i) < 0.001, setpoints
@@ -0,0 +1,720 @@
+import logging
+import mmap
+import os
+import numpy as np
+import socket
+import tempfile
+import threading
+import time
+logger = logging.getLogger(name=__name__)
+from asyncio import gather
+from .test_redpitaya import TestRedpitaya
+from ..async_utils import wait
+from ..redpitaya_client import MonitorClient, AsyncMonitorClient, \
+    ThreadedClient, ClientPool, LocalMmapClient, DummyClient, \
+    RecordingClient, ReplayClient, read_recording, MAX_LENGTH, MAX_RANGES, \
+    BULK_CHUNK_LENGTH, IO_PRIORITY_WRITE, IO_PRIORITY_BULK, FPGA_BASE, \
+    FPGA_SIZE, SERVER_VERSION
+from ..redpitaya_emulator import EmulatorServer, SCOPE_BASE
+
+
+class TestClient(TestRedpitaya):
+    """ tests the extended commands of the communication client """
+    def test_reads_many(self):
+        client = self.r.client
+        base = self.r.pid0._addr_base
+        ranges = [(base + 0x104, 1), (base + 0x108, 2), (base + 0x120, 4)]
+        values = client.reads_many(ranges)
+        assert len(values) == len(ranges), values
+        for (addr, length), value in zip(ranges, values):
+            assert len(value) == length, (addr, length, value)
+            assert (value == client.reads(addr, length)).all(), \
+                (addr, length, value)
+
+    def test_setup_attributes_prefetch(self):
+        pid = self.r.pid0
+        pid.setpoint = 0.1
+        pid.p = 0.5
+        attributes = pid.setup_attributes
+        assert abs(attributes['setpoint'] - pid.setpoint) < 1e-3, attributes
+        assert abs(attributes['p'] - pid.p) < 1e-3, attributes
+        assert pid._prefetched is None
+
+    def test_failed_prefetch(self):
+        pid = self.r.pid0
+        pid.p = 0.5
+        client = pid._client
+        # no answer from the server: the registers are read one by one
+        client.reads_many = lambda ranges: None
+        try:
+            with pid._prefetch(['p', 'i']):
+                assert pid._prefetched is None
+                assert abs(pid.p - 0.5) < 1e-3, pid.p
+        finally:
+            del client.reads_many
+        # a failed read does not leave a prefetch behind
+        def reads_many(ranges):
+            raise socket.error
+        client.reads_many = reads_many
+        try:
+            with pid._prefetch(['p', 'i']):
+                pass
+        except socket.error:
+            pass
+        finally:
+            del client.reads_many
+        assert pid._prefetched is None
+        with pid._prefetch(['p', 'i']):
+            assert pid._prefetched
+
+    def test_pipelined_writes(self):
+        client = self.r.client
+        pid = self.r.pid0
+        pipelined = getattr(client, 'pipelined', False)
+        client.pipelined = True
+        try:
+            for setpoint in [0.1, 0.2, 0.3]:
+                pid.setpoint = setpoint
+            assert client.flush()
+            assert abs(pid.setpoint - 0.3) < 1e-3, pid.setpoint
+        finally:
+            client.pipelined = pipelined
+
+    def test_transaction(self):
+        pid = self.r.pid0
+        pid.p = 0.5
+        pid.paused = False
+        with pid.transaction():
+            pid.p = 0.25
+            pid.paused = True
+            # pending values are visible inside the transaction
+            assert abs(pid.p - 0.25) < 1e-3, pid.p
+            assert pid.paused
+        assert not self.r._transaction.active
+        assert abs(pid.p - 0.25) < 1e-3, pid.p
+        assert pid.paused
+        pid.paused = False
+
+    def test_transaction_order(self):
+        client = self.r.client
+        requests = []
+        client.writes = lambda addr, values: requests.append(addr)
+        client.writes_masked = lambda addr, values, masks: \
+            requests.append(addr)
+        try:
+            pid, scope = self.r.pid0, self.r.scope
+            with self.r.transaction():
+                pid.i = 1.0
+                pid.setpoint = 0.1
+                pid.p = 0.5
+                scope._start_trace_acquisition()
+        finally:
+            del client.writes, client.writes_masked
+        base = pid._addr_base
+        # setpoint and p are adjacent registers written one after the other
+        assert requests[:2] == [base + 0x10C, base + 0x104], requests
+        # reset, trigger delay, arming and trigger source, in program order
+        base = scope._addr_base
+        assert requests[2:] == [base + 0x0, base + 0x10, base + 0x0,
+                                base + 0x4], requests
+
+    def test_register_cache(self):
+        cache = self.r.register_cache
+        enabled = cache.enabled
+        cache.enabled = True
+        try:
+            pid = self.r.pid0
+            pid.p = 0.5
+            assert abs(pid.p - 0.5) < 1e-3, pid.p
+            hits = cache.hits
+            assert abs(pid.p - 0.5) < 1e-3, pid.p
+            assert cache.hits > hits
+            # volatile registers always go to the FPGA
+            hits = cache.hits
+            pid.ival
+            self.r.scope.voltage_in1
+            self.r.scope._trigger_source_register
+            assert cache.hits == hits
+            cache.invalidate()
+            assert not cache.contains(pid._addr_base + 0x104)
+            assert abs(pid.p - 0.5) < 1e-3, pid.p
+        finally:
+            cache.enabled = enabled
+
+    def test_io_profile(self):
+        pid = self.r.pid0
+        with self.r.io_profiling() as profiler:
+            for i in range(3):
+                pid.p
+            pid.ival = 0
+            with pid.transaction():
+                pid.i = 1
+            pid._reads(0x104, 1)
+        assert not profiler.enabled
+        pid.p  # not recorded
+        table = self.r.io_profile(sort='count')
+        rows = dict(((name, access), row) for name, access, row in
+                    zip(table['name'], table['access'],
+                        table.to_dict('records')))
+        assert rows[('pid0.p', 'read')]['count'] == 3, table
+        assert rows[('pid0.p', 'read')]['bytes'] == 12, table
+        assert rows[('pid0.ival', 'write')]['count'] == 1, table
+        assert rows[('pid0.i', 'write')]['local'] == 1, table
+        assert rows[('transaction', 'write')]['count'] == 1, table
+        assert ('pid0.0x104', 'read') in rows, table
+        assert table['count'][0] == 3, table
+        row = rows[('pid0.p', 'read')]
+        assert sum(row[label] for label in table.columns[8:]) == 3, table
+
+    def test_writes_masked(self):
+        client = self.r.client
+        addr = self.r.asg0._addr_base  # control register of asg0
+        old = int(client.reads(addr, 1)[0])
+        try:
+            client.writes(addr, [0x00FF00FF])
+            client.writes_masked(addr, [0xAAAAAAAA], [0x0000FFFF])
+            value = int(client.reads(addr, 1)[0])
+            assert value == 0x00FFAAAA, hex(value)
+        finally:
+            client.writes(addr, [old])
+
+    def test_reads_int16(self):
+        client = self.r.client
+        addr = self.r.scope._addr_base + 0x10000  # scope buffer of ch1
+        data = client.reads_int16(addr, 1000)
+        assert data.dtype == np.int16, data.dtype
+        assert len(data) == 1000, len(data)
+        assert data.min() >= -2 ** 13 and data.max() < 2 ** 13, data
+
+
+    def test_bulk_transfer(self):
+        client = self.r.client
+        scope = self.r.scope
+        # longer than a single request, starting at the scope registers
+        data = client.reads_bulk(scope._addr_base, MAX_LENGTH + 1000)
+        assert len(data) == MAX_LENGTH + 1000, len(data)
+        assert data[0x14 // 4] == client.reads(scope._addr_base + 0x14, 1)[0]
+        asg = self.r.asg0
+        addr = asg._addr_base + asg._DATA_OFFSET
+        old = client.reads_bulk(addr, asg.data_length)
+        values = np.arange(asg.data_length, dtype=np.uint32) & 0x3FFF
+        try:
+            client.writes_bulk(addr, values)
+            readback = client.reads_bulk(addr, len(values))
+            assert (readback == values).all()
+        finally:
+            client.writes_bulk(addr, old)
+
+
+    def test_make_a_slave(self):
+        slave = self.r.make_a_slave()
+        try:
+            # the slave shares the monitor_server of the master
+            assert slave.parameters['port'] == self.r.parameters['port']
+            self.r.pid0.p = 0.25
+            assert abs(slave.pid0.p - 0.25) < 1e-3, slave.pid0.p
+            slave.pid0.p = 0.5
+            assert abs(self.r.pid0.p - 0.5) < 1e-3, self.r.pid0.p
+            # the slave has its own config tree
+            assert slave.c is not self.r.c
+            slave.pid0.setpoint = 0.125
+            assert self.r.c._get_or_create('pid0')._data.get('setpoint') \
+                != 0.125
+        finally:
+            slave.end()
+            self.r._slaves.remove(slave)
+        # the server is still available to the master
+        assert abs(self.r.pid0.p - 0.5) < 1e-3, self.r.pid0.p
+
+
+    def test_server_stats(self):
+        client = self.r.client
+        client.server_stats(reset=True)
+        for i in range(10):
+            self.r.pid0.ival
+        stats = client.server_stats()
+        if stats:  # the simulated client does not provide statistics
+            assert stats['r']['count'] >= 10, stats
+            assert 0 < stats['r']['min_time'] <= stats['r']['mean_time'] \
+                <= stats['r']['max_time'], stats
+
+
+    def test_reads_stats(self):
+        sampler = self.r.sampler
+        addrs = [sampler._addr_base + getattr(type(sampler), signal).address
+                 for signal in ['in1', 'in2']]
+        records = self.r.client.reads_stats(addrs, duration=1.0,
+                                            max_samples=10)
+        assert len(records) == 2, records
+        for record in records:
+            assert record['count'] == 10, record
+            assert record['min'] <= record['max'], record
+            assert record['count'] * record['min'] <= record['sum'] \
+                <= record['count'] * record['max'], record
+
+
+    def test_async_client(self):
+        pid = self.r.pid0
+        addr = type(pid).p.address
+
+        async def access():
+            await pid._writes_async(addr, [1234])
+            return await pid._reads_async(addr, 1)
+        assert wait(access())[0] == 1234
+        assert pid._reads(addr, 1)[0] == 1234
+        # requests of concurrent coroutines are interleaved
+        async def read_many():
+            return await gather(*[pid._reads_async(addr, 1)
+                                  for i in range(10)])
+        assert all(value[0] == 1234 for value in wait(read_many()))
+
+
+    def test_threaded_client(self):
+        threaded = ThreadedClient(self.r.client)
+        try:
+            addr = self.r.pid0._addr_base + type(self.r.pid0).p.address
+            threaded.writes(addr, [1234])
+            assert threaded.reads(addr, 1)[0] == 1234
+            # block the worker thread to accumulate requests
+            event = threading.Event()
+            threaded.submit(IO_PRIORITY_WRITE, event.wait, 1.0)
+            order = []
+            bulk = threaded.submit(IO_PRIORITY_BULK, order.append, 'bulk')
+            reads = [threaded.reads_future(addr, 1) for i in range(5)]
+            write = threaded.submit(IO_PRIORITY_WRITE, order.append, 'write')
+            event.set()
+            bulk.result(), write.result()
+            assert order == ['write', 'bulk'], order
+            # identical pending reads are coalesced into one request
+            assert threaded.coalesced_reads == 4, threaded.coalesced_reads
+            assert all(read.result()[0] == 1234 for read in reads)
+        finally:
+            threaded.stop()
+
+
+    def test_client_pool(self):
+        class Recorder(object):
+            """ records the requests made to client """
+            def __init__(self, client):
+                self.client, self.calls = client, []
+
+            def __getattr__(self, name):
+                attribute = getattr(self.client, name)
+                if callable(attribute):
+                    self.calls.append(name)
+                return attribute
+        control, bulk = Recorder(self.r.client), Recorder(self.r.client)
+        pool = ClientPool(control, [bulk])
+        pid, scope, asg = self.r.pid0, self.r.scope, self.r.asg0
+        addr = pid._addr_base + type(pid).p.address
+        pool.writes(addr, [1234])
+        assert pool.reads(addr, 1)[0] == 1234
+        assert bulk.calls == [], bulk.calls
+        # long transfers are split into chunks on the bulk channel
+        data = pool.reads_int16(scope._addr_base + 0x10000,
+                                BULK_CHUNK_LENGTH + 10)
+        assert data.dtype == np.int16 and len(data) == BULK_CHUNK_LENGTH + 10
+        assert bulk.calls == ['reads_int16'] * 2, bulk.calls
+        addr = asg._addr_base + asg._DATA_OFFSET
+        values = np.arange(asg.data_length, dtype=np.uint32) & 0x3FFF
+        old = self.r.client.reads(addr, asg.data_length)
+        try:
+            pool.writes(addr, values)
+            assert (pool.reads(addr, len(values)) == values).all()
+        finally:
+            self.r.client.writes(addr, old)
+        assert control.calls == ['writes', 'reads'], control.calls
+
+
+class LoopbackServer(object):
+    """ minimal monitor_server that answers read requests with zeros """
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(1)
+        self.port = self.socket.getsockname()[1]
+        self.zeros = bytes(bytearray(4 * MAX_LENGTH))
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        connection, address = self.socket.accept()
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            header = b''
+            while len(header) < 8:
+                chunk = connection.recv(8 - len(header))
+                if not chunk:
+                    return
+                header += chunk
+            length = bytearray(header)[2] + (bytearray(header)[3] << 8)
+            if header[:1] == b'r':
+                connection.sendall(header + self.zeros[:4 * length])
+            elif header[:1] == b'p':
+                connection.sendall(header + self.zeros[:2 * length])
+            else:
+                break
+        connection.close()
+        self.socket.close()
+
+
+class DroppingServer(object):
+    """ server that closes each connection after its first request """
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+        self.socket.settimeout(0.1)
+        self.port = self.socket.getsockname()[1]
+        self.commands = []  # first byte of each received request
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while self.running:
+            try:
+                connection, address = self.socket.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(1.0)
+            self.commands.append(connection.recv(8)[:1])
+            connection.close()
+        self.socket.close()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class TestClientBenchmark(object):
+    """ measures the read throughput of MonitorClient over the loopback
+    interface, i.e. the overhead of the client itself """
+    cycles = 200
+
+    def setup(self):
+        self.server = LoopbackServer()
+        self.client = MonitorClient(hostname='127.0.0.1',
+                                    port=self.server.port)
+
+    def teardown(self):
+        self.client.close()
+
+    def test_reads(self):
+        out = np.empty(MAX_LENGTH, dtype=np.uint32)
+        data = self.client.reads(0x40100000, MAX_LENGTH, out=out)
+        assert np.shares_memory(data, out)
+        assert (data == 0).all()
+        for kwargs in [dict(), dict(out=out)]:
+            starttime = time.time()
+            for i in range(self.cycles):
+                self.client.reads(0x40100000, MAX_LENGTH, **kwargs)
+            duration = time.time() - starttime
+            rate = self.cycles * 4.0 * MAX_LENGTH / duration / 1e6
+            print("Read throughput %s: %.1f MB/s"
+                  % ("into out" if kwargs else "new array", rate))
+            # at least 10 times the bandwidth of a 100 Mbit link
+            assert rate > 125.0, rate
+
+    def test_reads_int16(self):
+        out = np.ones(2 ** 14, dtype=np.int16)
+        data = self.client.reads_int16(0x40110000, 2 ** 14, out=out)
+        assert np.shares_memory(data, out)
+        assert (out == 0).all()
+
+
+class TestLocalMmapClient(object):
+    """ tests LocalMmapClient with a sparse file in place of /dev/mem """
+    def setup(self):
+        # memory mappings of the FPGA only exist on the (linux) board
+        self.supported = hasattr(mmap, 'MAP_SHARED')
+        if not self.supported:
+            return
+        self.file = tempfile.NamedTemporaryFile()
+        self.file.truncate(FPGA_BASE + FPGA_SIZE)
+        self.client = LocalMmapClient(self.file.name)
+
+    def teardown(self):
+        if self.supported:
+            self.client.close()
+            self.file.close()
+
+    def test_reads_writes(self):
+        if not self.supported:
+            return
+        addr = 0x40300104
+        assert self.client.writes(addr, [1, 2, 3])
+        assert (self.client.reads(addr, 3) == [1, 2, 3]).all()
+        out = np.zeros(3, dtype=np.uint32)
+        assert np.shares_memory(self.client.reads(addr, 3, out=out), out)
+        assert (out == [1, 2, 3]).all()
+        self.client.writes_masked(addr, [0xAAAAAAAA], [0x0000FFFF])
+        assert self.client.reads(addr, 1)[0] == 0xAAAA
+        # the view directly represents the registers
+        view = self.client.view(addr, 3)
+        view[1] = 1234
+        assert self.client.reads(addr + 4, 1)[0] == 1234
+        del view
+
+    def test_reads_int16_and_stats(self):
+        if not self.supported:
+            return
+        addr = 0x40110000
+        self.client.writes(addr, [0x1FFF, 0x2000, 0x3FFF, 5])
+        data = self.client.reads_int16(addr, 4)
+        assert data.dtype == np.int16
+        assert list(data) == [2 ** 13 - 1, -2 ** 13, -1, 5], data
+        records = self.client.reads_stats([addr + 8, addr + 12],
+                                          duration=1.0, max_samples=10)
+        assert list(records['count']) == [10, 10], records
+        assert list(records['sum']) == [-10, 50], records
+        assert list(records['min']) == [-1, 5], records
+
+    def test_word_accesses(self):
+        if not self.supported:
+            return
+        addr, n = 0x40200000, 1000
+        values = np.arange(n, dtype=np.uint32) * 0x10001
+        self.client.writes(addr, values)
+        data = self.client.reads(addr, n)
+        assert (data == values).all()
+        # the result is a copy, not a view of the registers
+        self.client.writes(addr, [0])
+        assert data[0] == values[0] and data[1] == values[1]
+        self.client.writes_masked(addr + 4, [0xFFFFFFFF] * 2, [0xF0, 0xF])
+        assert list(self.client.reads(addr + 4, 2)) == \
+            [values[1] | 0xF0, values[2] | 0xF]
+
+    def test_invalid_address(self):
+        if not self.supported:
+            return
+        try:
+            self.client.reads(FPGA_BASE + FPGA_SIZE - 4, 2)
+        except ValueError:
+            pass
+        else:
+            assert False, "reads beyond the FPGA address space must fail"
+
+
+class TestDummyClient(object):
+    """ tests the vectorized register model of DummyClient """
+    def setup(self):
+        self.client = DummyClient()
+
+    def test_reads_writes(self):
+        addr = 0x40300104
+        self.client.writes(addr, [1, 2, -1])
+        assert list(self.client.reads(addr, 3)) == [1, 2, 2 ** 32 - 1]
+        self.client.writes_masked(addr, [0xAAAAAAAA], [0x0000FFFF])
+        assert self.client.reads(addr, 1)[0] == 0xAAAA
+        # all instances share the same registers
+        assert DummyClient().reads(addr + 4, 1)[0] == 2
+
+    def test_constant_registers(self):
+        # writes do not change constant registers, also within long reads
+        addr = 0x40300220  # pid0 filterstages
+        self.client.writes(addr, [0, 0])
+        assert list(self.client.reads(addr, 2)) == [4, 2]
+        assert self.client.reads(addr - 0x100, 0x200)[0x40] == 4
+
+    def test_scope_data(self):
+        start = time.time()
+        data = self.client.reads_int16(0x40110000, 2 ** 14)
+        assert time.time() - start < 0.1
+        assert data.std() > 100 and abs(data).max() < 2 ** 13
+        records = self.client.reads_stats([0x40110000, 0x40300220],
+                                          max_samples=100)
+        assert list(records['count']) == [100, 100], records
+        assert records['min'][0] < 0 < records['max'][0], records
+        assert records['sum'][1] == 400, records
+
+
+class TestEmulator(object):
+    """ tests the emulated monitor_server without hardware """
+    def setup(self):
+        self.server = EmulatorServer()
+        self.client = MonitorClient(hostname='127.0.0.1',
+                                    port=self.server.start())
+
+    def teardown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_reads_writes(self):
+        addr = 0x40300104
+        self.client.writes(addr, [1, 2, 3])
+        assert list(self.client.reads(addr, 3)) == [1, 2, 3]
+        self.client.writes_masked(addr, [0xAAAAAAAA], [0x0000FFFF])
+        assert self.client.reads(addr, 1)[0] == 0xAAAA
+        assert len(self.client.reads_bulk(SCOPE_BASE + 0x10000,
+                                          MAX_LENGTH + 1)) == MAX_LENGTH + 1
+        stats = self.client.server_stats()
+        assert stats['w']['count'] == 1, stats
+
+    def test_reads_stats_empty(self):
+        records = self.client.reads_stats([])
+        assert len(records) == 0, records
+        assert records.dtype.names == ('count', 'sum', 'sumsq', 'min',
+                                       'max'), records.dtype
+
+    def test_failed_request_stats(self):
+        self.client.server_stats(reset=True)
+        for request in [b'r\x00\x01\x00' + bytes(4),  # invalid address
+                        b'c\x00\x01\x00' + bytes(4)]:  # close
+            sock = socket.create_connection(('127.0.0.1', self.client._port))
+            try:
+                sock.sendall(request)
+                assert sock.recv(8) == b''
+            finally:
+                sock.close()
+        # only served requests are recorded
+        stats = self.client.server_stats()
+        assert 'r' not in stats and 'c' not in stats, stats
+
+    def test_long_reads_int16(self):
+        addr, n = 0x40600000, MAX_LENGTH + 10
+        values = np.arange(n, dtype=np.uint32) & 0x3FFF
+        self.client.writes(addr, values)
+        expected = ((values ^ 0x2000).astype(np.int32) - 0x2000)
+        assert (self.client.reads_int16(addr, n) == expected).all()
+        client = AsyncMonitorClient('127.0.0.1', self.client._port)
+        try:
+            assert (wait(client.reads_int16(addr, n)) == expected).all()
+        finally:
+            client.close()
+
+    def test_writes_masked_chunks(self):
+        addr, n = 0x40600000, MAX_RANGES + 3
+        self.client.writes(addr, np.zeros(n, dtype=np.uint32))
+        assert self.client.writes_masked(addr, np.arange(n) + 0xF00,
+                                         np.full(n, 0xFF))
+        assert list(self.client.reads(addr, n)) == \
+            list((np.arange(n) + 0xF00) & 0xFF)
+        assert self.client.server_stats()['m']['count'] == 2
+
+    def test_gather_read_overflow(self):
+        # ranges longer than MAX_LENGTH in total are rejected, also if the
+        # 32-bit sum of their lengths wraps around
+        for length in [MAX_LENGTH, 0xFFFFFFFF]:
+            sock = socket.create_connection(('127.0.0.1', self.server.port))
+            sock.settimeout(1.0)
+            try:
+                sock.sendall(b'g\x00\x02\x00' + bytes(4) + np.array(
+                    [0x40300104, 1, SCOPE_BASE + 0x10000, length],
+                    dtype='<u4').tobytes())
+                assert sock.recv(8) == b''
+            finally:
+                sock.close()
+        # other connections are served
+        assert self.client.reads(0x40300104, 1) is not None
+
+    def test_drain(self):
+        self.client.pipelined = True
+        for i in range(100):
+            self.client.writes(0x40300104, [i])
+        assert wait(self.client.drain())
+        assert not self.client._pending_writes
+        assert self.client.reads(0x40300104, 1)[0] == 99
+
+    def test_reads_many_failure(self):
+        # like reads, a batch without answer returns None
+        server = DroppingServer()
+        client = MonitorClient('127.0.0.1', server.port)
+        try:
+            assert client.reads_many([(0x40300104, 1),
+                                      (0x40300108, 2)]) is None
+        finally:
+            client.close()
+            server.stop()
+
+    def test_async_retries(self):
+        # only reads are repeated after a connection failure
+        server = DroppingServer()
+        client = AsyncMonitorClient('127.0.0.1', server.port, timeout=0.2)
+        try:
+            assert wait(client.writes(0x40300104, [1])) is None
+            assert wait(client.writes_masked(0x40300104, [1], [1])) is None
+            assert wait(client.reads(0x40300104, 1)) is None
+        finally:
+            client.close()
+            server.stop()
+        assert server.commands == [b'w', b'm'] + [b'r'] * 5, \
+            server.commands
+
+    def test_hello(self):
+        info = self.client.hello()
+        assert info['version'] == SERVER_VERSION, info
+        assert info['max_length'] == MAX_LENGTH, info
+        # the connection stays in sync
+        self.client.writes(0x40300104, [5])
+        assert self.client.reads(0x40300104, 1)[0] == 5
+
+    def test_scope(self):
+        self.client.writes(SCOPE_BASE + 0x10, [100])  # trigger delay
+        self.client.writes(SCOPE_BASE, [1])  # arm the trigger
+        assert self.client.reads(SCOPE_BASE, 1)[0] & 1
+        self.client.writes(SCOPE_BASE + 4, [1])  # trigger immediately
+        time.sleep(0.01)
+        assert self.client.reads(SCOPE_BASE, 1)[0] & 5 == 0
+        data = self.client.reads_int16(SCOPE_BASE + 0x10000, 4000)
+        assert data.max() > 1000 and data.min() < -1000
+
+    def test_stats(self):
+        records = self.client.reads_stats([0x40300010, 0x40300104],
+                                          duration=1e-3, max_samples=100)
+        assert list(records['count']) == [100, 100], records
+        # registers without emulated behavior are constant
+        assert records['min'][1] == records['max'][1], records
+
+    def test_latency(self):
+        self.server.latency = 0.01
+        start = time.time()
+        self.client.reads(0x40300104, 1)
+        assert time.time() - start >= 0.01
+
+
+class TestRecordReplay(object):
+    """ tests recording register accesses and replaying them """
+    def setup(self):
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+        self.file.close()
+
+    def teardown(self):
+        os.remove(self.file.name)
+
+    def session(self, client):
+        client.writes(0x40300104, [1, 2])
+        client.writes_masked(0x40300104, [3], [1])
+        return [client.reads(0x40300104, 2),
+                client.reads_int16(0x40110000, 100),
+                client.reads_many([(0x40300104, 1), (0x40310104, 3)]),
+                client.reads_stats([0x40110000], max_samples=10)]
+
+    def test_replay(self):
+        client = RecordingClient(DummyClient(), self.file.name)
+        recorded = self.session(client)
+        client.close()
+        records = read_recording(self.file.name)
+        assert [header['op'] for header, payload in records] == \
+            [b'w', b'm', b'r', b'p', b'g', b's'], records
+        client = ReplayClient(self.file.name)
+        replayed = self.session(client)
+        assert repr(replayed) == repr(recorded), (replayed, recorded)
+        stats = client.replay_stats()
+        assert stats['replayed'] == stats['recorded'] == 6, stats
+        assert stats['unmatched'] == stats['differing'] == 0, stats
+
+    def test_divergence(self):
+        client = RecordingClient(DummyClient(), self.file.name)
+        self.session(client)
+        client.close()
+        client = ReplayClient(self.file.name)
+        client.writes(0x40300104, [5, 6])  # differs from the recording
+        assert list(client.reads(0x40300200, 2)) == [0, 0]  # not recorded
+        client.reads(0x40300104, 2)  # skips the masked write
+        stats = client.replay_stats()
+        assert stats['differing'] == 1, stats
+        assert stats['unmatched'] == 1, stats
+        assert stats['skipped'] == 1, stats
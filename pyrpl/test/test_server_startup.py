@@ -0,0 +1,146 @@
+# tests of the startup of the server application on the board, with the
+# commands of the ssh shell executed on this computer
+import logging
+logger = logging.getLogger(name=__name__)
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from .. import RedPitaya
+from ..redpitaya_client import MonitorClient
+
+
+class LocalShell(object):
+    """ executes the commands of a RedPitaya ssh shell on this computer """
+    def __init__(self):
+        self.processes = []
+
+    def ask(self, question=""):
+        return subprocess.run(question, shell=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              universal_newlines=True).stdout
+
+    def ask_sync(self, question="", timeout=None):
+        return self.ask(question)
+
+    def launch(self, command):
+        process = subprocess.Popen(command, shell=True)
+        self.processes.append(process)
+        return lambda: process.poll() is not None
+
+    def write(self, text):
+        if text == '\x03':  # Ctrl-C
+            for process in self.processes:
+                process.terminate()
+                process.wait()
+            self.processes = []
+
+    @property
+    def scp(self):
+        raise AssertionError("unexpected upload of a file")
+
+
+# answers the hello command like monitor_server on the port given as argument
+HELLO_SERVER = """
+import socket, struct, sys
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind(('127.0.0.1', int(sys.argv[1])))
+server.listen(1)
+connection = server.accept()[0]
+header = connection.recv(8)
+connection.sendall(header + struct.pack('<4I', 2, 65535, 16, 1))
+connection.recv(8)
+"""
+
+# serves a single client like the servers before version 2: reads return
+# zeros, requests of length 0 (such as hello) are ignored, and the server
+# terminates at any other command or when the client disconnects
+LEGACY_SERVER = """
+import socket, struct, sys
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind(('127.0.0.1', int(sys.argv[1])))
+server.listen(5)
+connection = server.accept()[0]
+while True:
+    header = connection.recv(8, socket.MSG_WAITALL)
+    if len(header) != 8:
+        sys.exit(1)
+    length = header[2] + (header[3] << 8)
+    if length == 0:
+        continue
+    if header[:1] == b'r':
+        connection.sendall(header + bytes(4 * length))
+    elif header[:1] == b'w':
+        connection.recv(4 * length, socket.MSG_WAITALL)
+        connection.sendall(header)
+    else:
+        sys.exit(1)
+"""
+
+
+class TestServerStartup(object):
+    """ tests the readiness polling of the server at startup """
+    def setup(self):
+        self.r = RedPitaya(hostname='_FAKE_', config=None)
+        self.r.ssh = LocalShell()
+        self.dir = tempfile.mkdtemp()
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        # the parameters of all RedPitaya objects are shared by default
+        self.r.parameters = dict(self.r.parameters, hostname='127.0.0.1',
+                                 port=port, serverdirname=self.dir,
+                                 monitor_server_name='monitor_server')
+
+    def teardown(self):
+        self.r.endserver()
+        shutil.rmtree(self.dir)
+
+    def install(self, script):
+        filename = os.path.join(self.dir, 'monitor_server')
+        with open(filename, 'w') as f:
+            f.write("#!/bin/sh\n" + script + "\n")
+        os.chmod(filename, 0o755)
+
+    def install_python(self, code):
+        with open(os.path.join(self.dir, 'server.py'), 'w') as f:
+            f.write(code)
+        self.install('exec "%s" "%s" "$1"' % (
+            sys.executable, os.path.join(self.dir, 'server.py')))
+
+    def test_launch(self):
+        self.install_python(HELLO_SERVER)
+        assert self.r._launchserver()
+        assert self.r.server_info['version'] == 2, self.r.server_info
+
+    def test_wrong_binary(self):
+        self.install('exit 1')
+        start = time.time()
+        assert not self.r._launchserver()
+        # the termination is detected before server_timeout
+        assert time.time() - start < self.r.parameters['server_timeout']
+
+    def test_legacy_server(self):
+        self.install_python(LEGACY_SERVER)
+        assert self.r._launchserver()
+        assert self.r.server_version == 1, self.r.server_info
+        # the only connection served by the server is left to the client
+        assert self.r._server_probe is None
+        port = self.r.parameters['port']
+
+        def restartserver():
+            time.sleep(0.1)  # the server may not listen yet
+            return port
+        client = MonitorClient('127.0.0.1', port, restartserver=restartserver,
+                               server_version=self.r.server_version)
+        try:
+            assert (client.reads(0x40000000, 3) == 0).all()
+            assert client.writes(0x40000000, [1, 2])
+        finally:
+            client.close()
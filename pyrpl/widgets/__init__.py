@@ -0,0 +1,52 @@
+"""
+This package defines the graphical user interface of pyrpl.
+
+The modules and attributes of pyrpl refer to their widget classes through
+widget_class(), which imports the widget modules only when a widget is
+created if pyrpl runs in headless mode (see pyrpl.headless).
+"""
+import importlib
+from .. import headless
+
+
+class LazyWidgetClass(object):
+    """
+    placeholder for a widget class in headless mode that imports the class
+    (and creates a QApplication if needed) when the first widget is created.
+    """
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def resolve(self):
+        """ returns the widget class """
+        return getattr(importlib.import_module(self.module), self.name)
+
+    def __call__(self, *args, **kwargs):
+        # widgets cannot be created without a QApplication
+        from qtpy import QtWidgets
+        if QtWidgets.QApplication.instance() is None:
+            import pyrpl
+            pyrpl.APP = QtWidgets.QApplication(['pyrpl'])
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return "LazyWidgetClass(%s.%s)" % (self.module, self.name)
+
+
+def widget_class(module, name):
+    """
+    returns the class called name of the module pyrpl.widgets.<module>, or a
+    LazyWidgetClass placeholder for it in headless mode
+    """
+    module = __name__ + '.' + module
+    if headless:
+        return LazyWidgetClass(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def resolve_widget_class(cls):
+    """ returns the widget class for a class returned by widget_class """
+    if isinstance(cls, LazyWidgetClass):
+        return cls.resolve()
+    return cls
@@ -9,6 +9,7 @@ import numpy as np
 from qtpy import QtCore, QtWidgets
 import pyqtgraph as pg
 from .spinbox import NumberSpinBox, IntSpinBox, FloatSpinBox, ComplexSpinBox
+from . import resolve_widget_class
 from .. import pyrpl_utils
 from ..curvedb import CurveDB
 
@@ -341,7 +342,9 @@ class BasePropertyListPropertyWidget(BaseAttributeWidget):
     def element_widget_cls(self):
         return type("ElementWidget",
                     (ListElementWidget,
-                     self.attribute_descriptor.element_cls._widget_class, ),
+                     resolve_widget_class(
+                         self.attribute_descriptor.element_cls._widget_class),
+                     ),
                     {})
 
     def update_attribute_by_name(self, new_value_list):